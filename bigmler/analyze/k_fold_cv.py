@@ -41,6 +41,8 @@ from bigml.fields import Fields
 from bigmler.dispatcher import main_dispatcher
 from bigmler.options.analyze import ACCURACY, MINIMIZE_OPTIONS
 from bigmler.resources import ALL_FIELDS_QS
+from bigmler.sessions_db import safe_call
+from bigmler.log_writer import flush_logs
 
 AVG_PREFIX = "average_%s"
 R_SQUARED = "r_squared"
@@ -115,10 +117,21 @@ def retrieve_subcommands():
 
     """
     global subcommand_list
-    subcommand_list = open(subcommand_file, u.open_mode("r")).readlines()
-    if not u.PYTHON3:
-        subcommand_list = [subcommand.decode(u.SYSTEM_ENCODING)
-                           for subcommand in subcommand_list]
+    flush_logs()
+    # the store misses the lines written by previous versions and the file
+    # can miss the ones that failed to be written: the most complete is used
+    stored_lines = safe_call("lines", subcommand_file) or []
+    try:
+        subcommand_list = open(subcommand_file, u.open_mode("r")).readlines()
+        if not u.PYTHON3:
+            subcommand_list = [subcommand.decode(u.SYSTEM_ENCODING)
+                               for subcommand in subcommand_list]
+    except IOError:
+        if not stored_lines:
+            raise
+        subcommand_list = []
+    if len(stored_lines) > len(subcommand_list):
+        subcommand_list = [u"%s\n" % line for line in stored_lines]
     subcommand_list.reverse()
 
 
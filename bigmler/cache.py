@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Persistent local cache for BigMLer
+
+   Entries are stored as JSON files in a cache directory, so that they can
+   be shared by different runs of BigMLer. Each entry keeps its creation
+   time, used to expire it after `ttl` seconds, and the file modification
+   time is updated on every read, so that the least recently used entries
+   are the first to be evicted when the cache grows over `max_size`
+   entries.
+
+   The `ResourceCache` uses a `DiskCache` to keep the finished resources
+   retrieved from the API, indexed by account, domain and resource id.
+   Any resource can be updated (names, tags, sharing...), so cached
+   resources are revalidated by comparing their `updated` date with the one
+   in a brief version of the resource before being served.
+
+"""
+from __future__ import absolute_import
+
+import os
+import time
+import hashlib
+import threading
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import bigml.api
+
+from bigml.bigmlconnection import HTTP_OK
+from bigml.util import maybe_save
+
+
+DEFAULT_TTL = 86400
+DEFAULT_MAX_SIZE = 10000
+CACHE_EXTENSION = ".json"
+# fraction of max_size kept when the cache overflows
+EVICTION_RATE = 0.9
+DEFAULT_RESOURCE_CACHE_SIZE = 1000
+REVALIDATION_QS = "full=false"
+
+
+def account_key(api):
+    """Username and API url (domain and mode) of the api instance, that
+       identify the account the resources belong to
+
+    """
+    username = api.auth.split(";")[0].partition("username=")[2]
+    return [username, api.url]
+
+
+def cache_key(*components):
+    """Builds a stable key from the canonical JSON form of the components
+
+    """
+    canonical = json.dumps(components, sort_keys=True,
+                           separators=(',', ':'))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class DiskCache(object):
+    """Directory based cache with time to live and size bounded eviction
+
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        """Opens (or creates) the cache stored in `directory`
+
+           `ttl` is the number of seconds an entry is considered valid
+           (None or 0 for no expiration) and `max_size` the maximum number
+           of entries to be kept (None or 0 for no limit).
+
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # concurrently created by another process
+                if not os.path.isdir(directory):
+                    raise
+        self.size = len(self.entries())
+
+    def entries(self):
+        """Lists the paths to the cached entries
+
+        """
+        return [os.path.join(self.directory, file_name) for file_name in
+                os.listdir(self.directory)
+                if file_name.endswith(CACHE_EXTENSION)]
+
+    def entry_path(self, key):
+        """Path to the file that stores the entry for `key`
+
+        """
+        return os.path.join(self.directory, "%s%s" % (key, CACHE_EXTENSION))
+
+    def expired(self, entry):
+        """Checks whether the entry is older than the cache time to live
+
+        """
+        return self.ttl and time.time() - entry.get("created", 0) > self.ttl
+
+    def remove(self, path):
+        """Removes the file that stores an entry
+
+        """
+        try:
+            os.remove(path)
+            with self.lock:
+                self.size = max(self.size - 1, 0)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Returns the value cached for `key` or None if missing or expired
+
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, ValueError):
+            return None
+        if self.expired(entry):
+            self.remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def set(self, key, value):
+        """Stores `value` for `key`, evicting old entries when needed
+
+        """
+        path = self.entry_path(key)
+        new_entry = not os.path.exists(path)
+        temp_path = "%s.%s.%s.tmp" % (path, os.getpid(),
+                                      threading.current_thread().ident)
+        try:
+            with open(temp_path, "w") as entry_file:
+                json.dump({"created": time.time(), "value": value},
+                          entry_file)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            # the cache is only an optimization, failing to store is harmless
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        if new_entry:
+            with self.lock:
+                self.size += 1
+                overflow = self.max_size and self.size > self.max_size
+            if overflow:
+                self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries till the cache is under
+           its size limit. Expired entries are removed lazily when read.
+
+        """
+        timed_entries = []
+        for path in self.entries():
+            try:
+                timed_entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        timed_entries.sort()
+        with self.lock:
+            self.size = len(timed_entries)
+        excess = len(timed_entries) - int(self.max_size * EVICTION_RATE)
+        for _, path in timed_entries[0: max(excess, 0)]:
+            self.remove(path)
+
+
+class ResourceCache(object):
+    """Persistent cache for the finished resources retrieved from the API
+
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_RESOURCE_CACHE_SIZE):
+        """Entries are kept in `directory` with no expiration, and the
+           least recently used are evicted over `max_size` resources.
+
+        """
+        self.store = DiskCache(directory, ttl=None, max_size=max_size)
+
+    def install(self, api):
+        """Wraps the GET, update and delete calls of an api instance so that
+           they use the cache
+
+        """
+        get, update, delete = api._get, api._update, api._delete
+
+        def cached_get(url, query_string='', shared_username=None,
+                       shared_api_key=None):
+            """GET using the cache for non-shared resources"""
+            if shared_username is not None or not url.startswith(api.url):
+                return get(url, query_string=query_string,
+                           shared_username=shared_username,
+                           shared_api_key=shared_api_key)
+            return self.get(api, get, url, query_string)
+
+        def invalidating_update(url, body):
+            """Update that removes the resource from the cache"""
+            result = update(url, body)
+            self.invalidate(api, url)
+            return result
+
+        def invalidating_delete(url):
+            """Delete that removes the resource from the cache"""
+            result = delete(url)
+            self.invalidate(api, url)
+            return result
+
+        api._get = cached_get
+        api._update = invalidating_update
+        api._delete = invalidating_delete
+        return api
+
+    def invalidate(self, api, url):
+        """Removes the cached versions of the resource in `url`
+
+        """
+        resource_id = url[len(api.url):]
+        self.store.remove(self.store.entry_path(
+            cache_key(account_key(api), resource_id)))
+
+    def get(self, api, get, url, query_string):
+        """Returns the cached resource if still valid or calls the `get`
+           function and caches the retrieved resource if finished. The brief
+           status queries are not cached: revalidating them would cost as
+           much as retrieving them.
+
+        """
+        if query_string == REVALIDATION_QS:
+            return get(url, query_string=query_string)
+        resource_id = url[len(api.url):]
+        key = cache_key(account_key(api), resource_id)
+        # every query string used to retrieve the resource has its entry
+        cached = (self.store.get(key) or {}).get(query_string)
+        if cached is not None:
+            brief = get(url, query_string=REVALIDATION_QS)
+            if (brief['code'] == HTTP_OK and
+                    brief['object'].get('updated') ==
+                    cached['object'].get('updated')):
+                return self.serve(api, cached)
+        resource = get(url, query_string=query_string)
+        if (resource['code'] == HTTP_OK and
+                resource['object'].get('status', {}).get('code') ==
+                bigml.api.FINISHED):
+            versions = self.store.get(key) or {}
+            versions[query_string] = resource
+            self.store.set(key, versions)
+        return resource
+
+    def serve(self, api, resource):
+        """Returns a cached resource, storing it in the api storage
+           directory if set
+
+        """
+        return maybe_save(resource['resource'], api.storage, resource['code'],
+                          resource['location'], resource['object'],
+                          resource['error'])
@@ -26,42 +26,76 @@ import bigml.api
 from bigml.util import console_log
 
 from bigmler.utils import log_message
+from bigmler.journal import get_journal
+from bigmler.line_index import count_lines
+from bigmler.log_writer import flush_logs
 
 
-def is_source_created(path, suffix=""):
-    """Checks existence and reads the source id from the source file in the
-       path directory
+def logged_resources(path, file_name):
+    """Returns the ids logged in a checkpoint file of the path directory,
+       from the journal index when it has a record of the file, even if the
+       file has not been written yet. Returns None if neither the journal
+       nor the file have them.
 
     """
-    source_id = None
+    flush_logs()
+    journal = get_journal(path)
+    resource_ids = None if journal is None else journal.resources(file_name)
+    if resource_ids is not None:
+        return resource_ids
+    # files written before the journal existed
+    checkpoint_file = "%s%s%s" % (path, os.sep, file_name)
     try:
-        with open("%s%ssource%s" % (path, os.sep, suffix)) as source_file:
-            source_id = source_file.readline().strip()
-            try:
-                source_id = bigml.api.get_source_id(source_id)
-                return True, source_id
-            except ValueError:
-                return False, None
+        with open(checkpoint_file) as resources_file:
+            return [line.strip() for line in resources_file]
     except IOError:
+        return None
+
+
+def is_resource_created(path, file_name, get_id):
+    """Checks existence and reads the resource id from the checkpoint file
+       in the path directory
+
+    """
+    resource_ids = logged_resources(path, file_name)
+    if not resource_ids:
+        return False, None
+    try:
+        return True, get_id(resource_ids[0])
+    except ValueError:
         return False, None
 
 
+def are_resources_created(path, file_name, number_of_resources, get_id):
+    """Checks existence and reads the resource ids from the checkpoint file
+       in the path directory
+
+    """
+    resource_ids = []
+    for resource in logged_resources(path, file_name) or []:
+        try:
+            resource_ids.append(get_id(resource))
+        except ValueError:
+            return False, resource_ids
+    return len(resource_ids) == number_of_resources, resource_ids
+
+
+def is_source_created(path, suffix=""):
+    """Checks existence and reads the source id from the source file in the
+       path directory
+
+    """
+    return is_resource_created(path, "source%s" % suffix,
+                               bigml.api.get_source_id)
+
+
 def is_dataset_created(path, suffix=""):
     """Checks existence and reads the dataset id from the dataset file in
        the path directory
 
     """
-    dataset_id = None
-    try:
-        with open("%s%sdataset%s" % (path, os.sep, suffix)) as dataset_file:
-            dataset_id = dataset_file.readline().strip()
-            try:
-                dataset_id = bigml.api.get_dataset_id(dataset_id)
-                return True, dataset_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "dataset%s" % suffix,
+                               bigml.api.get_dataset_id)
 
 
 def are_datasets_created(path, number_of_datasets, suffix='parts'):
@@ -69,22 +103,8 @@ def are_datasets_created(path, number_of_datasets, suffix='parts'):
        the path directory
 
     """
-    dataset_ids = []
-    try:
-        with open("%s%sdataset_%s" % (path, os.sep, suffix)) as datasets_file:
-            for line in datasets_file:
-                dataset = line.strip()
-                try:
-                    dataset_id = bigml.api.get_dataset_id(dataset)
-                    dataset_ids.append(dataset_id)
-                except ValueError:
-                    return False, dataset_ids
-        if len(dataset_ids) == number_of_datasets:
-            return True, dataset_ids
-        else:
-            return False, dataset_ids
-    except IOError:
-        return False, dataset_ids
+    return are_resources_created(path, "dataset_%s" % suffix,
+                                 number_of_datasets, bigml.api.get_dataset_id)
 
 
 def are_models_created(path, number_of_models):
@@ -92,22 +112,8 @@ def are_models_created(path, number_of_models):
        path directory
 
     """
-    model_ids = []
-    try:
-        with open("%s%smodels" % (path, os.sep)) as models_file:
-            for line in models_file:
-                model = line.strip()
-                try:
-                    model_id = bigml.api.get_model_id(model)
-                    model_ids.append(model_id)
-                except ValueError:
-                    return False, model_ids
-        if len(model_ids) == number_of_models:
-            return True, model_ids
-        else:
-            return False, model_ids
-    except IOError:
-        return False, model_ids
+    return are_resources_created(path, "models", number_of_models,
+                                 bigml.api.get_model_id)
 
 
 def are_predictions_created(predictions_file, number_of_tests):
@@ -117,7 +123,8 @@ def are_predictions_created(predictions_file, number_of_tests):
     """
     predictions = file_number_of_lines(predictions_file)
     if predictions != number_of_tests:
-        os.remove(predictions_file)
+        if os.path.exists(predictions_file):
+            os.remove(predictions_file)
         return False, None
     return True, None
 
@@ -127,17 +134,8 @@ def is_evaluation_created(path):
        in the path directory
 
     """
-    evaluation_id = None
-    try:
-        with open("%s%sevaluation" % (path, os.sep)) as evaluation_file:
-            evaluation_id = evaluation_file.readline().strip()
-            try:
-                evaluation_id = bigml.api.get_evaluation_id(evaluation_id)
-                return True, evaluation_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "evaluation",
+                               bigml.api.get_evaluation_id)
 
 
 def are_evaluations_created(path, number_of_evaluations):
@@ -145,22 +143,8 @@ def are_evaluations_created(path, number_of_evaluations):
        in the path directory and checks the corresponding evaluations
 
     """
-    evaluation_ids = []
-    try:
-        with open("%s%sevaluations" % (path, os.sep)) as evaluations_file:
-            for line in evaluations_file:
-                evaluation = line.strip()
-                try:
-                    evaluation_id = bigml.api.get_evaluation_id(evaluation)
-                    evaluation_ids.append(evaluation_id)
-                except ValueError:
-                    return False, evaluation_ids
-        if len(evaluation_ids) == number_of_evaluations:
-            return True, evaluation_ids
-        else:
-            return False, evaluation_ids
-    except IOError:
-        return False, evaluation_ids
+    return are_resources_created(path, "evaluations", number_of_evaluations,
+                                 bigml.api.get_evaluation_id)
 
 
 def are_ensembles_created(path, number_of_ensembles):
@@ -168,22 +152,8 @@ def are_ensembles_created(path, number_of_ensembles):
        path directory
 
     """
-    ensemble_ids = []
-    try:
-        with open("%s%sensembles" % (path, os.sep)) as ensembles_file:
-            for line in ensembles_file:
-                ensemble = line.strip()
-                try:
-                    ensemble_id = bigml.api.get_ensemble_id(ensemble)
-                    ensemble_ids.append(ensemble_id)
-                except ValueError:
-                    return False, ensemble_ids
-        if len(ensemble_ids) == number_of_ensembles:
-            return True, ensemble_ids
-        else:
-            return False, ensemble_ids
-    except IOError:
-        return False, ensemble_ids
+    return are_resources_created(path, "ensembles", number_of_ensembles,
+                                 bigml.api.get_ensemble_id)
 
 
 def checkpoint(function, *args, **kwargs):
@@ -215,12 +185,8 @@ def file_number_of_lines(file_name):
 
     """
     try:
-        item = (0, None)
-        with open(file_name) as file_handler:
-            for item in enumerate(file_handler):
-                pass
-        return item[0] + 1
-    except IOError:
+        return count_lines(file_name)
+    except (IOError, OSError):
         return 0
 
 
@@ -229,19 +195,8 @@ def is_batch_prediction_created(path):
        batch_prediction file in the path directory
 
     """
-    batch_prediction_id = None
-    try:
-        with open("%s%sbatch_prediction"
-                  % (path, os.sep)) as batch_prediction_file:
-            batch_prediction_id = batch_prediction_file.readline().strip()
-            try:
-                batch_prediction_id = bigml.api.get_batch_prediction_id(
-                    batch_prediction_id)
-                return True, batch_prediction_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "batch_prediction",
+                               bigml.api.get_batch_prediction_id)
 
 
 def is_batch_centroid_created(path):
@@ -249,19 +204,8 @@ def is_batch_centroid_created(path):
        batch_centroid file in the path directory
 
     """
-    batch_centroid_id = None
-    try:
-        with open("%s%sbatch_centroid"
-                  % (path, os.sep)) as batch_prediction_file:
-            batch_centroid_id = batch_prediction_file.readline().strip()
-            try:
-                batch_centroid_id = bigml.api.get_batch_centroid_id(
-                    batch_centroid_id)
-                return True, batch_centroid_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "batch_centroid",
+                               bigml.api.get_batch_centroid_id)
 
 
 def are_clusters_created(path, number_of_clusters):
@@ -269,22 +213,8 @@ def are_clusters_created(path, number_of_clusters):
        path directory
 
     """
-    cluster_ids = []
-    try:
-        with open("%s%sclusters" % (path, os.sep)) as clusters_file:
-            for line in clusters_file:
-                cluster = line.strip()
-                try:
-                    cluster_id = bigml.api.get_cluster_id(cluster)
-                    cluster_ids.append(cluster_id)
-                except ValueError:
-                    return False, cluster_ids
-        if len(cluster_ids) == number_of_clusters:
-            return True, cluster_ids
-        else:
-            return False, cluster_ids
-    except IOError:
-        return False, cluster_ids
+    return are_resources_created(path, "clusters", number_of_clusters,
+                                 bigml.api.get_cluster_id)
 
 
 def is_dataset_exported(filename):
@@ -303,19 +233,8 @@ def is_batch_anomaly_score_created(path):
        batch_anomaly_score file in the path directory
 
     """
-    batch_anomaly_score_id = None
-    try:
-        with open("%s%sbatch_anomaly_score"
-                  % (path, os.sep)) as batch_prediction_file:
-            batch_anomaly_score_id = batch_prediction_file.readline().strip()
-            try:
-                batch_anomaly_score_id = bigml.api.get_batch_anomaly_score_id(
-                    batch_anomaly_score_id)
-                return True, batch_anomaly_score_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "batch_anomaly_score",
+                               bigml.api.get_batch_anomaly_score_id)
 
 
 def are_anomalies_created(path, number_of_anomalies):
@@ -323,22 +242,8 @@ def are_anomalies_created(path, number_of_anomalies):
        anomalies file in the path directory
 
     """
-    anomaly_ids = []
-    try:
-        with open("%s%sanomalies" % (path, os.sep)) as anomalies_file:
-            for line in anomalies_file:
-                anomaly = line.strip()
-                try:
-                    anomaly_id = bigml.api.get_anomaly_id(anomaly)
-                    anomaly_ids.append(anomaly_id)
-                except ValueError:
-                    return False, anomaly_ids
-        if len(anomaly_ids) == number_of_anomalies:
-            return True, anomaly_ids
-        else:
-            return False, anomaly_ids
-    except IOError:
-        return False, anomaly_ids
+    return are_resources_created(path, "anomalies", number_of_anomalies,
+                                 bigml.api.get_anomaly_id)
 
 
 def is_project_created(path):
@@ -346,19 +251,8 @@ def is_project_created(path):
        project file in the path directory
 
     """
-    project_id = None
-    try:
-        with open("%s%sproject"
-                  % (path, os.sep)) as project_file:
-            project_id = project_file.readline().strip()
-            try:
-                project_id = bigml.api.get_project_id(
-                    project_id)
-                return True, project_id
-            except ValueError:
-                return False, None
-    except IOError:
-        return False, None
+    return is_resource_created(path, "project",
+                               bigml.api.get_project_id)
 
 
 def are_samples_created(path, number_of_samples):
@@ -366,19 +260,5 @@ def are_samples_created(path, number_of_samples):
        path directory
 
     """
-    sample_ids = []
-    try:
-        with open("%s%ssamples" % (path, os.sep)) as samples_file:
-            for line in samples_file:
-                sample = line.strip()
-                try:
-                    sample_id = bigml.api.get_sample_id(sample)
-                    sample_ids.append(sample_id)
-                except ValueError:
-                    return False, sample_ids
-        if len(sample_ids) == number_of_samples:
-            return True, sample_ids
-        else:
-            return False, sample_ids
-    except IOError:
-        return False, sample_ids
+    return are_resources_created(path, "samples", number_of_samples,
+                                 bigml.api.get_sample_id)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Chunked uploads for very large training files
+
+   The training file is split in chunks of rows of about `chunk_size`
+   bytes. Rows are never split, and every chunk is uploaded preceded by
+   the header row. Chunks are read-only views of the original file, so no
+   copy of its contents is written. Each chunk is uploaded as a source and
+   the datasets built from them are joined in a multi-dataset, so an
+   interrupted upload only needs to send again the chunks that were not
+   acknowledged (those with no checkpoint files). The field types of all
+   the chunks are set to the ones inferred for the first chunk, so that
+   the datasets can be joined.
+
+   The manifest file keeps the description of the original file and the
+   offset, size and checksum of every chunk found so far. When resuming,
+   the chunks whose checksum is still correct are reused and the split goes
+   on from the end of the last one.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import hashlib
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+MANIFEST = "chunks_manifest"
+MEGABYTE = 1024 * 1024
+
+
+class ChunkFile(object):
+    """Read-only file-like view of the header row and a chunk of rows of a
+       file, to be uploaded as a source
+
+    """
+
+    def __init__(self, file_name, header_row, offset, rows_size):
+        self.name = file_name
+        self.header_row = header_row
+        self.offset = offset
+        self.rows_size = rows_size
+        self.size = len(header_row) + rows_size
+        self.position = 0
+        self.handler = None
+
+    def __str__(self):
+        return "%s[%s:%s]" % (self.name, self.offset,
+                              self.offset + self.rows_size)
+
+    def seek(self, position, whence=0):
+        """Moves to a position relative to the start (0), the current
+           position (1) or the end (2) of the chunk
+
+        """
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.size
+        self.position = min(max(position, 0), self.size)
+
+    def tell(self):
+        """Current position in the chunk
+
+        """
+        return self.position
+
+    def read(self, size=-1):
+        """Reads at most `size` bytes, or up to the end of the chunk
+
+        """
+        if size is None or size < 0 or self.position + size > self.size:
+            size = self.size - self.position
+        data = ""
+        header_size = len(self.header_row)
+        if self.position < header_size:
+            data = self.header_row[self.position: self.position + size]
+            self.position += len(data)
+            size -= len(data)
+        if size > 0:
+            if self.handler is None:
+                self.handler = open(self.name, "rb")
+            self.handler.seek(self.offset + self.position - header_size)
+            rows = self.handler.read(size)
+            self.position += len(rows)
+            data += rows
+        if self.position >= self.size:
+            self.close()
+        return data
+
+    def close(self):
+        """Closes the original file
+
+        """
+        if self.handler is not None:
+            self.handler.close()
+            self.handler = None
+
+
+def file_checksum(file_name, offset=0, size=None):
+    """sha1 checksum of the contents of a file, or of `size` bytes from
+       `offset`
+
+    """
+    checksum = hashlib.sha1()
+    with open(file_name, "rb") as input_file:
+        input_file.seek(offset)
+        remaining = size
+        while remaining is None or remaining > 0:
+            block_size = MEGABYTE if remaining is None else \
+                min(MEGABYTE, remaining)
+            block = input_file.read(block_size)
+            if not block:
+                break
+            checksum.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return checksum.hexdigest()
+
+
+def file_description(file_name, chunk_size, header):
+    """Properties of the original file that must not change when resuming
+
+    """
+    stats = os.stat(file_name)
+    return {"file": os.path.abspath(file_name),
+            "size": stats.st_size,
+            "mtime": int(stats.st_mtime),
+            "chunk_size": chunk_size,
+            "header": header}
+
+
+def read_manifest(path, description):
+    """Returns the list of valid chunks in the manifest if it describes the
+       same original file. Chunks after the first missing or corrupted one
+       are discarded.
+
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, ValueError):
+        return []
+    if manifest.get("source") != description:
+        return []
+    chunks = []
+    for chunk in manifest.get("chunks", []):
+        if ("rows_size" not in chunk or
+                file_checksum(description["file"], chunk["offset"],
+                              chunk["rows_size"]) != chunk["sha1"]):
+            break
+        chunks.append(chunk)
+    return chunks
+
+
+def write_manifest(path, description, chunks):
+    """Stores the manifest, replacing the previous one atomically
+
+    """
+    manifest_name = os.path.join(path, MANIFEST)
+    with open("%s.tmp" % manifest_name, "w") as manifest_file:
+        json.dump({"source": description, "chunks": chunks}, manifest_file,
+                  indent=4)
+    if os.path.exists(manifest_name):
+        os.remove(manifest_name)
+    os.rename("%s.tmp" % manifest_name, manifest_name)
+
+
+def next_row(input_file):
+    """Reads the next CSV row, that can span several lines if a quoted
+       value contains new lines
+
+    """
+    row = input_file.readline()
+    while row and row.count('"') % 2 == 1:
+        line = input_file.readline()
+        if not line:
+            break
+        row += line
+    return row
+
+
+def split_file(file_name, path, chunk_size, header=True, resume=False):
+    """Splits the file in chunks and returns the list of chunk views.
+       The manifest is updated after every chunk, so that an interrupted
+       split can go on when resuming.
+
+    """
+    description = file_description(file_name, chunk_size, header)
+    chunks = read_manifest(path, description) if resume else []
+    try:
+        with open(file_name, "rb") as input_file:
+            header_row = next_row(input_file) if header else ""
+            if chunks:
+                input_file.seek(chunks[-1]["offset"] + chunks[-1]["rows_size"])
+            offset = input_file.tell()
+            row = next_row(input_file)
+            while row:
+                checksum = hashlib.sha1()
+                rows_size = 0
+                while row and (rows_size == 0 or
+                               rows_size + len(row) <= chunk_size):
+                    checksum.update(row)
+                    rows_size += len(row)
+                    row = next_row(input_file)
+                chunks.append({"offset": offset,
+                               "rows_size": rows_size,
+                               "sha1": checksum.hexdigest()})
+                write_manifest(path, description, chunks)
+                offset += rows_size
+    except IOError, exception:
+        sys.exit("Failed to split the training file in chunks: %s" %
+                 str(exception))
+    return [ChunkFile(file_name, header_row, chunk["offset"],
+                      chunk["rows_size"]) for chunk in chunks]
+
+
+def chunked_training_files(file_name, path, chunk_size, header=True,
+                           resume=False):
+    """Returns the chunks to be uploaded for a local file bigger than
+       `chunk_size` MB or the file itself otherwise
+
+    """
+    chunk_size = chunk_size * MEGABYTE
+    if (chunk_size <= 0 or not isinstance(file_name, basestring) or
+            not os.path.isfile(file_name) or
+            os.path.getsize(file_name) <= chunk_size):
+        return [file_name]
+    return split_file(file_name, path, chunk_size, header=header,
+                      resume=resume)
@@ -35,6 +35,9 @@ from bigmler.defaults import DEFAULTS_FILE
 from bigmler.defaults import get_user_defaults
 from bigmler.prediction import MAX_MODELS
 from bigmler.parser import create_parser
+from bigmler.sessions_db import safe_call
+from bigmler.log_writer import flush_logs
+from bigmler.line_index import count_lines
 
 
 COMMAND_LOG = u".bigmler"
@@ -73,11 +76,28 @@ def tail(file_handler, window=1):
 
 
 def get_log_reversed(file_name, stack_level):
-    """Reads the line of a log file that has the chosen stack_level
+    """Reads the line of a log file that has the chosen stack_level. The
+       line in the sessions store is used when it matches the one in the
+       file or the store has more lines than the file.
 
     """
-    lines_list = tail(open(file_name, "r"), window=(stack_level + 1))
-    return lines_list[0].decode(u.SYSTEM_ENCODING)
+    flush_logs()
+    stored_line = safe_call("reversed_line", file_name, stack_level)
+    try:
+        with open(file_name, "r") as log_file:
+            lines_list = tail(log_file, window=(stack_level + 1))
+    except IOError:
+        if stored_line is None:
+            raise
+        return stored_line
+    line = lines_list[0].decode(u.SYSTEM_ENCODING)
+    if stored_line is None or stored_line == line:
+        return line
+    # the store misses the lines written by previous versions and the file
+    # can miss the ones that failed to be written: the most complete is used
+    if (safe_call("line_count", file_name) or 0) > count_lines(file_name):
+        return stored_line
+    return line
 
 
 def get_stored_command(args, debug=False, command_log=COMMAND_LOG,
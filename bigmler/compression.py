@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compression of the local files uploaded to BigML
+
+   When `--compress-uploads` is used, local files are gzipped in a
+   background thread before being uploaded. Compression can be started as
+   soon as the file names are known, so that a file is compressed while
+   other resources are being created or other files are being uploaded.
+   The bindings need to know the size of the uploaded file beforehand, so
+   the upload starts when compression is finished. The compressed copy is
+   removed once uploaded.
+
+"""
+from __future__ import absolute_import
+
+import os
+import gzip
+import hashlib
+import shutil
+import threading
+
+
+# smaller files are uploaded as they are
+MIN_COMPRESS_SIZE = 1024 * 1024
+# compressed files must be at most this fraction of the original size
+MIN_COMPRESSION_RATE = 0.9
+COMPRESSED_EXTENSIONS = [".gz", ".zip", ".bz2", ".tgz", ".xz", ".z"]
+COMPRESS_BLOCK = 1024 * 1024
+
+COMPRESSIONS = {}
+LOCK = threading.Lock()
+
+
+def compressible(file_name):
+    """Checks whether the file is a local uncompressed file big enough to
+       benefit from compression
+
+    """
+    if not isinstance(file_name, basestring) or not os.path.isfile(file_name):
+        return False
+    extension = os.path.splitext(file_name)[1].lower()
+    return (extension not in COMPRESSED_EXTENSIONS and
+            os.path.getsize(file_name) >= MIN_COMPRESS_SIZE)
+
+
+def compressed_file_name(file_name, output_path):
+    """Name of the compressed copy of the file in the output directory. A
+       hash of the absolute path keeps apart files with the same basename
+
+    """
+    digest = hashlib.sha1(os.path.abspath(file_name)).hexdigest()[:8]
+    return os.path.join(output_path, "%s_%s.gz" % (
+        os.path.basename(file_name), digest))
+
+
+def remove_file(file_name):
+    """Removes the file, if it exists
+
+    """
+    try:
+        os.remove(file_name)
+    except OSError:
+        pass
+
+
+class Compression(threading.Thread):
+    """Gzips a file in a background thread
+
+    """
+
+    def __init__(self, file_name, output_path):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.file_name = file_name
+        self.compressed_name = compressed_file_name(file_name, output_path)
+        self.uploaded_name = file_name
+
+    def run(self):
+        try:
+            with open(self.file_name, "rb") as input_file:
+                output_file = gzip.open(self.compressed_name, "wb")
+                try:
+                    shutil.copyfileobj(input_file, output_file,
+                                       COMPRESS_BLOCK)
+                finally:
+                    output_file.close()
+            if (os.path.getsize(self.compressed_name) <=
+                    MIN_COMPRESSION_RATE * os.path.getsize(self.file_name)):
+                self.uploaded_name = self.compressed_name
+        except (IOError, OSError):
+            # the original file is uploaded
+            pass
+        if self.uploaded_name != self.compressed_name:
+            remove_file(self.compressed_name)
+
+    def result(self):
+        """Waits for the compression and returns the name of the file to be
+           uploaded
+
+        """
+        while self.is_alive():
+            self.join(1)
+        return self.uploaded_name
+
+
+def start_compression(file_name, output_path):
+    """Starts compressing the file in the background if it's worth it.
+       Compressing the same file again reuses the first compression.
+
+    """
+    if output_path is None or not compressible(file_name):
+        return None
+    key = os.path.abspath(file_name)
+    with LOCK:
+        compression = COMPRESSIONS.get(key)
+        if compression is None:
+            compression = Compression(file_name, output_path)
+            COMPRESSIONS[key] = compression
+            compression.start()
+    return compression
+
+
+def upload_file(file_name, output_path):
+    """Returns the name of the file to be uploaded: the compressed version
+       of the file when available
+
+    """
+    compression = start_compression(file_name, output_path)
+    if compression is None:
+        return file_name
+    return compression.result()
+
+
+def remove_compression(file_name):
+    """Removes the compressed copy of the file once it has been uploaded
+
+    """
+    if not isinstance(file_name, basestring):
+        return
+    with LOCK:
+        compression = COMPRESSIONS.pop(os.path.abspath(file_name), None)
+    if compression is not None:
+        compression.result()
+        remove_file(compression.compressed_name)
+
+
+def remove_compressions():
+    """Removes the compressed copies of the files that were not uploaded
+
+    """
+    for file_name in COMPRESSIONS.keys():
+        remove_compression(file_name)
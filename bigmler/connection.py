@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Shared HTTP connection pool for the BigML API calls
+
+   The bindings issue their HTTP requests through the functions of the
+   `requests` module, so every call opens a new connection. The
+   `PooledRequests` object offers the same functions, backed by a single
+   `requests.Session` with keep-alive connections, and is set in the
+   bindings modules once per process, so that every api instance created
+   afterwards (also in nested subcommand calls) shares the pool. As the
+   pooled calls skip the `requests` functions patched by the bindings in
+   debug mode, the pool logs the request and response contents itself
+   when any api instance uses `--debug`.
+
+"""
+from __future__ import absolute_import
+
+import logging
+import threading
+
+import requests
+import requests.adapters
+
+import bigml.bigmlconnection
+import bigml.sourcehandler
+
+
+DEFAULT_POOL_SIZE = 10
+POOLED_MODULES = [bigml.bigmlconnection, bigml.sourcehandler]
+HEADERS = {"Accept-Encoding": "gzip, deflate",
+           "Connection": "keep-alive"}
+
+LOCK = threading.Lock()
+POOL = {"requests": None}
+
+
+class PooledRequests(object):
+    """Replacement for the `requests` module in the bindings, using a shared
+       session
+
+    """
+    # exceptions caught by the bindings
+    ConnectionError = requests.ConnectionError
+    Timeout = requests.Timeout
+    RequestException = requests.RequestException
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, debug=False):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.pool_size = None
+        self.debug = debug
+        self.resize(pool_size)
+
+    def resize(self, pool_size):
+        """Mounts the adapters that keep up to `pool_size` connections
+           per host
+
+        """
+        pool_size = max(pool_size, 1)
+        if pool_size != self.pool_size:
+            self.pool_size = pool_size
+            for prefix in ["https://", "http://"]:
+                self.session.mount(prefix, requests.adapters.HTTPAdapter(
+                    pool_connections=pool_size, pool_maxsize=pool_size))
+
+    def request(self, method, url, **kwargs):
+        """Request using the shared session, logged as the bindings do in
+           debug mode
+
+        """
+        response = self.session.request(method, url, **kwargs)
+        if self.debug:
+            logging.debug("Data: {}".format(response.request.body))
+            logging.debug("Response: {}".format(response.content))
+        return response
+
+    def get(self, url, **kwargs):
+        """GET request using the shared session"""
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """POST request using the shared session"""
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        """PUT request using the shared session"""
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """DELETE request using the shared session"""
+        return self.request("DELETE", url, **kwargs)
+
+    def __getattr__(self, name):
+        """Any other attribute is taken from the `requests` module"""
+        return getattr(requests, name)
+
+
+def use_connection_pool(pool_size=DEFAULT_POOL_SIZE, debug=False):
+    """Sets the shared connection pool in the bindings modules. The pool is
+       created once per process and only grows when a bigger size is needed.
+       Once an api instance uses debug mode, the pooled calls are logged.
+
+    """
+    with LOCK:
+        pooled_requests = POOL["requests"]
+        if pooled_requests is None:
+            pooled_requests = PooledRequests(pool_size, debug=debug)
+            POOL["requests"] = pooled_requests
+        elif pool_size > pooled_requests.pool_size:
+            pooled_requests.resize(pool_size)
+        pooled_requests.debug = pooled_requests.debug or debug
+        for module in POOLED_MODULES:
+            module.requests = pooled_requests
+    return pooled_requests
@@ -26,9 +26,18 @@ FLAGS = {
     'BigMLer': [
         {'flag': 'debug', 'type': 'boolean'},
         {'flag': 'dev', 'type': 'boolean'},
+        {'flag': 'connection_pool_size', 'type': 'int'},
+        {'flag': 'resource_cache', 'type': 'string'},
+        {'flag': 'resource_cache_size', 'type': 'int'},
+        {'flag': 'adaptive_parallel', 'type': 'boolean'},
+        {'flag': 'min_parallel', 'type': 'int'},
         {'flag': 'username', 'type': 'string'},
         {'flag': 'api_key', 'type': 'string'},
         {'flag': 'train', 'type': 'string'},
+        {'flag': 'reuse_by_content', 'type': 'boolean'},
+        {'flag': 'compress_uploads', 'type': 'boolean'},
+        {'flag': 'content_index', 'type': 'string'},
+        {'flag': 'upload_chunk_size', 'type': 'int'},
         {'flag': 'test', 'type': 'string'},
         {'flag': 'output', 'type': 'string'},
         {'flag': 'objective', 'type': 'string'},
@@ -58,6 +67,9 @@ FLAGS = {
         {'flag': 'replacement', 'type': 'boolean'},
         {'flag': 'max_parallel_models', 'type': 'int'},
         {'flag': 'max_batch_models', 'type': 'int'},
+        {'flag': 'max_parallel_downloads', 'type': 'int'},
+        {'flag': 'prune_upload', 'type': 'boolean'},
+        {'flag': 'max_parallel_uploads', 'type': 'int'},
         {'flag': 'randomize', 'type': 'boolean'},
         {'flag': 'no_tag', 'type': 'boolean'},
         {'flag': 'tag', 'type': 'string'},
@@ -105,11 +117,15 @@ FLAGS = {
         {'flag': 'threshold', 'type': 'int'},
         {'flag': 'threshold_class', 'type': 'string'},
         {'flag': 'max_categories', 'type': 'int'},
+        {'flag': 'max_parallel_datasets', 'type': 'int'},
         {'flag': 'test_field_attributes', 'type': 'string'},
         {'flag': 'test_types', 'type': 'string'},
         {'flag': 'test_source', 'type': 'string'},
         {'flag': 'test_dataset', 'type': 'string'},
         {'flag': 'no_batch', 'type': 'boolean'},
+        {'flag': 'prediction_cache', 'type': 'string'},
+        {'flag': 'prediction_cache_ttl', 'type': 'int'},
+        {'flag': 'prediction_cache_size', 'type': 'int'},
         {'flag': 'dataset_attributes', 'type': 'string'},
         {'flag': 'output', 'type': 'string'},
         {'flag': 'new_fields', 'type': 'string'},
@@ -30,6 +30,8 @@ import bigmler.processing.args as a
 
 from bigmler.defaults import DEFAULTS_FILE
 from bigmler.command import get_stored_command
+from bigmler.sessions_db import safe_call
+from bigmler.log_writer import flush_logs
 from bigmler.dispatcher import (SESSIONS_LOG, command_handling,
                                 clear_log_files)
 
@@ -47,11 +49,16 @@ RESOURCES_LOG_FILES = set(['source', 'dataset', 'dataset_train',
 
 def retrieve_resources(directory):
     """Searches recusively the user-given directory for resource log files
-       and returns its ids.
+       and returns its ids, together with the ones in the sessions store.
 
     """
-    log_ids = []
+    log_ids = [bigml.api.get_resource_id(resource_id) for resource_id in
+               safe_call("directory_resources", directory,
+                         RESOURCES_LOG_FILES) or []]
+    log_ids = [resource_id for resource_id in log_ids
+               if resource_id is not None]
     if os.path.isdir(directory):
+        flush_logs()
         for root, _, files in os.walk(directory):
             for resources_file in files:
                 if resources_file in RESOURCES_LOG_FILES:
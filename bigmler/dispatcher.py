@@ -23,6 +23,7 @@ import sys
 import os
 import re
 import gc
+import copy
 import shutil
 
 import bigml.api
@@ -33,6 +34,7 @@ import bigmler.processing.args as a
 import bigmler.processing.sources as ps
 import bigmler.processing.datasets as pd
 import bigmler.processing.models as pm
+import bigmler.checkpoint as c
 
 from bigml.model import Model
 #from bigml.ensemble import Ensemble
@@ -46,6 +48,13 @@ from bigmler.prediction import (OTHER, COMBINATION,
 from bigmler.reports import clear_reports, upload_reports
 from bigmler.command import Command, get_stored_command
 from bigmler.command import COMMAND_LOG, DIRS_LOG, SESSIONS_LOG
+from bigmler.pipeline import Pipeline
+from bigmler.compression import start_compression, remove_compressions, \
+    COMPRESSED_EXTENSIONS
+from bigmler.chunks import chunked_training_files
+from bigmler.projection import project_training_set
+from bigmler.sessions_db import safe_call
+from bigmler.log_writer import flush_logs
 
 
 LOG_FILES = [COMMAND_LOG, DIRS_LOG, u.NEW_DIRS_LOG]
@@ -107,7 +116,9 @@ def clear_log_files(log_files):
     """Clear all contents in log files
 
     """
+    flush_logs()
     for log_file in log_files:
+        safe_call("clear_log", log_file)
         try:
             open(log_file, 'w', 0).close()
         except IOError:
@@ -230,7 +241,71 @@ def main_dispatcher(args=sys.argv[1:]):
         a.transform_args(command_args, command.flags, api,
                          command.user_defaults)
         compute_output(**output_args)
+        remove_compressions()
     u.log_message("_" * 80 + "\n", log_file=session_file)
+    # the files of this command can be read by the command that called it
+    flush_logs()
+
+
+def has_remote_batch_test(args):
+    """Checks whether the test file will be uploaded to create the
+       test dataset used in a remote batch prediction
+
+    """
+    return (args.test_set and args.remote and not args.no_batch and
+            not args.multi_label and not args.evaluate and
+            not args.no_model and
+            not args.method in [THRESHOLD_CODE, COMBINATION] and
+            args.test_source is None and args.test_dataset is None and
+            not args.test_datasets and args.test_split == 0)
+
+
+def test_data_pipeline(api, args, resume,
+                       session_file=None, path=None, log=None):
+    """Graph of the tasks that build the test source and dataset for remote
+       batch predictions. They don't depend on the training resources, so
+       they can be built while those are being created. The tasks work on
+       a copy of the arguments, that is returned with the graph so that
+       their changes can be merged once finished.
+
+    """
+    test_name = "%s - test" % args.name
+    test_args = copy.copy(args)
+    pipeline = Pipeline(resume=resume)
+
+    def test_source():
+        """Creates or retrieves the test source"""
+        test_source, _, csv_properties, _ = ps.test_source_processing(
+            api, test_args, resume, csv_properties={},
+            session_file=session_file, path=path, log=log)
+        return test_source, csv_properties
+
+    def test_dataset(test_properties):
+        """Creates the test dataset from the test source"""
+        test_source, csv_properties = test_properties
+        dataset_args = r.set_basic_dataset_args(test_args, name=test_name)
+        test_dataset, _ = pd.alternative_dataset_processing(
+            test_source, "test", dataset_args, api, test_args,
+            False, session_file=session_file, path=path, log=log)
+        return test_dataset, csv_properties
+
+    def test_dataset_created():
+        """Checks for a previously created test dataset and retrieves the
+           properties of its source"""
+        message = u.dated("Dataset not found. Resuming.\n")
+        done, test_dataset = c.checkpoint(
+            c.is_dataset_created, path, "_test", debug=test_args.debug,
+            message=message, log_file=session_file,
+            console=test_args.verbosity)
+        if not done:
+            return done, None
+        _, csv_properties = test_source()
+        return done, (test_dataset, csv_properties)
+
+    pipeline.add("test_source", test_source)
+    pipeline.add("test_dataset", test_dataset, requires=["test_source"],
+                 probe=test_dataset_created)
+    return pipeline, test_args
 
 
 def compute_output(api, args):
@@ -270,6 +345,14 @@ def compute_output(api, args):
         # If --clear_logs the log files are cleared
         clear_log_files([log])
 
+    # --train can be a glob pattern or a list of files. Their datasets are
+    # joined in a multi-dataset
+    train_files = ps.training_files(args)
+    if len(train_files) > 1 and args.multi_label:
+        sys.exit("Multi-label training data must be in a single file.")
+    if len(train_files) == 1:
+        args.training_set = train_files[0]
+
     # labels to be used in multi-label expansion
     labels = (None if args.labels is None else
               [label.strip() for label in
@@ -289,7 +372,37 @@ def compute_output(api, args):
             labels = all_labels
     else:
         all_labels = labels
-    if args.source_file:
+    if args.prune_upload and args.training_set is not None:
+        args.training_set = project_training_set(
+            args, path, resume=resume, session_file=session_file)
+    chunked = False
+    if (args.upload_chunk_size > 0 and len(train_files) == 1 and
+            not args.multi_label and
+            r.data_to_source(args)[0] == args.training_set and
+            os.path.splitext(str(args.training_set))[1].lower() not in
+            COMPRESSED_EXTENSIONS):
+        # big files are uploaded in chunks that can be resumed separately
+        train_files = chunked_training_files(
+            args.training_set, path, args.upload_chunk_size,
+            header=args.train_header, resume=resume)
+        chunked = len(train_files) > 1
+    if args.compress_uploads:
+        # the local files to be uploaded are compressed in the background,
+        # so that the test file is compressed while the training resources
+        # are created. Files already uploaded when resuming are skipped
+        if len(train_files) == 1 and not (
+                resume and c.is_source_created(path)[0]):
+            start_compression(r.data_to_source(args)[0], path)
+        if args.test_set and args.remote and not (
+                resume and c.is_source_created(path, suffix="_test")[0]):
+            start_compression(args.test_set, path)
+    if len(train_files) > 1:
+        # sources and datasets are built concurrently for all the files
+        datasets, resume, csv_properties, fields = pd.multi_file_processing(
+            train_files, api, args, resume, csv_properties=csv_properties,
+            pin_types=chunked, session_file=session_file, path=path,
+            log=log)
+    elif args.source_file:
         # source is retrieved from the contents of the given local JSON file
         source, csv_properties, fields = u.read_local_resource(
             args.source_file,
@@ -300,6 +413,15 @@ def compute_output(api, args):
             api, args, resume,
             csv_properties=csv_properties, multi_label_data=multi_label_data,
             session_file=session_file, path=path, log=log)
+    # The test data used in remote batch predictions is uploaded while the
+    # training resources are built
+    test_pipeline, test_args = None, None
+    if has_remote_batch_test(args):
+        test_pipeline, test_args = test_data_pipeline(
+            api, args, resume, session_file=session_file, path=path,
+            log=log)
+        test_pipeline.start("test_dataset")
+
     if args.multi_label and source:
         multi_label_data = l.get_multi_label_data(source)
         (args.objective_field,
@@ -539,7 +661,17 @@ def compute_output(api, args):
                 and not args.method in [THRESHOLD_CODE, COMBINATION]):
             # create test source from file
             test_name = "%s - test" % args.name
-            if args.test_source is None:
+            if test_pipeline is not None:
+                # test source and dataset built concurrently
+                test_dataset, csv_properties = test_pipeline.result(
+                    "test_dataset")
+                # changes made by the test branch in its copy of the args
+                args.test_source = test_args.test_source
+                args.user_locale = test_args.user_locale
+                resume = resume and test_pipeline.resumed("test_dataset")
+                if isinstance(test_dataset, basestring):
+                    test_dataset = api.check_resource(test_dataset)
+            elif args.test_source is None:
                 test_properties = ps.test_source_processing(
                     api, args, resume, session_file=session_file,
                     path=path, log=log)
@@ -20,9 +20,9 @@
 from __future__ import absolute_import
 
 import os
-import json
 import numbers
 import math
+import copy
 
 import bigmler.utils as u
 import bigmler.resources as r
@@ -30,6 +30,8 @@ import bigmler.checkpoint as c
 
 from bigml.util import slugify
 
+from bigmler.scheduler import parallel_map
+
 
 def evaluate(models_or_ensembles, datasets, api, args, resume,
              session_file=None, path=None, log=None,
@@ -40,7 +42,6 @@ def evaluate(models_or_ensembles, datasets, api, args, resume,
 
     """
     output = args.predictions
-    evaluation_files = []
     evaluations, resume = evaluations_process(
         models_or_ensembles, datasets, fields,
         dataset_fields, api, args, resume,
@@ -49,10 +50,10 @@ def evaluate(models_or_ensembles, datasets, api, args, resume,
     if args.multi_label:
         file_labels = [slugify(name) for name in
                        u.objective_field_names(models_or_ensembles, api)]
-    for index in range(0, len(evaluations)):
-        evaluation = evaluations[index]
-        evaluation = r.get_evaluation(evaluation, api, args.verbosity,
-                                      session_file)
+    average = args.multi_label or args.test_datasets or args.dataset_off
+    mean_evaluation = {}
+    for index, evaluation in finished_evaluations(evaluations, api, args,
+                                                  session_file=session_file):
         if r.shared_changed(args.shared, evaluation):
             evaluation_args = {"shared": args.shared}
             evaluation = r.update_evaluation(evaluation, evaluation_args,
@@ -62,14 +63,14 @@ def evaluate(models_or_ensembles, datasets, api, args, resume,
         if args.multi_label:
             suffix = file_labels[index]
             file_name += "_%s" % suffix
-            evaluation_files.append("%s.json" % file_name)
         if args.test_datasets or args.dataset_off:
             suffix = evaluation['resource'].replace('evaluation/', '_')
             file_name += "_%s" % suffix
-            evaluation_files.append("%s.json" % file_name)
         r.save_evaluation(evaluation, file_name, api)
-    if args.multi_label or args.test_datasets or args.dataset_off:
-        mean_evaluation = average_evaluations(evaluation_files)
+        if average:
+            add_evaluation(mean_evaluation, evaluation, len(evaluations))
+    if average:
+        traverse_for_std_dev(mean_evaluation)
         r.save_evaluation(mean_evaluation, output, api)
     return resume
 
@@ -84,20 +85,34 @@ def cross_validate(models, dataset, fields, api, args, resume,
         fields, fields, api, args, resume,
         session_file=session_file, path=path, log=log)
     if not resume:
-        evaluation_files = []
-        for evaluation in evaluations:
-            evaluation = r.get_evaluation(evaluation, api, args.verbosity,
-                                          session_file)
+        cross_validation = {}
+        for _, evaluation in finished_evaluations(evaluations, api, args,
+                                                  session_file=session_file):
             model_id = evaluation['object']['model']
             file_name = "%s%s%s__evaluation" % (path, os.sep,
                                                 model_id.replace("/", "_"))
-            evaluation_files.append(file_name + ".json")
             r.save_evaluation(evaluation, file_name, api)
-        cross_validation = average_evaluations(evaluation_files)
+            add_evaluation(cross_validation, evaluation, len(evaluations))
+        traverse_for_std_dev(cross_validation)
         file_name = "%s%scross_validation" % (path, os.sep)
         r.save_evaluation(cross_validation, file_name, api)
 
 
+def finished_evaluations(evaluations, api, args, session_file=None):
+    """Yields (index, evaluation) pairs as the evaluations finish. Up to
+       --max-parallel-evaluations evaluations are retrieved at a time.
+
+    """
+    def retrieve(indexed_evaluation):
+        """Waits for the evaluation to finish and retrieves it"""
+        index, evaluation = indexed_evaluation
+        return index, r.get_evaluation(evaluation, api, args.verbosity,
+                                       session_file)
+
+    return parallel_map(retrieve, enumerate(evaluations),
+                        args.max_parallel_evaluations, ordered=False)
+
+
 def evaluations_process(models_or_ensembles, datasets,
                         fields, dataset_fields, api, args, resume,
                         session_file=None, path=None, log=None, labels=None,
@@ -168,20 +183,13 @@ def traverse_for_std_dev(tree):
             traverse_for_std_dev(subtree)
 
 
-def average_evaluations(evaluation_files):
-    """Reads the contents of the evaluations files and averages its measures
+def add_evaluation(averaged_evaluation, evaluation, number_of_evaluations):
+    """Adds the measures of a finished evaluation to the cumulative average
 
     """
-    averaged_evaluation = {}
-    number_of_evaluations = float(len(evaluation_files))
-    if number_of_evaluations > 0:
-        for evaluation_file in evaluation_files:
-            with open(evaluation_file, 'U') as evaluation_file:
-                evaluation = json.loads(evaluation_file.read())
-                avg_evaluation(averaged_evaluation,
-                               evaluation, number_of_evaluations)
-        traverse_for_std_dev(averaged_evaluation)
-    return averaged_evaluation
+    result = evaluation.get('object', evaluation).get('result', evaluation)
+    avg_evaluation(averaged_evaluation, copy.deepcopy(result),
+                   float(number_of_evaluations))
 
 
 def avg_evaluation(total, component, number_of_evaluations):
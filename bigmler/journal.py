@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Append-only journal of the resources created in an output directory
+
+   Every resource id logged in a checkpoint file (`source`, `dataset`,
+   `models`, `evaluations`, ...) is also recorded as a `created` event in
+   the journal, and the resources seen to finish or fail are recorded as
+   `finished` or `failed` events. Events are JSON lines that are flushed
+   and synced to disk as they are written.
+
+   The journal is read once per process to build an in-memory index of
+   the checkpoint files contents and the resources status, so that
+   checkpoints don't need to parse every file and finished resources are
+   not polled again when resuming. A partially written last line (from an
+   interrupted run) is discarded.
+
+   When a resource is appended to a checkpoint file that was written before
+   the journal existed, the ids already in the file are recorded first, so
+   that the journal index keeps the complete list.
+
+"""
+from __future__ import absolute_import
+
+import os
+import threading
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+JOURNAL = ".journal"
+CREATED = "created"
+FINISHED = "finished"
+FAILED = "failed"
+
+JOURNALS = {}
+LOCK = threading.Lock()
+
+
+class Journal(object):
+    """Journal of the resources in an output directory and its index
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file_name = os.path.join(path, JOURNAL)
+        self.lock = threading.Lock()
+        self.handler = None
+        # resource ids logged in every checkpoint file
+        self.files = {}
+        # last event for every resource id
+        self.statuses = {}
+        self.load()
+
+    def load(self):
+        """Rebuilds the index from the events in the journal file.
+           Anything after the first malformed line is removed.
+
+        """
+        valid_size = 0
+        try:
+            with open(self.file_name, "rb") as journal_file:
+                for line in journal_file:
+                    try:
+                        if not line.endswith("\n"):
+                            raise ValueError("Incomplete event")
+                        self.apply(json.loads(line))
+                    except ValueError:
+                        break
+                    valid_size += len(line)
+            if valid_size < os.path.getsize(self.file_name):
+                with open(self.file_name, "r+b") as journal_file:
+                    journal_file.truncate(valid_size)
+        except (IOError, OSError):
+            pass
+
+    def apply(self, event):
+        """Updates the index with an event
+
+        """
+        resource_id = event.get("resource")
+        if resource_id is not None:
+            resource_id = str(resource_id)
+        if event["event"] == CREATED:
+            file_name = event.get("file")
+            if file_name is not None and "resources" in event:
+                # contents of a checkpoint file previous to the journal
+                self.files[file_name] = [str(resource) for resource in
+                                         event["resources"]]
+            elif file_name is not None:
+                if event.get("mode", "w") == "w" or \
+                        file_name not in self.files:
+                    self.files[file_name] = []
+                if resource_id is not None:
+                    self.files[file_name].append(resource_id)
+        if resource_id is not None:
+            self.statuses[resource_id] = event["event"]
+
+    def checkpoint_contents(self, file_name):
+        """Ids in a checkpoint file of the directory, or None if the file
+           does not exist
+
+        """
+        try:
+            with open(os.path.join(self.path, file_name)) as resources_file:
+                return [line.strip() for line in resources_file
+                        if line.strip()]
+        except IOError:
+            return None
+
+    def write(self, event):
+        """Writes the event to the journal file and updates the index
+
+        """
+        if self.handler is None:
+            self.handler = open(self.file_name, "ab")
+        self.handler.write("%s\n" % json.dumps(event))
+        self.handler.flush()
+        os.fsync(self.handler.fileno())
+        self.apply(event)
+
+    def record(self, event, resource_id, file_name=None, mode="a"):
+        """Appends an event to the journal and updates the index
+
+        """
+        event = {"event": event, "resource": resource_id}
+        if file_name is not None:
+            event.update({"file": file_name, "mode": mode})
+        with self.lock:
+            if (file_name is not None and mode != "w" and
+                    file_name not in self.files):
+                resource_ids = self.checkpoint_contents(file_name)
+                if resource_ids:
+                    self.write({"event": CREATED, "file": file_name,
+                                "resources": resource_ids})
+            self.write(event)
+
+    def resources(self, file_name):
+        """List of ids logged in the checkpoint file or None if the
+           journal has no record of it
+
+        """
+        with self.lock:
+            resource_ids = self.files.get(file_name)
+            return None if resource_ids is None else resource_ids[:]
+
+    def status(self, resource_id):
+        """Last event recorded for the resource
+
+        """
+        return self.statuses.get(resource_id)
+
+
+def get_journal(path):
+    """Returns the journal of the output directory, one per process
+
+    """
+    if path is None or not os.path.isdir(path):
+        return None
+    key = os.path.abspath(path)
+    with LOCK:
+        journal = JOURNALS.get(key)
+        if journal is None:
+            journal = Journal(path)
+            JOURNALS[key] = journal
+        return journal
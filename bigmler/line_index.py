@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Line counting and line offsets index for big files
+
+   Lines are counted reading the file in big blocks and counting the new
+   line characters in each of them. While counting, the line number and
+   byte offset of the first line that starts in every block are kept, so
+   that any line can be reached by seeking to the closest offset and
+   reading at most one block.
+
+   The count and offsets of files bigger than `INDEX_MIN_SIZE` are stored
+   in a `<file>.idx` sidecar file, together with the size and modification
+   time of the file, so that they are reused while the file is unchanged.
+   Counts are also kept in memory for the rest of the process.
+
+"""
+from __future__ import absolute_import
+
+import os
+import bisect
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+BLOCK_SIZE = 1024 * 1024
+INDEX_MIN_SIZE = 10 * BLOCK_SIZE
+INDEX_SUFFIX = ".idx"
+
+INDEXES = {}
+
+
+def file_key(file_name):
+    """Properties that identify the contents of a file
+
+    """
+    stats = os.stat(file_name)
+    return os.path.abspath(file_name), stats.st_size, stats.st_mtime
+
+
+def build_index(file_name):
+    """Reads the file in blocks to count its lines and find the offsets of
+       the first line starting in each block
+
+    """
+    lines = 0
+    offsets = [[0, 0]]
+    position = 0
+    last = None
+    with open(file_name, "rb") as file_handler:
+        block = file_handler.read(BLOCK_SIZE)
+        while block:
+            first_new_line = block.find("\n")
+            if first_new_line > -1 and position > 0:
+                offsets.append([lines + 1, position + first_new_line + 1])
+            lines += block.count("\n")
+            position += len(block)
+            last = block[-1]
+            block = file_handler.read(BLOCK_SIZE)
+    # a last line with no new line character is also counted. Empty files
+    # are considered to have one line
+    if last is None or last != "\n":
+        lines += 1
+    return {"lines": lines, "offsets": offsets}
+
+
+def read_index(file_name, key):
+    """Reads the index stored in the sidecar file if it belongs to the
+       current contents of the file
+
+    """
+    try:
+        with open("%s%s" % (file_name, INDEX_SUFFIX)) as index_file:
+            index = json.load(index_file)
+        if index["size"] == key[1] and index["mtime"] == key[2]:
+            return {"lines": index["lines"], "offsets": index["offsets"]}
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_index(file_name, key, index):
+    """Stores the index in the sidecar file. Failing to write it (for
+       instance, in read-only directories) is not an error
+
+    """
+    index_name = "%s%s" % (file_name, INDEX_SUFFIX)
+    stored_index = {"size": key[1], "mtime": key[2]}
+    stored_index.update(index)
+    try:
+        with open("%s.tmp" % index_name, "w") as index_file:
+            json.dump(stored_index, index_file)
+        if os.path.exists(index_name):
+            os.remove(index_name)
+        os.rename("%s.tmp" % index_name, index_name)
+    except (IOError, OSError):
+        pass
+
+
+def get_index(file_name):
+    """Returns the lines count and offsets of the file, using the stored
+       ones while the file is unchanged
+
+    """
+    key = file_key(file_name)
+    index = INDEXES.get(key)
+    if index is None:
+        big_file = key[1] >= INDEX_MIN_SIZE
+        if big_file:
+            index = read_index(file_name, key)
+        if index is None:
+            index = build_index(file_name)
+            if big_file:
+                write_index(file_name, key, index)
+        INDEXES[key] = index
+    return index
+
+
+def count_lines(file_name):
+    """Number of lines in the file
+
+    """
+    return get_index(file_name)["lines"]
+
+
+def line_offset(file_name, line):
+    """Returns the closest indexed line before the given (0-based) line
+       number and its byte offset, to seek from there
+
+    """
+    offsets = get_index(file_name)["offsets"]
+    position = bisect.bisect_right([item[0] for item in offsets], line) - 1
+    return tuple(offsets[max(position, 0)])
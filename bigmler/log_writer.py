@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Buffered asynchronous writer for the log files
+
+   Messages for the session logs, command logs and resource checkpoint
+   files are queued and written by a background thread that keeps the
+   files open, instead of opening and closing the file for each message.
+   Messages queued while the writer is busy are written in a single batch.
+   The queue is bounded, so producers wait when the writer falls behind.
+
+   Writes to the same file keep their order. Files are flushed at exit and
+   at the points where bigmler reads them back (checkpoints, resumed
+   commands and subcommands), by calling `flush_logs`, that also writes the
+   batched statements of the sessions store. Durability of the created
+   resources is kept by the journal, that is written synchronously. Errors
+   in a message don't stop the writer and, if the writer thread is not
+   alive, the queued messages are written by the thread that flushes them.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import atexit
+import threading
+
+from collections import OrderedDict, deque
+
+from bigmler.sessions_db import flush_stores
+
+
+MAX_QUEUED = 10000
+MAX_HANDLES = 64
+FLUSH = "flush"
+WRITE = "write"
+
+
+class LogWriter(object):
+    """Background thread writing the queued messages to their files
+
+    """
+
+    def __init__(self, max_queued=MAX_QUEUED, max_handles=MAX_HANDLES):
+        # appending to a deque is thread-safe and cheap for the producers
+        self.pending = deque()
+        self.max_queued = max_queued
+        self.max_handles = max_handles
+        # open files, the least recently used first
+        self.handles = OrderedDict()
+        # absolute path of the log files, so that each file has one handle
+        self.file_names = {}
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        # only one thread writes the queued messages at a time
+        self.write_lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Starts the writer thread if needed
+
+        """
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        """Writes the queued messages when the queue stops being empty
+
+        """
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.write_pending()
+
+    def write_pending(self):
+        """Writes the queued messages and signals the flushes waiting for
+           them
+
+        """
+        with self.write_lock:
+            flushed = []
+            try:
+                while self.pending:
+                    operation, arguments = self.pending.popleft()
+                    if operation == FLUSH:
+                        flushed.append(arguments)
+                    else:
+                        self.write_message(*arguments)
+                self.flush_handles()
+            finally:
+                for event in flushed:
+                    event.set()
+
+    def handle(self, file_name, mode="a"):
+        """Returns the open file, opening it if needed. Mode `w` truncates
+           the file.
+
+        """
+        handle = self.handles.pop(file_name, None)
+        if handle is not None and mode == "w":
+            handle.close()
+            handle = None
+        if handle is None:
+            handle = open(file_name, "%sb" % mode)
+            if len(self.handles) >= self.max_handles:
+                self.handles.popitem(last=False)[1].close()
+        self.handles[file_name] = handle
+        return handle
+
+    def write_message(self, file_name, message, mode):
+        """Writes the message to the file
+
+        """
+        try:
+            self.handle(file_name, mode).write(message)
+        except Exception, exc:
+            sys.stderr.write("Failed to write %s: %s\n" % (file_name,
+                                                             str(exc)))
+
+    def flush_handles(self):
+        """Flushes the contents of all the open files
+
+        """
+        for file_name, handle in self.handles.items():
+            try:
+                handle.flush()
+            except Exception, exc:
+                sys.stderr.write("Failed to write %s: %s\n" % (file_name,
+                                                                 str(exc)))
+
+    def write(self, file_name, message, mode="a"):
+        """Queues the message to be written in the file. Mode `w` replaces
+           the previous contents of the file. When too many messages are
+           queued, waits for them to be written.
+
+        """
+        self.start()
+        try:
+            file_name = self.file_names[file_name]
+        except KeyError:
+            file_name = self.file_names.setdefault(file_name,
+                                                   os.path.abspath(file_name))
+        self.pending.append((WRITE, (file_name, message, mode)))
+        queued = len(self.pending)
+        if queued == 1:
+            self.wakeup.set()
+        elif queued >= self.max_queued:
+            self.flush()
+
+    def flush(self):
+        """Waits until the queued messages are written to their files
+
+        """
+        if self.thread is None:
+            return
+        if not self.thread.is_alive():
+            self.write_pending()
+            return
+        flushed = threading.Event()
+        self.pending.append((FLUSH, flushed))
+        self.wakeup.set()
+        flushed.wait()
+
+
+LOG_WRITER = LogWriter()
+
+
+def write_log(file_name, message, mode="a"):
+    """Queues the message for the log file
+
+    """
+    LOG_WRITER.write(file_name, message, mode=mode)
+
+
+def flush_logs():
+    """Writes all the queued messages and store statements
+
+    """
+    LOG_WRITER.flush()
+    flush_stores()
+
+
+atexit.register(flush_logs)
@@ -49,6 +49,51 @@ def get_common_options(defaults=None, constants=None):
             "help": ("Compute a test output using BigML FREE"
                      " development environment.")},
 
+        # Max number of keep-alive connections shared by all the API calls.
+        '--connection-pool-size': {
+            "action": 'store',
+            "dest": 'connection_pool_size',
+            "default": defaults.get('connection_pool_size', 10),
+            "type": int,
+            "help": ("Max number of keep-alive HTTP connections to BigML"
+                     " shared by all the API calls.")},
+
+        # Directory of the persistent cache for the retrieved resources.
+        '--resource-cache': {
+            "action": 'store',
+            "dest": 'resource_cache',
+            "default": defaults.get('resource_cache', None),
+            "help": ("Directory used to cache the finished resources"
+                     " retrieved from BigML across runs.")},
+
+        # Max number of resources in the resource cache.
+        '--resource-cache-size': {
+            "action": 'store',
+            "dest": 'resource_cache_size',
+            "default": defaults.get('resource_cache_size', 1000),
+            "type": int,
+            "help": ("Max number of resources kept in the resource"
+                     " cache. The least recently used are removed.")},
+
+        # Adapts the number of resources created in parallel to the API
+        # response, between --min-parallel and the --max-parallel-* values.
+        '--adaptive-parallel': {
+            "action": 'store_true',
+            "dest": 'adaptive_parallel',
+            "default": defaults.get('adaptive_parallel', False),
+            "help": ("Adapt the number of resources created in parallel"
+                     " to the API response, up to the --max-parallel-*"
+                     " values.")},
+
+        # Min number of resources created in parallel for --adaptive-parallel.
+        '--min-parallel': {
+            "action": 'store',
+            "dest": 'min_parallel',
+            "default": defaults.get('min_parallel', 1),
+            "type": int,
+            "help": ("Min number of resources created in parallel when"
+                     " using --adaptive-parallel.")},
+
         # BigML's username.
         '--username': {
             "action": 'store',
@@ -97,6 +97,34 @@ def get_main_options(defaults=None, constants=None):
             'help': ("Max number of models to predict from"
                      " in parallel.")},
 
+        # Uploads only the columns and rows of the training file needed
+        # to build the model.
+        '--prune-upload': {
+            'action': 'store_true',
+            'dest': 'prune_upload',
+            'default': defaults.get('prune_upload', False),
+            'help': ("Upload only the model fields, the objective field"
+                     " and, for a single model with --sample-rate, a"
+                     " sample of the rows of the training file.")},
+
+        # Max number of training files to be uploaded in parallel.
+        '--max-parallel-uploads': {
+            'action': 'store',
+            'dest': 'max_parallel_uploads',
+            'default': defaults.get('max_parallel_uploads', 4),
+            'type': int,
+            'help': ("Max number of training files to be uploaded"
+                     " in parallel when --train is a list of files.")},
+
+        # Max number of models or ensembles to be downloaded in parallel.
+        '--max-parallel-downloads': {
+            'action': 'store',
+            'dest': 'max_parallel_downloads',
+            'default': defaults.get('max_parallel_downloads', 10),
+            'type': int,
+            'help': ("Max number of models or ensembles to be"
+                     " downloaded in parallel.")},
+
         # Randomize feature selection at each split.
         '--randomize': {
             'action': 'store_true',
@@ -321,6 +349,17 @@ def get_main_options(defaults=None, constants=None):
             'default': defaults.get('threshold_class', None),
             'help': "Category used in threshold combiner method."},
 
+        # Max number of datasets to create in parallel when splitting the
+        # objective field categories.
+        '--max-parallel-datasets': {
+            'action': 'store',
+            'dest': 'max_parallel_datasets',
+            'default': defaults.get('max_parallel_datasets', 1),
+            'type': int,
+            'help': ("Max number of datasets to create in parallel when"
+                     " splitting the objective categories with"
+                     " --max-categories.")},
+
         # Max number of categories to be included in a model
         '--max-categories': {
             'action': 'store',
@@ -337,6 +376,33 @@ def get_main_options(defaults=None, constants=None):
             'default': defaults.get('no_batch', False),
             'help': "Create remote predictions individually."},
 
+        # Directory where the results of remote predictions are cached to be
+        # reused in subsequent calls with the same input data.
+        '--prediction-cache': {
+            'action': 'store',
+            'dest': 'prediction_cache',
+            'default': defaults.get('prediction_cache', None),
+            'help': ("Directory used to cache the results of individual"
+                     " remote predictions between runs.")},
+
+        # Time (in seconds) that a cached remote prediction is valid.
+        '--prediction-cache-ttl': {
+            'action': 'store',
+            'dest': 'prediction_cache_ttl',
+            'default': defaults.get('prediction_cache_ttl', 86400),
+            'type': int,
+            'help': ("Time (in seconds) that a cached remote prediction is"
+                     " considered valid. Use 0 for no expiration.")},
+
+        # Max number of remote predictions to be kept in cache.
+        '--prediction-cache-size': {
+            'action': 'store',
+            'dest': 'prediction_cache_size',
+            'default': defaults.get('prediction_cache_size', 10000),
+            'type': int,
+            'help': ("Max number of remote predictions stored in the"
+                     " predictions cache.")},
+
         # Evaluations flag: excluding one dataset from the datasets list to
         # test
         '--dataset-off': {
@@ -42,6 +42,50 @@ def get_source_options(defaults=None):
             "default": defaults.get('source', None),
             "help": "BigML source Id."},
 
+        # Compresses the local files before uploading them.
+        '--compress-uploads': {
+            'action': 'store_true',
+            'dest': 'compress_uploads',
+            'default': defaults.get('compress_uploads', False),
+            'help': ("Gzip the local files before uploading them when"
+                     " they are big enough.")},
+
+        # Uploads the local files uncompressed.
+        '--no-compress-uploads': {
+            'action': 'store_false',
+            'dest': 'compress_uploads',
+            'default': defaults.get('compress_uploads', False),
+            'help': "Upload the local files uncompressed."},
+
+        # Reuses the sources and datasets previously created from the same
+        # file contents and arguments.
+        '--reuse-by-content': {
+            'action': 'store_true',
+            'dest': 'reuse_by_content',
+            'default': defaults.get('reuse_by_content', False),
+            'help': ("Reuse the sources and datasets previously created"
+                     " from the same file contents and arguments.")},
+
+        # Directory where the index of sources and datasets by content is
+        # stored.
+        '--content-index': {
+            'action': 'store',
+            'dest': 'content_index',
+            'default': defaults.get('content_index', '.bigmler_content'),
+            'help': ("Directory for the index of sources and datasets"
+                     " used in --reuse-by-content.")},
+
+        # Splits local training files bigger than the given size (in MB)
+        # in chunks that are uploaded separately and can be resumed.
+        '--upload-chunk-size': {
+            'action': 'store',
+            'dest': 'upload_chunk_size',
+            'default': defaults.get('upload_chunk_size', 0),
+            'type': int,
+            'help': ("Upload local training files bigger than the given"
+                     " size (in MB) in chunks, so that interrupted uploads"
+                     " can be resumed.")},
+
         # If a BigML json file containing a source structure is provided,
         # the script will use it.
         '--source-file': {
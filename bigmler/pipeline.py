@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Dependency graph executor for resource creation tasks
+
+   Each task is added with the names of the tasks it depends on. Tasks are
+   run in their own thread when started (explicitly or because a dependent
+   task needs them), so independent branches of the graph are built
+   concurrently. When resuming, the task's probe (usually one of the
+   checkpoint functions) is called first and, if it finds the resource
+   already done, its value is used and neither the task nor its
+   dependencies are run.
+
+"""
+from __future__ import absolute_import
+
+import sys
+import threading
+
+
+# seconds between checks while waiting, to keep the main thread
+# responsive to interruptions
+JOIN_STEP = 1
+
+
+class Task(object):
+    """A resource creation step
+
+    """
+
+    def __init__(self, name, action, requires=None, probe=None):
+        """`action` is called with the results of the tasks in `requires`,
+           in the same order. `probe` must return a (done, value) tuple.
+
+        """
+        self.name = name
+        self.action = action
+        self.requires = requires or []
+        self.probe = probe
+        self.result = None
+        self.resumed = False
+        self.exc_info = None
+        self.thread = None
+        self.done = threading.Event()
+
+
+class Pipeline(object):
+    """Graph of tasks run concurrently as their dependencies are met
+
+    """
+
+    def __init__(self, resume=False):
+        self.resume = resume
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, action, requires=None, probe=None):
+        """Adds a task to the graph. Dependencies must be already added.
+
+        """
+        for required in requires or []:
+            if required not in self.tasks:
+                raise ValueError("Unknown task %s required by %s" %
+                                 (required, name))
+        self.tasks[name] = Task(name, action, requires=requires, probe=probe)
+        return self.tasks[name]
+
+    def start(self, name):
+        """Starts the thread that runs the task, if not started yet
+
+        """
+        task = self.tasks[name]
+        with self.lock:
+            if task.thread is None:
+                task.thread = threading.Thread(target=self.run, args=(task,))
+                task.thread.daemon = True
+                task.thread.start()
+        return task
+
+    def run(self, task):
+        """Runs the task once its dependencies are done
+
+        """
+        try:
+            if self.resume and task.probe is not None:
+                done, value = task.probe()
+                if done:
+                    task.result = value
+                    task.resumed = True
+                    return
+            for required in task.requires:
+                self.start(required)
+            results = [self.result(required) for required in task.requires]
+            task.result = task.action(*results)
+        except BaseException:
+            # also sys.exit calls, that are raised again when the result
+            # is requested
+            task.exc_info = sys.exc_info()
+        finally:
+            task.done.set()
+
+    def result(self, name):
+        """Waits for the task to finish and returns its result
+
+        """
+        task = self.start(name)
+        while not task.done.is_set():
+            task.done.wait(JOIN_STEP)
+        if task.exc_info is not None:
+            raise task.exc_info[0], task.exc_info[1], task.exc_info[2]
+        return task.result
+
+    def resumed(self, name):
+        """Checks whether the task and all its executed dependencies were
+           found in the checkpoint files
+
+        """
+        task = self.tasks[name]
+        if task.resumed:
+            return True
+        return (task.probe is None and len(task.requires) > 0 and
+                all([self.resumed(required) for required in task.requires]))
@@ -18,10 +18,16 @@
 """
 from __future__ import absolute_import
 
+import os
 import sys
 import ast
 import gc
 
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
 import bigml.api
 
 import bigmler.utils as u
@@ -33,11 +39,15 @@ from bigml.model import Model
 from bigml.multimodel import MultiModel, read_votes
 from bigml.ensemble import Ensemble
 from bigml.util import localize, console_log, get_predictions_file_name
-from bigml.io import UnicodeWriter
+from bigml.io import UnicodeWriter, UnicodeReader
 from bigml.multivote import (PLURALITY_CODE, THRESHOLD_CODE, MultiVote,
                              ws_confidence)
 
 from bigmler.tst_reader import TstReader as TestReader
+from bigmler.writers import ResumableWriter
+from bigmler.cache import DiskCache, cache_key, account_key
+from bigmler.scheduler import (wait_for_resources, parallel_map,
+                               prefetched_map)
 from bigmler.resources import (FIELDS_QS, ALL_FIELDS_QS, BRIEF_FORMAT,
                                NORMAL_FORMAT, FULL_FORMAT)
 from bigmler.resources import create_batch_prediction
@@ -47,6 +57,7 @@ AGGREGATION = -1
 COMBINATION = -2
 COMBINATION_LABEL = 'combined'
 OTHER = "***** other *****"
+SLICE_VOTES = "slice%s_votes.json"
 
 
 def use_prediction_headers(prediction_headers, output, test_reader,
@@ -171,34 +182,104 @@ def prediction_to_row(prediction, prediction_info=NORMAL_FORMAT):
 
 def combine_votes(votes_files, to_prediction, to_file, method=0,
                   prediction_info=NORMAL_FORMAT, input_data_list=None,
-                  exclude=None):
+                  exclude=None, output=None, start=0):
     """Combines the votes found in the votes' files and stores predictions.
 
        votes_files: should contain the list of file names
        to_prediction: is the Model method that casts prediction to numeric
                       type if needed
        to_file: is the name of the final output file.
+       output: is the writer to be used instead of opening `to_file`.
+       start: is the first row to be written.
     """
     votes = read_votes(votes_files, to_prediction)
 
-    u.check_dir(to_file)
-    with UnicodeWriter(to_file) as output:
+    def write_votes(output):
+        """Writes the combined predictions from `start` on"""
         number_of_tests = len(votes)
-        if input_data_list is None or len(input_data_list) != number_of_tests:
-            input_data_list = None
-        for index in range(0, number_of_tests):
+        input_data_list_ = input_data_list
+        if (input_data_list_ is None or
+                len(input_data_list_) != number_of_tests):
+            input_data_list_ = None
+        for index in range(start, number_of_tests):
             multivote = votes[index]
-            input_data = (None if input_data_list is None
-                          else input_data_list[index])
+            input_data = (None if input_data_list_ is None
+                          else input_data_list_[index])
             write_prediction(multivote.combine(method, True), output,
                              prediction_info, input_data, exclude)
 
+    if output is not None:
+        write_votes(output)
+        return
+    u.check_dir(to_file)
+    with UnicodeWriter(to_file) as output:
+        write_votes(output)
+
+
+def prediction_cache(args):
+    """Opens the cache of remote predictions set in --prediction-cache, if any
+
+    """
+    if not args.prediction_cache:
+        return None
+    try:
+        return DiskCache(args.prediction_cache,
+                         ttl=args.prediction_cache_ttl,
+                         max_size=args.prediction_cache_size)
+    except OSError, exception:
+        sys.exit("Failed to open the predictions cache: %s" % str(exception))
+
+
+def prediction_key(resource_id, input_data, by_name, prediction_args, api):
+    """Key for a prediction in the cache. The account and domain of the api
+       are part of the key, so that a shared cache directory only returns
+       predictions made with the same account. Tags are excluded from the
+       key because they do not change the predicted value.
+
+    """
+    prediction_args = dict([(key, value) for key, value in
+                            prediction_args.items() if key != "tags"])
+    return cache_key(account_key(api), bigml.api.get_resource_id(resource_id),
+                     input_data, by_name, prediction_args)
+
+
+def create_remote_prediction(resource_id, input_data, by_name,
+                             prediction_args, api, log=None, cache=None):
+    """Creates a finished remote prediction, unless the same input data
+       was already predicted with the same model or ensemble and the
+       result is found in the predictions cache.
+
+    """
+    if cache is not None:
+        key = prediction_key(resource_id, input_data, by_name,
+                             prediction_args, api)
+        prediction = cache.get(key)
+        if prediction is not None:
+            return prediction
+    prediction = api.create_prediction(resource_id, input_data,
+                                       by_name=by_name,
+                                       wait_time=0,
+                                       args=prediction_args)
+    u.check_resource_error(prediction, "Failed to create prediction: ")
+    if bigml.api.get_status(prediction)['code'] != bigml.api.FINISHED:
+        prediction = u.check_resource(prediction, api.get_prediction)
+        u.check_resource_error(prediction, "Failed to create prediction: ")
+    u.log_message("%s\n" % prediction['resource'], log_file=log)
+    if cache is not None:
+        cache.set(key, {"resource": prediction['resource'],
+                        "object": prediction['object']})
+    return prediction
+
 
 def remote_predict_models(models, test_reader, prediction_file, api, args,
                           resume=False, output_path=None,
-                          session_file=None, log=None, exclude=None):
+                          session_file=None, log=None, exclude=None,
+                          output=None, start=0):
     """Retrieve predictions remotely, combine them and save predictions to file
 
+       The predictions of each model are stored in a file that can be
+       resumed row by row. The final predictions are written to `output`
+       from the `start` row on.
     """
     predictions_files = []
     prediction_args = {
@@ -212,53 +293,62 @@ def remote_predict_models(models, test_reader, prediction_file, api, args,
     raw_input_data_list = []
     for input_data in test_reader:
         raw_input_data_list.append(input_data)
+    number_of_tests = len(raw_input_data_list)
     single_model = len(models) == 1
-    if single_model:
-        prediction_file = UnicodeWriter(prediction_file).open_writer()
+    cache = prediction_cache(args)
     for model in models:
         model = bigml.api.get_model_id(model)
         predictions_file = get_predictions_file_name(model,
                                                      output_path)
         predictions_files.append(predictions_file)
-        if (not resume or
-                not c.checkpoint(c.are_predictions_created, predictions_file,
-                                 test_reader.number_of_tests(),
-                                 debug=args.debug)[0]):
-            if not message_logged:
+        # files of models that predicted all the rows are not written again
+        with ResumableWriter(predictions_file, resume=resume,
+                             expected_rows=number_of_tests) as \
+                predictions_writer:
+            model_start = predictions_writer.committed
+            if single_model and start < model_start:
+                # rows already predicted are copied from the model file
+                with UnicodeReader(predictions_file) as predictions_reader:
+                    for index, prediction_row in enumerate(
+                            predictions_reader):
+                        if index >= model_start:
+                            break
+                        if index >= start:
+                            write_prediction(
+                                prediction_row[0:2], output,
+                                args.prediction_info,
+                                raw_input_data_list[index], exclude)
+            if model_start < number_of_tests and not message_logged:
                 message = u.dated("Creating remote predictions.\n")
                 u.log_message(message, log_file=session_file,
                               console=args.verbosity)
-            message_logged = True
-            with UnicodeWriter(predictions_file) as predictions_file:
-                for input_data in raw_input_data_list:
-                    input_data_dict = test_reader.dict(input_data)
-                    prediction = api.create_prediction(model, input_data_dict,
-                                                       by_name=test_set_header,
-                                                       wait_time=0,
-                                                       args=prediction_args)
-                    u.check_resource_error(prediction,
-                                           "Failed to create prediction: ")
-                    u.log_message("%s\n" % prediction['resource'],
-                                  log_file=log)
-                    prediction_row = prediction_to_row(prediction)
-                    predictions_file.writerow(prediction_row)
-                    if single_model:
-                        write_prediction(prediction_row[0:2], prediction_file,
-                                         args.prediction_info,
-                                         input_data, exclude)
-    if single_model:
-        prediction_file.close_writer()
-    else:
+                message_logged = True
+            for index in range(model_start, number_of_tests):
+                input_data = raw_input_data_list[index]
+                input_data_dict = test_reader.dict(input_data)
+                prediction = create_remote_prediction(
+                    model, input_data_dict, test_set_header,
+                    prediction_args, api, log=log, cache=cache)
+                prediction_row = prediction_to_row(prediction)
+                predictions_writer.writerow(prediction_row)
+                if single_model and index >= start:
+                    write_prediction(prediction_row[0:2], output,
+                                     args.prediction_info,
+                                     input_data, exclude)
+    if not single_model:
         combine_votes(predictions_files,
                       Model(models[0]).to_prediction,
                       prediction_file, args.method,
-                      args.prediction_info, raw_input_data_list, exclude)
+                      args.prediction_info, raw_input_data_list, exclude,
+                      output=output, start=start)
 
 
 def remote_predict_ensemble(ensemble_id, test_reader, prediction_file, api,
                             args, resume=False, output_path=None,
-                            session_file=None, log=None, exclude=None):
-    """Retrieve predictions remotely and save predictions to file
+                            session_file=None, log=None, exclude=None,
+                            output=None, start=0):
+    """Retrieve predictions remotely and save predictions to `output` from
+       the `start` row on
 
     """
     prediction_args = {
@@ -269,35 +359,29 @@ def remote_predict_ensemble(ensemble_id, test_reader, prediction_file, api,
     if output_path is None:
         output_path = u.check_dir(prediction_file)
 
-    if (not resume or not c.checkpoint(
-            c.are_predictions_created, prediction_file,
-            test_reader.number_of_tests(), debug=args.debug)[0]):
+    if start < test_reader.number_of_tests():
         message = u.dated("Creating remote predictions.")
         u.log_message(message, log_file=session_file,
                       console=args.verbosity)
+        cache = prediction_cache(args)
 
-        with UnicodeWriter(prediction_file) as predictions_file:
-            for input_data in test_reader:
-                input_data_dict = test_reader.dict(input_data)
-                prediction = api.create_prediction(ensemble_id,
-                                                   input_data_dict,
-                                                   by_name=test_set_header,
-                                                   wait_time=0,
-                                                   args=prediction_args)
-                prediction = u.check_resource(prediction,
-                                              api.get_prediction)
-                u.check_resource_error(prediction,
-                                       "Failed to create prediction: ")
-                u.log_message("%s\n" % prediction['resource'], log_file=log)
-                prediction_row = prediction_to_row(prediction,
-                                                   args.prediction_info)
-                write_prediction(prediction_row, predictions_file,
-                                 args.prediction_info, input_data, exclude)
+        for index, input_data in enumerate(test_reader):
+            if index < start:
+                continue
+            input_data_dict = test_reader.dict(input_data)
+            prediction = create_remote_prediction(
+                ensemble_id, input_data_dict, test_set_header,
+                prediction_args, api, log=log, cache=cache)
+            prediction_row = prediction_to_row(prediction,
+                                               args.prediction_info)
+            write_prediction(prediction_row, output,
+                             args.prediction_info, input_data, exclude)
 
 
 def local_predict(models, test_reader, output, args, options=None,
-                  exclude=None):
+                  exclude=None, start=0):
     """Get local predictions and combine them to get a final prediction
+       for the test rows from `start` on
 
     """
     single_model = len(models) == 1
@@ -310,8 +394,10 @@ def local_predict(models, test_reader, output, args, options=None,
         local_model = Ensemble(models, max_models=args.max_batch_models)
         kwargs.update({"method": args.method, "options": options,
                        "median": args.median})
-    for input_data in test_reader:
-        input_data_dict = dict(zip(test_reader.raw_headers, input_data))
+    for index, input_data in enumerate(test_reader):
+        if index < start:
+            continue
+        input_data_dict = test_reader.model_input_data(input_data)
         prediction = local_model.predict(
             input_data_dict, **kwargs)
         if single_model and args.median and local_model.tree.regression:
@@ -325,17 +411,26 @@ def local_predict(models, test_reader, output, args, options=None,
 
 def retrieve_models_split(models_split, api, query_string=FIELDS_QS,
                           labels=None, multi_label_data=None, ordered=True,
-                          models_order=None):
+                          models_order=None, workers=1):
     """Returns a list of full model structures ready to be fed to the
        MultiModel object to produce predictions. Models are also stored
        locally in the output directory when the --store flag is used.
+       Up to `workers` models are downloaded in parallel.
 
     """
     complete_models = []
     if models_order is None:
         models_order = []
-    for index in range(len(models_split)):
-        model = models_split[index]
+    unfinished = [model for model in models_split
+                  if isinstance(model, basestring) or
+                  bigml.api.get_status(model)['code'] != bigml.api.FINISHED]
+    if len(unfinished) > 1:
+        # one listing query per poll for the whole split instead of
+        # waiting for each model in turn
+        wait_for_resources(api, unfinished, "model")
+
+    def get_finished_model(model):
+        """Retrieves the model if not finished"""
         if (isinstance(model, basestring) or
                 bigml.api.get_status(model)['code'] != bigml.api.FINISHED):
             try:
@@ -344,7 +439,11 @@ def retrieve_models_split(models_split, api, query_string=FIELDS_QS,
             except ValueError, exception:
                 sys.exit("Failed to get model: %s. %s" % (model,
                                                           str(exception)))
+        return model
 
+    # models are downloaded in parallel and processed in order as they
+    # arrive
+    for model in parallel_map(get_finished_model, models_split, workers):
         # When user selects the labels in multi-label predictions, we must
         # filter the models that will be used to predict
         if labels and multi_label_data:
@@ -450,14 +549,68 @@ def combine_multivote(multivote, other_label=OTHER):
     return prediction
 
 
+def slice_votes_file(output_path, index):
+    """Name of the file that stores the votes of a models slice
+
+    """
+    return os.path.join(output_path, SLICE_VOTES % index)
+
+
+def store_slice_votes(output_path, index, models_split, first_row, votes,
+                      models_order):
+    """Stores the votes of a models slice for the test rows from
+       `first_row` on, replacing the previous file atomically
+
+    """
+    votes_file_name = slice_votes_file(output_path, index)
+    slice_votes = {"models": [bigml.api.get_model_id(model)
+                              for model in models_split],
+                   "first_row": first_row,
+                   "models_order": models_order,
+                   "votes": [multivote.predictions for multivote in votes]}
+    try:
+        with open("%s.tmp" % votes_file_name, "w") as votes_file:
+            json.dump(slice_votes, votes_file)
+        if os.path.exists(votes_file_name):
+            os.remove(votes_file_name)
+        os.rename("%s.tmp" % votes_file_name, votes_file_name)
+    except (IOError, OSError), exception:
+        sys.exit("Failed to store the votes of the models: %s" %
+                 str(exception))
+
+
+def read_slice_votes(output_path, index, models_split, first_row, rows):
+    """Returns the stored votes and models order of a models slice if they
+       were computed with the same models and cover the test rows from
+       `first_row` on. Returns None otherwise.
+
+    """
+    try:
+        with open(slice_votes_file(output_path, index)) as votes_file:
+            slice_votes = json.load(votes_file)
+        models_ids = [bigml.api.get_model_id(model) for model in models_split]
+        offset = first_row - slice_votes["first_row"]
+        votes = slice_votes["votes"]
+        if (slice_votes["models"] != models_ids or offset < 0 or
+                len(votes) - offset != rows):
+            return None
+        return ([MultiVote(predictions) for predictions in votes[offset:]],
+                slice_votes["models_order"])
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
 def local_batch_predict(models, test_reader, prediction_file, api, args,
                         resume=False, output_path=None, output=None,
                         method=PLURALITY_CODE, options=None,
                         session_file=None, labels=None, ordered=True,
                         exclude=None, models_per_label=1, other_label=OTHER,
-                        multi_label_data=None):
+                        multi_label_data=None, start=0):
 
     """Get local predictions form partial Multimodel, combine and save to file
+       the predictions for the test rows from `start` on. The votes of each
+       models slice are stored in the output directory, so that finished
+       slices are neither retrieved nor used to predict again when resuming.
 
     """
 
@@ -488,26 +641,47 @@ def local_batch_predict(models, test_reader, prediction_file, api, args,
     raw_input_data_list = []
     for input_data in test_reader:
         raw_input_data_list.append(input_data)
+    first_row = 0
+    if args.fast:
+        # no per-model files are kept: only the remaining rows are predicted
+        raw_input_data_list = raw_input_data_list[start:]
+        first_row, start = start, 0
     total_votes = []
     models_order = []
     models_count = 0
     single_model = models_total == 1
     query_string = FIELDS_QS if single_model else ALL_FIELDS_QS
-    # processing the models in slots
-    for models_split in models_splits:
+
+    def retrieve_split(index):
+        """Retrieves the full models allowed by --max-batch-models to be used
+           in a multimodel slot, or the votes stored for the slot when
+           resuming
+
+        """
+        models_split = models_splits[index]
         if resume:
+            slice_votes = read_slice_votes(output_path, index, models_split,
+                                           first_row,
+                                           len(raw_input_data_list))
+            if slice_votes is not None:
+                return None, slice_votes[1], slice_votes[0]
             for model in models_split:
                 pred_file = get_predictions_file_name(model,
                                                       output_path)
                 c.checkpoint(c.are_predictions_created,
                              pred_file,
                              test_reader.number_of_tests(), debug=args.debug)
-        # retrieving the full models allowed by --max-batch-models to be used
-        # in a multimodel slot
-        complete_models, models_order = retrieve_models_split(
+        complete_models, split_order = retrieve_models_split(
             models_split, api, query_string=query_string, labels=labels,
             multi_label_data=multi_label_data, ordered=ordered,
-            models_order=models_order)
+            models_order=[], workers=args.max_parallel_downloads)
+        return complete_models, split_order, None
+
+    # processing the models in slots. The models in the next slot are
+    # downloaded while predicting with the current one
+    for index, (complete_models, split_order, votes) in enumerate(
+            prefetched_map(retrieve_split, range(len(models_splits)))):
+        models_order.extend(split_order)
 
         # predicting with the multimodel slot
         if complete_models:
@@ -529,6 +703,9 @@ def local_batch_predict(models, test_reader, prediction_file, api, args,
             # predictions
             if not args.fast:
                 votes = local_model.batch_votes(output_path)
+            store_slice_votes(output_path, index, models_splits[index],
+                              first_row, votes, split_order)
+        if votes:
             models_count += max_models
             if models_count > models_total:
                 models_count = models_total
@@ -536,9 +713,9 @@ def local_batch_predict(models, test_reader, prediction_file, api, args,
                 draw_progress_bar(models_count, models_total)
 
             if total_votes:
-                for index in range(0, len(votes)):
-                    predictions = total_votes[index]
-                    predictions.extend(votes[index].predictions)
+                for row_index in range(0, len(votes)):
+                    predictions = total_votes[row_index]
+                    predictions.extend(votes[row_index].predictions)
             else:
                 total_votes = votes
 
@@ -547,7 +724,7 @@ def local_batch_predict(models, test_reader, prediction_file, api, args,
         u.log_message(message, log_file=session_file, console=args.verbosity)
 
     # combining the votes to issue the final prediction for each input data
-    for index in range(0, len(total_votes)):
+    for index in range(start, len(total_votes)):
         multivote = total_votes[index]
         input_data = raw_input_data_list[index]
 
@@ -595,11 +772,15 @@ def predict(models, fields, args, api=None, log=None,
 
     prediction_file = output
     output_path = u.check_dir(output)
-    with UnicodeWriter(output) as output:
+    # when resuming, the predictions file is truncated to the last committed
+    # row and predictions go on from the next test row
+    with ResumableWriter(output, resume=resume) as output:
+        header_rows = 1 if args.prediction_header else 0
+        start = max(output.committed - header_rows, 0)
         # columns to exclude if input_data is added to the prediction field
         exclude = use_prediction_headers(
-            args.prediction_header, output, test_reader, fields, args,
-            objective_field)
+            args.prediction_header and output.committed == 0, output,
+            test_reader, fields, args, objective_field)
 
         # Remote predictions: predictions are computed in bigml.com and stored
         # in a file named after the model in the following syntax:
@@ -613,11 +794,12 @@ def predict(models, fields, args, api=None, log=None,
                 remote_predict_ensemble(args.ensemble, test_reader,
                                         prediction_file, api, args, resume,
                                         output_path, session_file, log,
-                                        exclude)
+                                        exclude, output=output, start=start)
             else:
                 remote_predict_models(models, test_reader, prediction_file,
                                       api, args, resume, output_path,
-                                      session_file, log, exclude)
+                                      session_file, log, exclude,
+                                      output=output, start=start)
             return
         # Local predictions: Predictions are computed locally using models'
         # rules with MultiModel's predict method
@@ -636,7 +818,8 @@ def predict(models, fields, args, api=None, log=None,
         if (len(models) <= args.max_batch_models and args.fast and
                 not args.multi_label and args.max_categories == 0
                 and args.method != COMBINATION):
-            local_predict(models, test_reader, output, args, options, exclude)
+            local_predict(models, test_reader, output, args, options, exclude,
+                          start=start)
         # For large numbers of models, we split the list of models in chunks
         # and build a MultiModel for each chunk, issue and store predictions
         # for each model and combine all of them eventually.
@@ -669,7 +852,8 @@ def predict(models, fields, args, api=None, log=None,
                                 ordered=ordered, exclude=exclude,
                                 models_per_label=models_per_label,
                                 other_label=other_label,
-                                multi_label_data=multi_label_data)
+                                multi_label_data=multi_label_data,
+                                start=start)
     test_reader.close()
 
 
@@ -32,6 +32,8 @@ from bigml.multivote import COMBINATION_WEIGHTS, COMBINER_MAP
 from bigml.tree import LAST_PREDICTION, PROPORTIONAL
 
 from bigmler.resources import ADD_REMOVE_PREFIX
+from bigmler.connection import use_connection_pool, DEFAULT_POOL_SIZE
+from bigmler.cache import ResourceCache
 from bigmler.prediction import FULL_FORMAT, COMBINATION, COMBINATION_LABEL
 from bigmler.train_reader import AGGREGATES
 from bigmler.utils import PYTHON3
@@ -234,7 +236,19 @@ def get_api_instance(command_args, storage_path):
     if command_args.store:
         api_command_args.update({'storage': storage_path})
 
-    return bigml.api.BigML(**api_command_args)
+    # all the api instances in the process share the keep-alive connections
+    use_connection_pool(getattr(command_args, 'connection_pool_size',
+                                DEFAULT_POOL_SIZE),
+                        debug=command_args.debug)
+    api = bigml.api.BigML(**api_command_args)
+    if getattr(command_args, 'resource_cache', None):
+        try:
+            ResourceCache(command_args.resource_cache,
+                          command_args.resource_cache_size).install(api)
+        except OSError, exception:
+            sys.exit("Failed to open the resource cache: %s" %
+                     str(exception))
+    return api
 
 
 def get_output_args(api, command_args, resume):
@@ -27,11 +27,13 @@ import bigml.api
 import bigmler.utils as u
 import bigmler.resources as r
 import bigmler.checkpoint as c
+import bigmler.processing.projects as pp
 
 from bigml.fields import Fields
 from bigml.predicate import TM_FULL_TERM
 
 from bigmler.prediction import OTHER
+from bigmler.scheduler import parallel_map
 
 
 MAX_CATEGORIES_RE = re.compile(r'max_categories: (\d+)')
@@ -306,6 +308,7 @@ def create_categories_datasets(dataset, distribution,
             u.log_message(message, log_file=session_file,
                           console=args.verbosity)
     if not resume:
+        dataset_args_list = []
         for i in range(len(datasets), number_of_datasets):
             split = categories_splits[i]
             category_selector = "(if (or"
@@ -327,15 +330,111 @@ def create_categories_datasets(dataset, distribution,
                      "other_label": other_label}}
             except ValueError, exc:
                 sys.exit(exc)
-            new_dataset = r.create_dataset(
-                dataset, dataset_args, args, api=api, path=path,
-                session_file=session_file, log=log, dataset_type="parts")
-            new_dataset = bigml.api.check_resource(new_dataset,
-                                                   api.get_dataset)
-            datasets.append(new_dataset)
+            dataset_args_list.append(dataset_args)
+        # the datasets found when resuming may still be in progress
+        datasets = r.create_datasets(
+            dataset, dataset_args_list, args, api=api, path=path,
+            session_file=session_file, log=log, dataset_type="parts",
+            dataset_ids=datasets)
     return datasets, resume
 
 
+def multi_file_processing(training_files, api, args, resume,
+                          csv_properties=None, pin_types=False,
+                          session_file=None, path=None, log=None):
+    """Creating a source and a dataset for each training file. Up to
+       --max-parallel-uploads files are processed at a time, and each file
+       has its own checkpoint files. The datasets are to be joined in a
+       multi-dataset. When `pin_types` is set (the files are chunks of the
+       same file), all the sources use the field types of the first one.
+
+    """
+    if csv_properties is None:
+        csv_properties = {}
+    message = u.dated("Creating sources and datasets for %s training"
+                      " files.\n" % len(training_files))
+    u.log_message(message, log_file=session_file, console=args.verbosity)
+    args.project_id = pp.project_processing(
+        api, args, resume, session_file=session_file, path=path, log=log)
+    source_args = r.set_source_args(args, data_set_header=args.train_header)
+
+    def file_source(index):
+        """Returns the finished source for the index-th file, created or
+           found in the checkpoint files, with the user updates applied
+
+        """
+        suffix = "file%s" % index
+        done = False
+        if resume:
+            done, source = c.checkpoint(
+                c.is_source_created, path, suffix="_%s" % suffix,
+                debug=args.debug)
+        if not done:
+            source = r.create_source(training_files[index], source_args,
+                                     args, api, path, session_file, log,
+                                     source_type=suffix)
+        source = r.get_source(source, api, args.verbosity, session_file)
+        if (args.field_attributes_ or args.types_ or args.user_locale
+                or args.json_args.get('source')):
+            fields = Fields(source['object']['fields'], **csv_properties)
+            source_update_args = r.set_source_args(args, fields=fields)
+            # avoid updating project_id in source
+            source_update_args.pop("project", None)
+            source = r.update_source(source, source_update_args, args, api,
+                                     session_file)
+        return source
+
+    sources = {}
+    pinned_types = None
+    if pin_types:
+        # types inferred for the first chunk are used in all of them, as
+        # a source built from the whole file would do
+        sources[0] = file_source(0)
+        pinned_types = dict(
+            (field_id, field['optype']) for field_id, field in
+            sources[0]['object']['fields'].items())
+
+    def file_dataset(index):
+        """Returns the dataset id for the index-th file and whether it was
+           found in the checkpoint files
+
+        """
+        suffix = "file%s" % index
+        if resume:
+            done, dataset_id = c.checkpoint(
+                c.is_dataset_created, path, suffix="_%s" % suffix,
+                debug=args.debug)
+            if done:
+                return dataset_id, True
+        source = sources.get(index) or file_source(index)
+        if pinned_types is not None:
+            changed_types = dict(
+                (field_id, {"optype": pinned_types[field_id]}) for
+                field_id, field in source['object']['fields'].items()
+                if field_id in pinned_types and
+                field['optype'] != pinned_types[field_id])
+            if changed_types:
+                source = r.update_source(source, {"fields": changed_types},
+                                         args, api, session_file)
+        fields = Fields(source['object']['fields'], **csv_properties)
+        dataset_args = r.set_dataset_args(args, fields)
+        dataset = r.create_dataset(source, dataset_args, args, api, path,
+                                   session_file, log, dataset_type=suffix)
+        return dataset['resource'], False
+
+    datasets = []
+    for dataset_id, resumed in parallel_map(file_dataset,
+                                            range(len(training_files)),
+                                            args.max_parallel_uploads):
+        datasets.append(dataset_id)
+        resume = resume and resumed
+    dataset = r.get_dataset(datasets[0], api, args.verbosity, session_file)
+    fields = get_fields_structure(dataset, csv_properties)
+    # the datasets are joined in a multi-dataset
+    args.multi_dataset = True
+    return datasets, resume, csv_properties, fields
+
+
 def create_new_dataset(datasets, api, args, resume, fields=None,
                        session_file=None, path=None, log=None):
     """Generates a new dataset using the generators given in a generators file
@@ -58,6 +58,10 @@ def ensemble_processing(datasets, api, args, resume,
             datasets, ensembles, ensemble_args, args, api=api, path=path,
             number_of_ensembles=number_of_ensembles,
             session_file=session_file, log=log)
+    else:
+        # all the ensembles were found when resuming
+        models, model_ids = r.retrieve_ensembles_models(
+            ensembles, api, workers=args.max_parallel_downloads)
     return ensembles, ensemble_ids, models, model_ids, resume
 
 
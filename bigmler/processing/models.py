@@ -28,6 +28,8 @@ import bigmler.checkpoint as c
 
 from bigml.fields import Fields, DEFAULT_MISSING_TOKENS
 
+from bigmler.scheduler import parallel_map
+
 from bigmler.processing.ensembles import (ensemble_processing,
                                           ensemble_per_label)
 
@@ -175,8 +177,9 @@ def models_processing(datasets, models, model_ids,
                                        "tags__in=%s" % args.ensemble_tag))
         else:
             ensemble_ids = u.read_resources(args.ensembles)
-        for ensemble_id in ensemble_ids:
-            ensemble = r.get_ensemble(ensemble_id, api)
+        get_ensemble = lambda ensemble_id: r.get_ensemble(ensemble_id, api)
+        for ensemble_id, ensemble in zip(ensemble_ids, parallel_map(
+                get_ensemble, ensemble_ids, args.max_parallel_downloads)):
             if args.ensemble is None:
                 args.ensemble = ensemble_id
             model_ids.extend(ensemble['object']['models'])
@@ -20,7 +20,9 @@
 from __future__ import absolute_import
 
 import os
+import sys
 import csv
+import glob
 from zipfile import ZipFile, ZIP_DEFLATED
 
 import bigml.api
@@ -35,6 +37,30 @@ from bigml.util import bigml_locale
 from bigmler.train_reader import TrainReader
 
 MONTECARLO_FACTOR = 200
+GLOB_CHARS = "*?["
+
+
+def training_files(args):
+    """Returns the list of local files given in --train as a glob pattern or
+       as a list of file names separated by --args-separator. Other values
+       are returned as a single element list.
+
+    """
+    training_set = args.training_set
+    if not isinstance(training_set, basestring) or "://" in training_set \
+            or os.path.isfile(training_set):
+        return [training_set]
+    if any([char in training_set for char in GLOB_CHARS]):
+        files = sorted(glob.glob(training_set))
+        if not files:
+            sys.exit("No training files found for %s" % training_set)
+        return files
+    files = [file_name.strip() for file_name in
+             training_set.split(args.args_separator)]
+    if len(files) > 1 and all([os.path.isfile(file_name)
+                               for file_name in files]):
+        return files
+    return [training_set]
 
 
 def test_source_processing(api, args, resume,
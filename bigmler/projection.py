@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Client-side pruning of the training file before uploading it
+
+   When the model only uses some of the columns in the training file, or
+   a single model is built from a sample of its rows, the file can be
+   reduced locally before uploading it. The training file is streamed
+   through a projection (the model fields and the objective field, in
+   their original order) and a seeded Bernoulli sampler into a gzipped
+   file. This is only done when a source is created from the local file
+   and no other step in the command needs the dropped columns or rows.
+
+"""
+from __future__ import absolute_import
+
+import os
+import csv
+import gzip
+import random
+
+from bigmler.utils import decode2, dated, log_message
+from bigmler.resources import ADD_REMOVE_PREFIX, SEED, data_to_source
+from bigmler.compression import COMPRESSED_EXTENSIONS
+
+
+# arguments that need the columns or rows of the original file
+CONFLICTING_ARGS = [
+    "multi_label", "evaluate", "cross_validation_rate", "max_categories",
+    "test_split", "dataset_fields", "json_filter", "lisp_filter",
+    "new_fields", "field_attributes_", "types_", "weight_field",
+    "source_attributes", "dataset_attributes", "no_model", "test_datasets",
+    "dataset_off"]
+
+
+def projection_allowed(args):
+    """Checks that a source is to be created from the training file, that
+       it is a local CSV file with headers and that no other option needs
+       its full contents
+
+    """
+    training_set = args.training_set
+    if (not isinstance(training_set, basestring) or
+            not os.path.isfile(training_set) or not args.train_header or
+            data_to_source(args)[0] != training_set):
+        return False
+    extension = os.path.splitext(training_set)[1].lower()
+    if extension in COMPRESSED_EXTENSIONS:
+        return False
+    if any([getattr(args, arg, None) for arg in CONFLICTING_ARGS]):
+        return False
+    json_args = getattr(args, "json_args", {})
+    return not json_args.get("source") and not json_args.get("dataset")
+
+
+def client_sampling(args):
+    """Checks whether rows can be sampled locally: only a single model
+       is built by sampling without replacement
+
+    """
+    return (args.sample_rate < 1 and args.number_of_models == 1 and
+            not args.replacement)
+
+
+def projected_columns(headers, args):
+    """Returns the column numbers of the objective and model fields, in
+       their original order, or None if any of them cannot be found in the
+       headers. Objective fields given by column number must keep their
+       position.
+
+    """
+    objective = args.objective_field
+    if objective is None:
+        objective = len(headers) - 1
+    elif not isinstance(objective, int):
+        if objective not in headers:
+            return None
+        objective = headers.index(objective)
+    if objective < 0 or objective >= len(headers):
+        return None
+    model_fields = args.model_fields_
+    if not model_fields:
+        return range(len(headers))
+    if any([name[0] in ADD_REMOVE_PREFIX for name in model_fields]):
+        return None
+    columns = [objective]
+    for name in model_fields:
+        if name not in headers:
+            return None
+        column = headers.index(name)
+        if column not in columns:
+            columns.append(column)
+    columns.sort()
+    if (isinstance(args.objective_field, int) and
+            columns.index(objective) != objective):
+        return None
+    return columns
+
+
+def write_projection(reader, output_file, headers, columns, separator, args,
+                     sampling):
+    """Writes the selected columns of the rows read by `reader`, sampled if
+       needed, to a gzipped file. The file is written under a temporary
+       name and renamed when complete, so that only complete files are
+       reused when resuming.
+
+    """
+    # the same seed produces the same sample
+    sampler = random.Random(SEED if args.seed is None else args.seed)
+    tmp_file = "%s.tmp" % output_file
+    output_handler = gzip.open(tmp_file, "wb")
+    try:
+        writer = csv.writer(output_handler, delimiter=separator,
+                            lineterminator="\n")
+        writer.writerow([headers[column] for column in columns])
+        for row in reader:
+            if sampling and sampler.random() >= args.sample_rate:
+                continue
+            writer.writerow([row[column] if column < len(row) else ""
+                             for column in columns])
+    finally:
+        output_handler.close()
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    os.rename(tmp_file, output_file)
+
+
+def project_training_set(args, path, resume=False, session_file=None):
+    """Writes the columns and rows of the training file needed to build the
+       model to a gzipped file and returns its name. The original name is
+       returned when the file cannot be reduced. When resuming, the file
+       written by the previous run is used.
+
+    """
+    if not args.prune_upload or not projection_allowed(args):
+        return args.training_set
+    sampling = client_sampling(args)
+    if not args.model_fields_ and not sampling:
+        return args.training_set
+    separator = ","
+    if args.training_separator is not None:
+        separator = decode2(args.training_separator,
+                            encoding="string_escape")
+    output_file = "%s%spruned_%s.gz" % (
+        path, os.sep, os.path.basename(args.training_set))
+    with open(args.training_set, "rb") as input_file:
+        reader = csv.reader(input_file, delimiter=separator)
+        try:
+            headers = reader.next()
+        except StopIteration:
+            return args.training_set
+        columns = projected_columns(headers, args)
+        if columns is None:
+            return args.training_set
+        if (len(columns) < len(headers) and args.test_set and
+                not args.test_header):
+            # test rows with no headers are matched to the fields by
+            # position, so no column can be dropped
+            if not sampling:
+                return args.training_set
+            columns = range(len(headers))
+        if not (resume and os.path.exists(output_file)):
+            message = dated("Pruning the training file before uploading"
+                            " it.\n")
+            log_message(message, log_file=session_file,
+                        console=args.verbosity)
+            write_projection(reader, output_file, headers, columns,
+                             separator, args, sampling)
+    if sampling:
+        args.sample_rate = 1.0
+    return output_file
@@ -33,6 +33,7 @@ import bigml.api
 
 from bigmler.utils import is_shared, check_dir, get_url, log_created_resources
 from bigmler.options.analyze import OPTIMIZE_OPTIONS
+from bigmler.log_writer import flush_logs
 
 
 URL_TEMPLATE = "%%BIGML_%s%%"
@@ -306,6 +307,7 @@ def get_command_line(path):
     """Retrieving command line from the session file in the directory
 
     """
+    flush_logs()
     try:
         command_file = os.path.join(path, SESSION_FILE)
         with open(command_file) as command_file:
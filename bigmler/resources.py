@@ -18,8 +18,9 @@
 """
 from __future__ import absolute_import
 
+import os
 import sys
-import time
+import hashlib
 
 try:
     import simplejson as json
@@ -33,8 +34,14 @@ from bigmler.utils import (dated, get_url, log_message, plural, check_resource,
                            decode2,
                            is_shared, FILE_ENCODING, PYTHON3)
 from bigmler.labels import label_model_args, get_all_labels
+from bigmler.scheduler import (CompletionScheduler, create_in_window,
+                               concurrency_controller, parallel_map)
 from bigmler.reports import report
+from bigmler.journal import get_journal
+from bigmler.cache import DiskCache, cache_key, account_key
+from bigmler.compression import upload_file, remove_compression
 from bigml.util import bigml_locale
+from bigml.bigmlconnection import HTTP_OK
 
 
 EVALUATE_SAMPLE_RATE = 0.8
@@ -42,6 +49,9 @@ SEED = "BigML, Machine Learning made easy"
 LOCALE_DEFAULT = "en_US"
 FIELDS_QS = 'only_model=true'
 ALL_FIELDS_QS = "limit=-1"
+# arguments that don't change the contents of sources and datasets
+NON_CONTENT_ARGS = ["name", "tags", "description", "category"]
+DIGEST_BLOCK = 1024 * 1024
 ADD_PREFIX = '+'
 REMOVE_PREFIX = '-'
 ADD_REMOVE_PREFIX = [ADD_PREFIX, REMOVE_PREFIX]
@@ -169,33 +179,6 @@ def relative_input_fields(fields, user_given_fields):
     return input_fields
 
 
-def wait_for_available_tasks(inprogress, max_parallel, api,
-                             resource_type, wait_step=2):
-    """According to the max_parallel number of parallel resources to be
-       created, when the number of in progress resources reaches the limit,
-       it checks the ones in inprogress to see if there's a
-       FINISHED or FAULTY resource. If found, it is removed from the
-       inprogress list and returns to allow another one to be created.
-
-    """
-
-    check_kwargs = {"retries": 0, "query_string": "full=false", "api": api}
-    while len(inprogress) == max_parallel:
-        for j in range(0, len(inprogress)):
-            try:
-                ready = check_resource(inprogress[j], **check_kwargs)
-                status = bigml.api.get_status(ready)
-                if status['code'] == bigml.api.FINISHED:
-                    del inprogress[j]
-                    return
-                elif status['code'] == bigml.api.FAULTY:
-                    raise ValueError(status['message'])
-            except ValueError, exception:
-                sys.exit("Failed to get a finished %s: %s" %
-                         (resource_type, str(exception)))
-        time.sleep(max_parallel * wait_step)
-
-
 def set_source_args(args, name=None, multi_label_data=None,
                     data_set_header=None, fields=None):
     """Returns a source arguments dict
@@ -255,18 +238,122 @@ def set_source_args(args, name=None, multi_label_data=None,
     return source_args
 
 
+def content_index(args):
+    """Returns the index of sources and datasets by content if
+       --reuse-by-content is used
+
+    """
+    if not getattr(args, 'reuse_by_content', False):
+        return None
+    try:
+        return DiskCache(args.content_index, ttl=None, max_size=None)
+    except OSError, exception:
+        sys.exit("Failed to open the content index: %s" % str(exception))
+
+
+def file_digest(file_name):
+    """Hash of the contents of a file, read in blocks
+
+    """
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as content_file:
+        block = content_file.read(DIGEST_BLOCK)
+        while block:
+            digest.update(block)
+            block = content_file.read(DIGEST_BLOCK)
+    return digest.hexdigest()
+
+
+def content_key(resource_type, origin, resource_args, api, args):
+    """Key for a resource in the content index built from its origin (the
+       file digest or the origin resource id), the arguments that change
+       its contents and the account, domain and project it belongs to
+
+    """
+    content_args = dict([(key, value) for key, value in
+                         resource_args.items()
+                         if key not in NON_CONTENT_ARGS])
+    return cache_key(resource_type, origin, content_args, account_key(api),
+                     getattr(args, 'project_id', None))
+
+
+def updated_source(args):
+    """Checks whether the sources are updated after being created, so that
+       they cannot be reused by content
+
+    """
+    return bool(getattr(args, 'field_attributes_', None) or
+                getattr(args, 'types_', None) or
+                getattr(args, 'json_args', {}).get('source'))
+
+
+def updated_dataset(args):
+    """Checks whether the datasets are updated after being created, so that
+       they cannot be reused by content
+
+    """
+    return bool(getattr(args, 'dataset_attributes', None) or
+                getattr(args, 'shared_flag', False) or
+                ((getattr(args, 'max_categories', 0) > 0 or
+                  getattr(args, 'multi_label', False)) and
+                 getattr(args, 'objective_field', None)))
+
+
+def reusable_resource(index, key, get_method):
+    """Returns the resource stored in the content index for `key` if it is
+       still finished in BigML. The stale entries are removed.
+
+    """
+    resource_id = index.get(key)
+    if resource_id is None:
+        return None
+    resource = get_method(resource_id, query_string=ALL_FIELDS_QS)
+    if (resource['code'] == HTTP_OK and
+            bigml.api.get_status(resource)['code'] == bigml.api.FINISHED):
+        return resource
+    index.remove(index.entry_path(key))
+    return None
+
+
 def create_source(data_set, source_args, args, api=None, path=None,
                   session_file=None, log=None, source_type=None):
-    """Creates remote source
+    """Creates remote source. When using --reuse-by-content, a source
+       previously created from the same file contents and arguments is
+       reused.
 
     """
     if api is None:
         api = bigml.api.BigML()
     suffix = "" if source_type is None else "%s " % source_type
+    index = content_index(args)
+    key = None
+    if (index is not None and isinstance(data_set, basestring) and
+            os.path.isfile(data_set) and not updated_source(args)):
+        key = content_key("source", file_digest(data_set), source_args,
+                          api, args)
+        source = reusable_resource(index, key, api.get_source)
+        if source is not None:
+            message = dated("Reusing %ssource: %s\n" %
+                            (suffix, get_url(source)))
+            log_message(message, log_file=session_file,
+                        console=args.verbosity)
+            if path is not None:
+                log_created_resources(
+                    "source%s" % ("_" + source_type if source_type else ""),
+                    path, source['resource'], mode='a',
+                    comment=("%s\n" % source['object']['name']))
+            return source
+    uploaded_file = data_set
+    if getattr(args, 'compress_uploads', False):
+        uploaded_file = upload_file(data_set, path)
     message = dated("Creating %ssource.\n" % suffix)
     log_message(message, log_file=session_file, console=args.verbosity)
-    source = api.create_source(data_set, source_args,
-                               progress_bar=args.progress_bar)
+    try:
+        source = api.create_source(uploaded_file, source_args,
+                                   progress_bar=args.progress_bar)
+    finally:
+        if uploaded_file != data_set:
+            remove_compression(data_set)
     if path is not None:
         suffix = "_" + source_type if source_type else ""
         log_created_resources(
@@ -279,6 +366,8 @@ def create_source(data_set, source_args, args, api=None, path=None,
                                 query_string=ALL_FIELDS_QS)
     except ValueError, exception:
         sys.exit("Failed to get a finished source: %s" % str(exception))
+    if key is not None:
+        index.set(key, source_id)
     message = dated("Source created: %s\n" % get_url(source))
     log_message(message, log_file=session_file, console=args.verbosity)
     log_message("%s\n" % source_id, log_file=log)
@@ -421,15 +510,32 @@ def set_dataset_split_args(name, description, args, sample_rate,
 
 def create_dataset(origin_resource, dataset_args, args, api=None,
                    path=None, session_file=None, log=None, dataset_type=None):
-    """Creates remote dataset from source, dataset, cluster or datasets list
+    """Creates remote dataset from source, dataset, cluster or datasets list.
+       When using --reuse-by-content, a dataset previously created from the
+       same origin resource and arguments is reused.
 
     """
     if api is None:
         api = bigml.api.BigML()
+    suffix = "_" + dataset_type if dataset_type else ""
+    index = content_index(args)
+    key = None
+    if (index is not None and not isinstance(origin_resource, list) and
+            not updated_dataset(args)):
+        key = content_key("dataset",
+                          bigml.api.get_resource_id(origin_resource),
+                          dataset_args, api, args)
+        dataset = reusable_resource(index, key, api.get_dataset)
+        if dataset is not None:
+            message = dated("Reusing dataset: %s\n" % get_url(dataset))
+            log_message(message, log_file=session_file,
+                        console=args.verbosity)
+            log_created_resources("dataset%s" % suffix, path,
+                                  dataset['resource'], mode='a')
+            return dataset
     message = dated("Creating dataset.\n")
     log_message(message, log_file=session_file, console=args.verbosity)
     dataset = api.create_dataset(origin_resource, dataset_args, retries=None)
-    suffix = "_" + dataset_type if dataset_type else ""
     log_created_resources("dataset%s" % suffix, path,
                           bigml.api.get_dataset_id(dataset), mode='a')
     dataset_id = check_resource_error(dataset, "Failed to create dataset: ")
@@ -438,6 +544,8 @@ def create_dataset(origin_resource, dataset_args, args, api=None,
                                  query_string=ALL_FIELDS_QS)
     except ValueError, exception:
         sys.exit("Failed to get a finished dataset: %s" % str(exception))
+    if key is not None:
+        index.set(key, dataset_id)
     message = dated("Dataset created: %s\n" % get_url(dataset))
     log_message(message, log_file=session_file, console=args.verbosity)
     log_message("%s\n" % dataset_id, log_file=log)
@@ -446,6 +554,44 @@ def create_dataset(origin_resource, dataset_args, args, api=None,
     return dataset
 
 
+def create_datasets(origin_resource, dataset_args_list, args, api=None,
+                    path=None, session_file=None, log=None,
+                    dataset_type=None, dataset_ids=None):
+    """Creates remote datasets from the same origin resource, keeping up to
+       --max-parallel-datasets of them in progress. The ids in `dataset_ids`
+       belong to previously created datasets that are also waited for.
+
+    """
+    if api is None:
+        api = bigml.api.BigML()
+    dataset_ids = [] if dataset_ids is None else dataset_ids[:]
+    message = dated("Creating %s.\n" % plural("dataset",
+                                               len(dataset_args_list)))
+    log_message(message, log_file=session_file, console=args.verbosity)
+    suffix = "_" + dataset_type if dataset_type else ""
+    scheduler = CompletionScheduler(
+        api, args.max_parallel_datasets, "dataset",
+        controller=concurrency_controller(args, path),
+        journal=get_journal(path))
+    for dataset_id in dataset_ids:
+        scheduler.add(dataset_id)
+    for dataset_args in dataset_args_list:
+        scheduler.wait_for_slot()
+        dataset = scheduler.create(api.create_dataset, origin_resource,
+                                   dataset_args, retries=None)
+        dataset_id = check_resource_error(dataset,
+                                          "Failed to create dataset: ")
+        log_created_resources("dataset%s" % suffix, path, dataset_id,
+                              mode='a')
+        log_message("%s\n" % dataset_id, log_file=log)
+        dataset_ids.append(dataset_id)
+        scheduler.add(dataset)
+    for dataset_id in scheduler.as_completed():
+        message = dated("Dataset created: %s\n" % get_url(dataset_id))
+        log_message(message, log_file=session_file, console=args.verbosity)
+    return dataset_ids
+
+
 def get_dataset(dataset, api=None, verbosity=True, session_file=None):
     """Retrieves the dataset in its actual state
 
@@ -649,35 +795,50 @@ def create_models(datasets, model_ids, model_args,
             # the entire field structure to be used as reference.
             query_string = (FIELDS_QS if single_model and args.test_header
                             else ALL_FIELDS_QS)
-            inprogress = []
-            for i in range(0, args.number_of_models):
-                wait_for_available_tasks(inprogress, args.max_parallel_models,
-                                         api, "model")
-                if model_args_list:
-                    model_args = model_args_list[i]
+            scheduler = CompletionScheduler(
+                api, args.max_parallel_models, "model",
+                controller=concurrency_controller(args, path),
+                journal=get_journal(path))
+
+            def new_model(index):
+                """Creates the index-th model in the list"""
+                index_args = (model_args_list[index] if model_args_list
+                              else model_args)
                 if args.cross_validation_rate > 0:
-                    new_seed = get_basic_seed(i + existing_models)
-                    model_args.update(seed=new_seed)
+                    new_seed = get_basic_seed(index + existing_models)
+                    index_args = dict(index_args, seed=new_seed)
                 # one model per dataset (--max-categories or single model)
                 if (args.max_categories > 0 or
                         (args.test_datasets and args.evaluate)):
-                    dataset = datasets[i]
-                    model = api.create_model(dataset, model_args, retries=None)
+                    return scheduler.create(api.create_model,
+                                            datasets[index], index_args,
+                                            retries=None)
                 elif args.dataset_off and args.evaluate:
                     multi_dataset = args.test_dataset_ids[:]
-                    del multi_dataset[i + existing_models]
-                    model = api.create_model(multi_dataset, model_args,
-                                             retries=None)
-                else:
-                    model = api.create_model(datasets, model_args,
-                                             retries=None)
+                    del multi_dataset[index + existing_models]
+                    return scheduler.create(api.create_model, multi_dataset,
+                                            index_args, retries=None)
+                return scheduler.create(api.create_model, datasets,
+                                        index_args, retries=None)
+
+            def model_created(model):
+                """Logs the model as soon as its creation call returns"""
+                if model.get('resource') is not None:
+                    log_created_resources("models", path, model['resource'],
+                                          mode='a')
+
+            # creation calls run concurrently, but the models are logged in
+            # the order of the arguments list (the order of labels in
+            # multi-label models)
+            for model in create_in_window(scheduler, new_model,
+                                          args.number_of_models,
+                                          created=model_created):
                 model_id = check_resource_error(model,
                                                 "Failed to create model: ")
                 log_message("%s\n" % model_id, log_file=log)
                 model_ids.append(model_id)
-                inprogress.append(model_id)
+                scheduler.add(model)
                 models.append(model)
-                log_created_resources("models", path, model_id, mode='a')
 
             if args.number_of_models < 2 and args.verbosity:
                 if bigml.api.get_status(model)['code'] != bigml.api.FINISHED:
@@ -766,23 +927,26 @@ def get_models(model_ids, args, api=None, session_file=None):
                      get_url(model_id)))
     log_message(message, log_file=session_file, console=args.verbosity)
     if len(model_ids) < args.max_batch_models:
-        models = []
-        for model in model_ids:
+
+        def get_model(index):
+            """Retrieves the index-th model in the list"""
             try:
                 # if there's more than one model the first one must contain
                 # the entire field structure to be used as reference.
                 query_string = (
                     ALL_FIELDS_QS if (
                         (not single_model and (
-                            len(models) == 0 or args.multi_label)) or
+                            index == 0 or args.multi_label)) or
                         not args.test_header)
                     else FIELDS_QS)
-                model = check_resource(model, api.get_model,
-                                       query_string=query_string)
+                return check_resource(model_ids[index], api.get_model,
+                                      query_string=query_string)
             except ValueError, exception:
                 sys.exit("Failed to get a finished model: %s" %
                          str(exception))
-            models.append(model)
+
+        models = list(parallel_map(get_model, range(len(model_ids)),
+                                   args.max_parallel_downloads))
         model = models[0]
     else:
         try:
@@ -920,33 +1084,42 @@ def create_ensembles(datasets, ensemble_ids, ensemble_args, args,
                         plural("ensemble", number_of_ensembles))
         log_message(message, log_file=session_file,
                     console=args.verbosity)
-        inprogress = []
-        for i in range(0, number_of_ensembles):
-            wait_for_available_tasks(inprogress, args.max_parallel_ensembles,
-                                     api, "ensemble",
-                                     wait_step=args.number_of_models)
-
-            if ensemble_args_list:
-                ensemble_args = ensemble_args_list[i]
-
+        scheduler = CompletionScheduler(
+            api, args.max_parallel_ensembles, "ensemble",
+            controller=concurrency_controller(args, path),
+            journal=get_journal(path))
+
+        def new_ensemble(index):
+            """Creates the index-th ensemble in the list"""
+            index_args = (ensemble_args_list[index] if ensemble_args_list
+                          else ensemble_args)
             if args.dataset_off and args.evaluate:
                 multi_dataset = args.test_dataset_ids[:]
-                del multi_dataset[i + existing_ensembles]
-                ensemble = api.create_ensemble(multi_dataset,
-                                               ensemble_args,
-                                               retries=None)
-            else:
-                ensemble = api.create_ensemble(datasets, ensemble_args,
-                                               retries=None)
+                del multi_dataset[index + existing_ensembles]
+                return scheduler.create(api.create_ensemble, multi_dataset,
+                                        index_args, retries=None)
+            return scheduler.create(api.create_ensemble, datasets,
+                                    index_args, retries=None)
+
+        def ensemble_created(ensemble):
+            """Logs the ensemble as soon as its creation call returns"""
+            if ensemble.get('resource') is not None:
+                log_created_resources("ensembles", path,
+                                      ensemble['resource'], mode='a')
+
+        # ensembles are logged in the order of the arguments list (the order
+        # of labels in multi-label ensembles)
+        for ensemble in create_in_window(scheduler, new_ensemble,
+                                         number_of_ensembles,
+                                         created=ensemble_created):
             ensemble_id = check_resource_error(ensemble,
                                                "Failed to create ensemble: ")
             log_message("%s\n" % ensemble_id, log_file=log)
             ensemble_ids.append(ensemble_id)
-            inprogress.append(ensemble_id)
+            scheduler.add(ensemble)
             ensembles.append(ensemble)
-            log_created_resources("ensembles", path, ensemble_id,
-                                  mode='a')
-        models, model_ids = retrieve_ensembles_models(ensembles, api, path)
+        models, model_ids = retrieve_ensembles_models(
+            ensembles, api, path, workers=args.max_parallel_downloads)
         if number_of_ensembles < 2 and args.verbosity:
             message = dated("Ensemble created: %s.\n" %
                             get_url(ensemble))
@@ -958,22 +1131,28 @@ def create_ensembles(datasets, ensemble_ids, ensemble_args, args,
     return ensembles, ensemble_ids, models, model_ids
 
 
-def retrieve_ensembles_models(ensembles, api, path=None):
-    """Retrieves the models associated to a list of ensembles
+def retrieve_ensembles_models(ensembles, api, path=None, workers=1):
+    """Retrieves the models associated to a list of ensembles. Up to
+       `workers` ensembles are retrieved in parallel.
 
     """
     models = []
     model_ids = []
-    for index in range(0, len(ensembles)):
-        ensemble = ensembles[index]
+
+    def get_finished_ensemble(ensemble):
+        """Retrieves the ensemble if not finished"""
         if (isinstance(ensemble, basestring) or
                 bigml.api.get_status(ensemble)['code'] != bigml.api.FINISHED):
             try:
                 ensemble = check_resource(ensemble, api.get_ensemble)
-                ensembles[index] = ensemble
             except ValueError, exception:
                 sys.exit("Failed to get a finished ensemble: %s" %
                          str(exception))
+        return ensemble
+
+    for index, ensemble in enumerate(parallel_map(get_finished_ensemble,
+                                                  ensembles[:], workers)):
+        ensembles[index] = ensemble
         model_ids.extend(ensemble['object']['models'])
     if path is not None:
         for model_id in model_ids:
@@ -1138,24 +1317,26 @@ def create_evaluations(model_or_ensemble_ids, datasets, evaluation_args,
     log_message(message, log_file=session_file,
                 console=args.verbosity)
 
-    inprogress = []
+    scheduler = CompletionScheduler(
+        api, args.max_parallel_evaluations, "evaluation",
+        controller=concurrency_controller(args, path),
+        journal=get_journal(path))
     for i in range(0, number_of_evaluations):
         model = remaining_ids[i]
         if args.test_dataset_ids or args.dataset_off:
             dataset = remaining_datasets[i]
-        wait_for_available_tasks(inprogress, args.max_parallel_evaluations,
-                                 api, "evaluation")
+        scheduler.wait_for_slot()
 
         if evaluation_args_list != []:
             evaluation_args = evaluation_args_list[i]
         if args.cross_validation_rate > 0:
             new_seed = get_basic_seed(i + existing_evaluations)
             evaluation_args.update(seed=new_seed)
-        evaluation = api.create_evaluation(model, dataset, evaluation_args,
-                                           retries=None)
+        evaluation = scheduler.create(api.create_evaluation, model, dataset,
+                                      evaluation_args, retries=None)
         evaluation_id = check_resource_error(evaluation,
                                              "Failed to create evaluation: ")
-        inprogress.append(evaluation_id)
+        scheduler.add(evaluation)
         log_created_resources("evaluations", path, evaluation_id,
                               mode='a')
         evaluations.append(evaluation)
@@ -1385,19 +1566,22 @@ def create_clusters(datasets, cluster_ids, cluster_args,
                     console=args.verbosity)
 
         query_string = FIELDS_QS
-        inprogress = []
+        scheduler = CompletionScheduler(
+            api, args.max_parallel_clusters, "cluster",
+            controller=concurrency_controller(args, path),
+            journal=get_journal(path))
         for i in range(0, number_of_clusters):
-            wait_for_available_tasks(inprogress, args.max_parallel_clusters,
-                                     api, "cluster")
+            scheduler.wait_for_slot()
             if cluster_args_list:
                 cluster_args = cluster_args_list[i]
 
-            cluster = api.create_cluster(datasets, cluster_args, retries=None)
+            cluster = scheduler.create(api.create_cluster, datasets,
+                                       cluster_args, retries=None)
             cluster_id = check_resource_error(cluster,
                                               "Failed to create cluster: ")
             log_message("%s\n" % cluster_id, log_file=log)
             cluster_ids.append(cluster_id)
-            inprogress.append(cluster_id)
+            scheduler.add(cluster)
             clusters.append(cluster)
             log_created_resources("clusters", path, cluster_id, mode='a')
 
@@ -1663,19 +1847,22 @@ def create_anomalies(datasets, anomaly_ids, anomaly_args,
                     console=args.verbosity)
 
         query_string = FIELDS_QS
-        inprogress = []
+        scheduler = CompletionScheduler(
+            api, args.max_parallel_anomalies, "anomaly",
+            controller=concurrency_controller(args, path),
+            journal=get_journal(path))
         for i in range(0, number_of_anomalies):
-            wait_for_available_tasks(inprogress, args.max_parallel_anomalies,
-                                     api, "anomaly")
+            scheduler.wait_for_slot()
             if anomaly_args_list:
                 anomaly_args = anomaly_args_list[i]
 
-            anomaly = api.create_anomaly(datasets, anomaly_args, retries=None)
+            anomaly = scheduler.create(api.create_anomaly, datasets,
+                                       anomaly_args, retries=None)
             anomaly_id = check_resource_error(anomaly,
                                               "Failed to create anomaly: ")
             log_message("%s\n" % anomaly_id, log_file=log)
             anomaly_ids.append(anomaly_id)
-            inprogress.append(anomaly_id)
+            scheduler.add(anomaly)
             anomalies.append(anomaly)
             log_created_resources("anomalies", path, anomaly_id, mode='a')
 
@@ -1887,19 +2074,22 @@ def create_samples(datasets, sample_ids, sample_args,
         log_message(message, log_file=session_file,
                     console=args.verbosity)
 
-        inprogress = []
+        scheduler = CompletionScheduler(
+            api, max_parallel_samples, "sample",
+            controller=concurrency_controller(args, path),
+            journal=get_journal(path))
         for i in range(0, number_of_samples):
-            wait_for_available_tasks(inprogress, max_parallel_samples,
-                                     api, "sample")
+            scheduler.wait_for_slot()
             if sample_args_list:
                 sample_args = sample_args_list[i]
 
-            sample = api.create_sample(datasets[i], sample_args, retries=None)
+            sample = scheduler.create(api.create_sample, datasets[i],
+                                      sample_args, retries=None)
             sample_id = check_resource_error(sample,
                                              "Failed to create sample: ")
             log_message("%s\n" % sample_id, log_file=log)
             sample_ids.append(sample_id)
-            inprogress.append(sample_id)
+            scheduler.add(sample)
             samples.append(sample)
             log_created_resources("samples", path, sample_id, mode='a')
 
@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Completion scheduler for the resources created in parallel
+
+   The scheduler keeps the pool of in-flight resources and polls each of
+   them with its own interval. The interval is adapted to the progress
+   reported by the resource: when progress is being made, the next check is
+   scheduled for the estimated finishing time; when it is not, the interval
+   grows exponentially. The interval is always kept between `min_wait` and
+   `max_wait` seconds. When a resource is due, the resources due in the
+   next `min_wait` seconds are checked with it, so that the adaptive
+   intervals do not prevent grouping the checks. The status of a group is
+   retrieved in bulk using the listing endpoints, filtered by resource id,
+   and only the resources missing in the listing are retrieved one by one.
+
+   The max number of resources in progress can also be adapted to the
+   response of the API by a `ConcurrencyController`, shared by all the
+   schedulers in the process. The controller follows an additive increase,
+   multiplicative decrease policy: the limit grows while creation requests
+   are answered quickly and is halved when the API throttles the requests
+   (HTTP 429), resources stay queued or creation requests slow down.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import datetime
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import bigml.api
+import bigmler.journal
+
+from bigml.bigmlconnection import HTTP_CREATED, HTTP_TOO_MANY_REQUESTS
+
+
+MIN_WAIT = 1
+MAX_WAIT = 30
+BACKOFF = 2
+PROGRESS_QS = "full=false"
+# max number of resource ids in a bulk status query
+BULK_SIZE = 100
+LIST_METHODS = {
+    "source": "list_sources",
+    "dataset": "list_datasets",
+    "model": "list_models",
+    "ensemble": "list_ensembles",
+    "evaluation": "list_evaluations",
+    "cluster": "list_clusters",
+    "anomaly": "list_anomalies",
+    "sample": "list_samples",
+    "batchprediction": "list_batch_predictions",
+    "batchcentroid": "list_batch_centroids",
+    "batchanomalyscore": "list_batch_anomaly_scores"}
+
+# multiplicative decrease factor
+DECREASE = 0.5
+# creation requests slower than this factor times the average latency are
+# considered a sign of overload
+SLOWDOWN = 2
+# minimum number of requests before the average latency is trusted
+MIN_SAMPLES = 3
+# weight of the last request in the average latency
+LATENCY_WEIGHT = 0.2
+# min seconds between decreases, so that a burst of signals counts as one
+COOLDOWN = 5
+CONCURRENCY_LOG = "concurrency_log"
+CONTROLLER = {"controller": None}
+
+
+class ConcurrencyController(object):
+    """Adapts the number of resources in progress to the API response
+
+    """
+
+    def __init__(self, floor=1, log_path=None):
+        """`floor` is the min limit. The ceiling is the largest
+           `max_parallel` of the schedulers that use the controller.
+
+        """
+        self.floor = max(floor, 1)
+        self.ceiling = self.floor
+        self.limit = float(self.floor)
+        self.latency = None
+        self.samples = 0
+        self.last_decrease = 0
+        self.log_path = log_path
+        self.logged = {}
+        self.lock = threading.Lock()
+
+    def current(self):
+        """Current concurrency limit
+
+        """
+        return int(self.limit)
+
+    def add_ceiling(self, max_parallel):
+        """Raises the ceiling to the `max_parallel` of a new scheduler
+
+        """
+        with self.lock:
+            self.ceiling = max(self.ceiling, max_parallel)
+
+    def increase(self):
+        """Additive increase: one more slot per window of successes, never
+           over the ceiling so that a decrease always lowers the real
+           concurrency
+
+        """
+        with self.lock:
+            self.limit = min(self.limit + 1.0 / self.limit, self.ceiling)
+
+    def decrease(self):
+        """Multiplicative decrease, at most once per cooldown period
+
+        """
+        with self.lock:
+            now = time.time()
+            if now - self.last_decrease >= COOLDOWN:
+                self.last_decrease = now
+                self.limit = max(self.limit * DECREASE, self.floor)
+
+    def created(self, latency):
+        """Registers the time used by a successful creation request
+
+        """
+        with self.lock:
+            average = self.latency
+            self.samples += 1
+            if average is None:
+                self.latency = latency
+            else:
+                self.latency = (LATENCY_WEIGHT * latency +
+                                (1 - LATENCY_WEIGHT) * average)
+        if (average is not None and self.samples > MIN_SAMPLES and
+                latency > SLOWDOWN * average):
+            self.decrease()
+        else:
+            self.increase()
+
+    def throttled(self):
+        """Registers a throttled (HTTP 429) request
+
+        """
+        self.decrease()
+
+    def queued(self):
+        """Registers resources that stay queued
+
+        """
+        self.decrease()
+
+    def log(self, resource_type, limit, in_progress):
+        """Logs the concurrency limit and the resources in progress when they
+           change
+
+        """
+        if self.log_path is None:
+            return
+        with self.lock:
+            if self.logged.get(resource_type) == (limit, in_progress):
+                return
+            self.logged[resource_type] = (limit, in_progress)
+            log_file = os.path.join(self.log_path, CONCURRENCY_LOG)
+            try:
+                new_file = not os.path.exists(log_file)
+                with open(log_file, "a") as concurrency_file:
+                    if new_file:
+                        concurrency_file.write(
+                            "time,resource_type,limit,in_progress\n")
+                    concurrency_file.write("%s,%s,%s,%s\n" % (
+                        datetime.datetime.now().isoformat(), resource_type,
+                        limit, in_progress))
+            except IOError:
+                pass
+
+
+def concurrency_controller(args, path=None):
+    """Returns the controller shared in the process when --adaptive-parallel
+       is used. Concurrency is logged in the `path` directory.
+
+    """
+    if not getattr(args, "adaptive_parallel", False):
+        return None
+    controller = CONTROLLER["controller"]
+    if controller is None:
+        controller = ConcurrencyController(args.min_parallel)
+        CONTROLLER["controller"] = controller
+    if path is not None:
+        controller.log_path = path
+    return controller
+
+
+class SafeCall(object):
+    """Wraps a function so that any exception it raises, including the
+       SystemExit of sys.exit calls, is returned instead of killing the
+       pool worker.
+
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, item):
+        try:
+            return False, self.function(item)
+        except BaseException:
+            return True, sys.exc_info()
+
+
+def parallel_map(function, items, workers, ordered=True):
+    """Yields the results of applying `function` to `items` using up to
+       `workers` threads. Results are yielded in the order of `items` if
+       `ordered` is set and as soon as they are available otherwise.
+       Exceptions are raised again in the calling thread.
+
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        for item in items:
+            yield function(item)
+        return
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for failed, result in mapper(SafeCall(function), items):
+            if failed:
+                raise result[0], result[1], result[2]
+            yield result
+    finally:
+        pool.terminate()
+
+
+def status_progress(status):
+    """Progress info in a resource status (between 0 and 1)
+
+    """
+    progress = status.get('progress')
+    if progress is None:
+        return 0.0
+    return float(progress)
+
+
+def prefetched_map(function, items):
+    """Yields the results of applying `function` to `items` in order. The
+       result for the next item is computed in a background thread while
+       the current one is being used by the caller.
+
+    """
+    items = list(items)
+    if len(items) < 2:
+        for item in items:
+            yield function(item)
+        return
+    pool = ThreadPool(1)
+    safe_function = SafeCall(function)
+    try:
+        pending = pool.apply_async(safe_function, (items[0],))
+        for index in range(len(items)):
+            failed, result = pending.get()
+            if failed:
+                raise result[0], result[1], result[2]
+            if index + 1 < len(items):
+                pending = pool.apply_async(safe_function,
+                                           (items[index + 1],))
+            yield result
+    finally:
+        pool.terminate()
+
+
+class CompletionScheduler(object):
+    """Keeps track of the resources in progress and their polling times
+
+    """
+
+    def __init__(self, api, max_parallel, resource_type,
+                 min_wait=MIN_WAIT, max_wait=MAX_WAIT, controller=None,
+                 journal=None):
+        """`max_parallel` is the max number of resources in progress and
+           `resource_type` the name used in messages. If a `controller` is
+           given, it sets the limit under `max_parallel`. If a `journal` is
+           given, finished and failed resources are recorded in it and
+           resources known to be finished are not polled.
+
+        """
+        self.api = api
+        self.max_parallel = max(max_parallel, 1)
+        self.resource_type = resource_type
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.controller = controller
+        if controller is not None:
+            controller.add_ceiling(self.max_parallel)
+        self.journal = journal
+        self.inprogress = {}
+        # resources known to be finished that are still to be yielded
+        self.done = []
+
+    def __len__(self):
+        """Number of resources in progress
+
+        """
+        return len(self.inprogress)
+
+    def limit(self):
+        """Max number of resources in progress
+
+        """
+        if self.controller is None:
+            return self.max_parallel
+        return max(min(self.controller.current(), self.max_parallel), 1)
+
+    def log(self):
+        """Logs the concurrency info in the controller
+
+        """
+        if self.controller is not None:
+            self.controller.log(self.resource_type, self.limit(),
+                                len(self.inprogress))
+
+    def create(self, create_method, *args, **kwargs):
+        """Calls the `create_method` of the api. When a controller is set,
+           throttled requests are retried and the request latency is
+           registered.
+
+        """
+        wait = self.min_wait
+        while True:
+            start = time.time()
+            resource = create_method(*args, **kwargs)
+            if (self.controller is None or
+                    resource.get('code') != HTTP_TOO_MANY_REQUESTS):
+                break
+            self.controller.throttled()
+            time.sleep(wait)
+            wait = min(wait * BACKOFF, self.max_wait)
+        if (self.controller is not None and
+                resource.get('code') == HTTP_CREATED):
+            self.controller.created(time.time() - start)
+        return resource
+
+    def add(self, resource):
+        """Adds a new resource (id or structure) to the in-progress pool
+
+        """
+        resource_id = bigml.api.get_resource_id(resource)
+        if (self.journal is not None and
+                self.journal.status(resource_id) ==
+                bigmler.journal.FINISHED):
+            self.done.append(resource_id)
+            return
+        progress = 0.0
+        now = time.time()
+        # resources given by id can be already finished: checked right away
+        next_check = now
+        if isinstance(resource, dict):
+            try:
+                progress = status_progress(bigml.api.get_status(resource))
+                next_check = now + self.min_wait
+            except ValueError:
+                pass
+        self.inprogress[resource_id] = {
+            "progress": progress,
+            "checked": now,
+            "wait": self.min_wait,
+            "next_check": next_check,
+            "queued": False}
+        self.log()
+
+    def poll(self, resource_id):
+        """Retrieves the status of a resource. Exits if it is faulty.
+
+        """
+        try:
+            resource = bigml.api.check_resource(
+                resource_id, retries=0, query_string=PROGRESS_QS,
+                api=self.api)
+            status = bigml.api.get_status(resource)
+            if status['code'] == bigml.api.FAULTY:
+                if self.journal is not None:
+                    self.journal.record(bigmler.journal.FAILED,
+                                        resource_id)
+                raise ValueError(status.get('message'))
+        except ValueError, exception:
+            sys.exit("Failed to get a finished %s: %s" %
+                     (self.resource_type, str(exception)))
+        return status
+
+    def bulk_poll(self, resource_ids):
+        """Retrieves the status of a list of resources using one listing
+           query per resource type and chunk of ids. Returns a dict keyed
+           by resource id. Resources that cannot be found in the listing
+           are not in the result.
+
+        """
+        statuses = {}
+        by_type = {}
+        for resource_id in resource_ids:
+            resource_type = bigml.api.get_resource_type(resource_id)
+            by_type.setdefault(resource_type, []).append(resource_id)
+        for resource_type, ids in by_type.items():
+            list_method = getattr(self.api, LIST_METHODS.get(resource_type,
+                                                             ""), None)
+            if list_method is None:
+                continue
+            for start in range(0, len(ids), BULK_SIZE):
+                chunk = ids[start: start + BULK_SIZE]
+                query_string = "resource__in=%s;limit=%s;%s" % (
+                    ",".join(chunk), len(chunk), PROGRESS_QS)
+                listing = list_method(query_string)
+                for resource in listing.get('objects') or []:
+                    if resource.get('resource') in chunk and \
+                            'status' in resource:
+                        statuses[resource['resource']] = resource['status']
+        return statuses
+
+    def reschedule(self, resource_id, status, now):
+        """Sets the next polling time for a resource according to its
+           progress since last check.
+
+        """
+        state = self.inprogress[resource_id]
+        progress = status_progress(status)
+        elapsed = now - state["checked"]
+        advance = progress - state["progress"]
+        if advance > 0 and elapsed > 0:
+            # expected time to finish at the current progress rate
+            wait = (1.0 - progress) * elapsed / advance
+        else:
+            wait = state["wait"] * BACKOFF
+        wait = min(max(wait, self.min_wait), self.max_wait)
+        state.update({
+            "progress": progress,
+            "checked": now,
+            "wait": wait,
+            "next_check": now + wait})
+
+    def check(self):
+        """Polls the resources whose polling time has come, together with
+           the ones due in the next `min_wait` seconds. Returns the list
+           of finished resource ids, that are removed from the pool.
+
+        """
+        now = time.time()
+        finished, self.done = self.done, []
+        due = []
+        if any(state["next_check"] <= now for state in
+               self.inprogress.values()):
+            due = [resource_id for resource_id, state in
+                   self.inprogress.items()
+                   if state["next_check"] <= now + self.min_wait]
+        statuses = {}
+        if len(due) > 1:
+            statuses = self.bulk_poll(due)
+        still_queued = False
+        for resource_id in due:
+            status = statuses.get(resource_id)
+            if status is None or status.get('code') == bigml.api.FAULTY:
+                # missing in the listing or faulty: the resource is
+                # retrieved to get its status or the error message
+                status = self.poll(resource_id)
+            if status['code'] == bigml.api.FINISHED:
+                del self.inprogress[resource_id]
+                finished.append(resource_id)
+                if self.journal is not None:
+                    self.journal.record(bigmler.journal.FINISHED,
+                                        resource_id)
+            else:
+                queued = status['code'] == bigml.api.QUEUED
+                # queued in two checks in a row: no job slots available
+                still_queued = still_queued or (
+                    queued and self.inprogress[resource_id]["queued"])
+                self.inprogress[resource_id]["queued"] = queued
+                self.reschedule(resource_id, status, time.time())
+        if still_queued and self.controller is not None:
+            self.controller.queued()
+        self.log()
+        return finished
+
+    def sleep(self):
+        """Sleeps till the next polling time
+
+        """
+        if self.inprogress:
+            next_check = min([state["next_check"] for state in
+                              self.inprogress.values()])
+            delay = next_check - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    def free_slots(self):
+        """Number of resources that can be added to the pool
+
+        """
+        return max(self.limit() - len(self.inprogress), 0)
+
+    def wait_for_slot(self):
+        """Returns as soon as the number of resources in progress is under
+           the max_parallel limit.
+
+        """
+        while len(self.inprogress) >= self.limit():
+            self.sleep()
+            self.check()
+
+    def as_completed(self):
+        """Yields the ids of the resources in progress as they finish
+
+        """
+        while self.inprogress or self.done:
+            self.sleep()
+            for resource_id in self.check():
+                yield resource_id
+
+
+def create_in_window(scheduler, create, number_of_resources,
+                     created=None):
+    """Yields the resources returned by `create(index)` for every index in
+       range(number_of_resources) in index order. The creation calls are
+       issued concurrently for the free slots in the scheduler, and the
+       caller is expected to add the yielded resources to it. The `created`
+       function is called with all the resources returned in a batch before
+       they are yielded or any error in the batch is raised, so that they
+       can be logged even if the creation of some other one failed.
+
+    """
+    index = 0
+    while index < number_of_resources:
+        scheduler.wait_for_slot()
+        batch = range(index, min(number_of_resources,
+                                 index + scheduler.free_slots()))
+        results = list(parallel_map(SafeCall(create), batch, len(batch)))
+        if created is not None:
+            for failed, resource in results:
+                if not failed:
+                    created(resource)
+        for failed, resource in results:
+            if failed:
+                raise resource[0], resource[1], resource[2]
+            yield resource
+        index += len(batch)
+
+
+def wait_for_resources(api, resources, resource_type):
+    """Waits till all the resources in the list are finished, polling their
+       status in bulk.
+
+    """
+    scheduler = CompletionScheduler(api, len(resources), resource_type)
+    for resource in resources:
+        scheduler.add(resource)
+    for _ in scheduler.as_completed():
+        pass
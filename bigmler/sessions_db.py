@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Indexed store for the logs of bigmler sessions
+
+   The lines written to the command logs (`.bigmler`, `.bigmler_analyze`,
+   ...), the output directories stacks (`.bigmler_dir_stack`, ...) and the
+   analyze subcommands logs (`.bigmler_subcmd`) are also stored in a
+   SQLite database in the working directory, indexed by log file. The ids
+   of the created resources are stored indexed by output directory and
+   checkpoint file.
+
+   The text files are still written as a view of the store for
+   compatibility, and their contents are merged with the ones in the store
+   when read, as they can hold information the store has not (e.g.: logs
+   written by previous versions or when the sqlite3 module is not
+   available).
+
+   Writes are batched: they are run in a single transaction when
+   `MAX_PENDING` statements are queued, before any query and at exit.
+
+"""
+from __future__ import absolute_import
+
+import os
+import atexit
+import threading
+
+try:
+    import sqlite3
+    SQLITE = True
+except ImportError:
+    SQLITE = False
+
+
+SESSIONS_DB = u".bigmler_sessions.db"
+MAX_PENDING = 1000
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS log_lines ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, log TEXT, line TEXT)",
+    "CREATE INDEX IF NOT EXISTS log_lines_log ON log_lines (log, id)",
+    "CREATE TABLE IF NOT EXISTS resources ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, directory TEXT, file TEXT,"
+    " resource TEXT)",
+    "CREATE INDEX IF NOT EXISTS resources_directory ON resources"
+    " (directory, file)"]
+
+STORES = {}
+LOCK = threading.Lock()
+
+
+def log_key(log_file):
+    """Logs are identified by the absolute path of their text file
+
+    """
+    return os.path.abspath(log_file)
+
+
+class SessionsStore(object):
+    """Connection to the sessions database
+
+    """
+
+    def __init__(self, db_file):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, timeout=30,
+                                          check_same_thread=False)
+        # (statement, parameters) pairs waiting to be written
+        self.pending = []
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def execute(self, statements):
+        """Queues the (statement, parameters) pairs to be written in the
+           next batch
+
+        """
+        with self.lock:
+            self.pending.extend(statements)
+            if len(self.pending) >= MAX_PENDING:
+                self.write_pending()
+
+    def write_pending(self):
+        """Runs the queued statements in one transaction. The lock must be
+           held by the caller
+
+        """
+        statements, self.pending = self.pending, []
+        if statements:
+            with self.connection:
+                for statement, parameters in statements:
+                    self.connection.execute(statement, parameters)
+
+    def flush(self):
+        """Writes the queued statements
+
+        """
+        with self.lock:
+            self.write_pending()
+
+    def query(self, statement, parameters):
+        """Returns the rows selected by the statement, once the queued
+           statements are written
+
+        """
+        with self.lock:
+            self.write_pending()
+            return self.connection.execute(statement, parameters).fetchall()
+
+    def log_lines(self, log_file, message):
+        """Stores the lines of the message in the log
+
+        """
+        key = log_key(log_file)
+        lines = message.split(u"\n")
+        if not lines[-1]:
+            lines.pop()
+        self.execute([("INSERT INTO log_lines (log, line) VALUES (?, ?)",
+                       (key, line)) for line in lines])
+
+    def reversed_line(self, log_file, stack_level=0):
+        """Returns the line of the log at `stack_level` lines from its end
+           or None if the log has not so many lines
+
+        """
+        rows = self.query("SELECT line FROM log_lines WHERE log = ?"
+                          " ORDER BY id DESC LIMIT 1 OFFSET ?",
+                          (log_key(log_file), stack_level))
+        return rows[0][0] if rows else None
+
+    def lines(self, log_file):
+        """Returns the lines of the log or None if it has none
+
+        """
+        rows = self.query("SELECT line FROM log_lines WHERE log = ?"
+                          " ORDER BY id", (log_key(log_file),))
+        return [row[0] for row in rows] or None
+
+    def line_count(self, log_file):
+        """Returns the number of lines of the log
+
+        """
+        rows = self.query("SELECT COUNT(*) FROM log_lines WHERE log = ?",
+                          (log_key(log_file),))
+        return rows[0][0]
+
+    def clear_log(self, log_file):
+        """Removes the lines of the log
+
+        """
+        self.execute([("DELETE FROM log_lines WHERE log = ?",
+                       (log_key(log_file),))])
+
+    def log_resource(self, path, file_name, resource_id, mode="w"):
+        """Stores the resource id as logged in the checkpoint file of the
+           path directory. Mode `w` replaces the previous ids.
+
+        """
+        directory = os.path.abspath(path)
+        statements = []
+        if mode == "w":
+            statements.append(("DELETE FROM resources WHERE directory = ?"
+                               " AND file = ?", (directory, file_name)))
+        if resource_id is not None:
+            statements.append(("INSERT INTO resources (directory, file,"
+                               " resource) VALUES (?, ?, ?)",
+                               (directory, file_name, resource_id)))
+        self.execute(statements)
+
+    def directory_resources(self, path, file_names=None):
+        """Returns the ids logged in the checkpoint files of the directory
+           and its subdirectories, optionally restricted to some files
+
+        """
+        directory = os.path.abspath(path)
+        prefix = os.path.join(directory, "")
+        rows = self.query("SELECT file, resource FROM resources"
+                          " WHERE directory = ? OR"
+                          " substr(directory, 1, ?) = ?",
+                          (directory, len(prefix), prefix))
+        return [resource_id for file_name, resource_id in rows
+                if file_names is None or file_name in file_names]
+
+
+def get_store():
+    """Returns the store of the working directory, one per process. None
+       is returned if the database cannot be used.
+
+    """
+    if not SQLITE:
+        return None
+    db_file = os.path.abspath(SESSIONS_DB)
+    with LOCK:
+        if db_file not in STORES:
+            try:
+                STORES[db_file] = SessionsStore(db_file)
+            except sqlite3.Error:
+                STORES[db_file] = None
+        return STORES[db_file]
+
+
+def flush_stores():
+    """Writes the queued statements of all the stores
+
+    """
+    with LOCK:
+        stores = [store for store in STORES.values() if store is not None]
+    for store in stores:
+        try:
+            store.flush()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(flush_stores)
+
+
+def safe_call(method, *args, **kwargs):
+    """Calls a method of the store, if available. Errors in the store are
+       not fatal, as the text files keep the information.
+
+    """
+    store = get_store()
+    if store is None:
+        return None
+    try:
+        return getattr(store, method)(*args, **kwargs)
+    except sqlite3.Error:
+        return None
@@ -0,0 +1,869 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+""" Local stand-in for the BigML API
+
+    Serves the source, dataset, model, ensemble, prediction, batch
+    prediction and evaluation endpoints (plus generic create, get, list,
+    update and delete for any other resource type) from memory, so that
+    bigmler can be run and benchmarked offline and deterministically.
+
+    The contents of the resources are computed from the uploaded CSV data:
+    datasets keep the rows of their origin, models are single node trees
+    that predict the most common objective value and evaluations compare
+    these predictions with the dataset rows. Canned JSON can be merged into
+    any resource type to serve more realistic models.
+
+    The server behaviour is configured by:
+
+        latency: seconds added to every request
+        job_duration: seconds until a created resource is finished
+        queue_time: seconds a created resource stays queued
+        failure_rate: fraction of created resources that end faulty
+        rate_limit: max number of creation requests per second. Exceeding
+                    requests get a 429 (Too many requests) response
+        seed: seed for the random failures
+        canned: dict of JSON to be merged into the resources, by type
+
+    Running bigmler against it only needs the environment variables
+    returned by `MockBigML.environ`:
+
+        python -m bigmler.tests.mock_server --port 8765 --job-duration 1
+
+        BIGML_DOMAIN=localhost:8765 BIGML_PROTOCOL=http BIGML_SSL_VERIFY=1 \\
+        BIGML_PREDICTION_DOMAIN=localhost:8765 \\
+        BIGML_PREDICTION_PROTOCOL=http BIGML_PREDICTION_SSL_VERIFY=1 \\
+        bigmler --train data/iris.csv ...
+
+"""
+from __future__ import absolute_import
+
+import os
+import re
+import csv
+import cgi
+import gzip
+import json
+import time
+import random
+import urllib
+import argparse
+import datetime
+import threading
+import StringIO
+import BaseHTTPServer
+import SocketServer
+
+from collections import deque
+
+
+FINISHED = 5
+IN_PROGRESS = 3
+QUEUED = 1
+FAULTY = -1
+
+HTTP_OK = 200
+HTTP_CREATED = 201
+HTTP_ACCEPTED = 202
+HTTP_NO_CONTENT = 204
+HTTP_BAD_REQUEST = 400
+HTTP_UNAUTHORIZED = 401
+HTTP_NOT_FOUND = 404
+HTTP_TOO_MANY_REQUESTS = 429
+
+MISSING_TOKENS = ["", "NaN", "NULL", "N/A", "null", "-", "#REF!", "#VALUE!",
+                  "?", "#NULL!", "#NUM!", "#DIV/0", "n/a", "#NAME?", "NIL",
+                  "nil", "NA", "#N/A", "na"]
+# resources whose creation is synchronous in the API
+SYNC_TYPES = ["prediction", "centroid", "anomalyscore"]
+PATH_RE = re.compile(r'^/(?:dev/)?andromeda/(\w+)(?:/([0-9a-f]{24}))?'
+                     r'(/download)?/?$')
+DEFAULT_LIMIT = 20
+
+
+def iso_time(timestamp):
+    """ISO format of a timestamp as used in the API"""
+    return datetime.datetime.utcfromtimestamp(timestamp).isoformat()
+
+
+def merge(target, source):
+    """Recursively merges the `source` dict into `target`"""
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def parse_query(query):
+    """Query string arguments. Both `;` and `&` are used as separators"""
+    arguments = {}
+    for argument in re.split(r'[;&]', query):
+        if argument:
+            key, _, value = argument.partition("=")
+            arguments[urllib.unquote(key)] = urllib.unquote_plus(value)
+    return arguments
+
+
+def to_number(value):
+    """Float value of a string or None if not numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def field_summary(values, optype):
+    """Summary of the non-missing values in a column"""
+    present = [value for value in values if value not in MISSING_TOKENS]
+    if optype == "numeric":
+        # values that cannot be parsed as numbers are missing
+        present = [value for value in present if to_number(value) is not None]
+    summary = {"missing_count": len(values) - len(present)}
+    if optype == "numeric":
+        numbers = [float(value) for value in present]
+        counts = {}
+        for number in numbers:
+            counts[number] = counts.get(number, 0) + 1
+        summary.update({
+            "counts": sorted([[value, count] for value, count in
+                              counts.items()]),
+            "minimum": min(numbers) if numbers else None,
+            "maximum": max(numbers) if numbers else None,
+            "mean": sum(numbers) / len(numbers) if numbers else None,
+            "population": len(numbers)})
+    else:
+        counts = {}
+        for value in present:
+            counts[value] = counts.get(value, 0) + 1
+        summary["categories"] = sorted([[value, count] for value, count in
+                                        counts.items()],
+                                       key=lambda item: (-item[1], item[0]))
+    return summary
+
+
+def classification_metrics(actual, predicted, categories):
+    """Evaluation metrics for a classification"""
+    confusion = [[0] * len(categories) for _ in categories]
+    for real, guess in zip(actual, predicted):
+        if real in categories and guess in categories:
+            confusion[categories.index(real)][categories.index(guess)] += 1
+    total = float(len(actual)) or 1.0
+    hits = sum(confusion[index][index] for index in range(len(categories)))
+    per_class = []
+    for index, category in enumerate(categories):
+        true_positives = confusion[index][index]
+        predicted_count = sum(row[index] for row in confusion)
+        actual_count = sum(confusion[index])
+        precision = (true_positives / float(predicted_count)
+                     if predicted_count else 0.0)
+        recall = (true_positives / float(actual_count)
+                  if actual_count else 0.0)
+        f_measure = (2 * precision * recall / (precision + recall)
+                     if precision + recall else 0.0)
+        per_class.append({"class_name": category,
+                          "accuracy": hits / total,
+                          "precision": precision,
+                          "recall": recall,
+                          "f_measure": f_measure,
+                          "phi_coefficient": 0.0,
+                          "present_in_test_data": actual_count > 0})
+    averages = {}
+    for measure in ["precision", "recall", "f_measure", "phi_coefficient"]:
+        averages["average_%s" % measure] = (
+            sum(statistics[measure] for statistics in per_class) /
+            (len(per_class) or 1))
+    averages.update({"accuracy": hits / total,
+                     "confusion_matrix": confusion,
+                     "class_names": categories,
+                     "per_class_statistics": per_class})
+    return averages
+
+
+def regression_metrics(actual, predicted):
+    """Evaluation metrics for a regression"""
+    pairs = [(real, guess) for real, guess in zip(actual, predicted)
+             if real is not None]
+    total = float(len(pairs)) or 1.0
+    mean = sum(real for real, _ in pairs) / total
+    squared_error = sum((real - guess) ** 2 for real, guess in pairs)
+    variance = sum((real - mean) ** 2 for real, _ in pairs)
+    return {"mean_absolute_error": sum(abs(real - guess) for real, guess
+                                       in pairs) / total,
+            "mean_squared_error": squared_error / total,
+            "r_squared": (1 - squared_error / variance) if variance else 0.0}
+
+
+class MockBigMLServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server that keeps the resources in memory"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency=0, job_duration=0, queue_time=0,
+                 failure_rate=0, rate_limit=0, seed=0, canned=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, MockBigMLHandler)
+        self.latency = latency
+        self.job_duration = job_duration
+        self.queue_time = queue_time
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.canned = canned or {}
+        self.lock = threading.Lock()
+        self.resources = {}
+        # rows of the sources and datasets, as (field ids, rows)
+        self.data = {}
+        self.counter = 0
+        self.creations = deque()
+        # number of requests by method and resource type
+        self.stats = {}
+        self.throttled_count = 0
+
+    def count(self, method, resource_type):
+        """Counts the requests for benchmarking"""
+        with self.lock:
+            key = "%s %s" % (method, resource_type)
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def throttled(self):
+        """Checks the creation rate limit"""
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.time()
+            while self.creations and self.creations[0] < now - 1:
+                self.creations.popleft()
+            if len(self.creations) >= self.rate_limit:
+                self.throttled_count += 1
+                return True
+            self.creations.append(now)
+            return False
+
+    def new_resource(self, resource_type, contents, synchronous=False):
+        """Stores a new resource and returns it"""
+        with self.lock:
+            self.counter += 1
+            resource_id = "%s/%024x" % (resource_type, self.counter)
+            faulty = (not synchronous and
+                      self.random.random() < self.failure_rate)
+        now = time.time()
+        contents = merge(contents, self.canned.get(resource_type, {}))
+        contents.update({"resource": resource_id,
+                         "created": iso_time(now),
+                         "updated": iso_time(now)})
+        self.resources[resource_id] = {
+            "object": contents,
+            "created": now,
+            "faulty": faulty,
+            "synchronous": synchronous}
+        return self.get_resource(resource_id)
+
+    def status(self, resource):
+        """Status of the resource depending on the time since creation"""
+        elapsed = time.time() - resource["created"]
+        if resource["synchronous"]:
+            return {"code": FINISHED, "message": "The resource is finished",
+                    "elapsed": 0, "progress": 1.0}
+        if elapsed < self.queue_time:
+            return {"code": QUEUED, "message": "The resource is queued",
+                    "elapsed": int(elapsed * 1000), "progress": 0.0}
+        if elapsed < self.queue_time + self.job_duration:
+            return {"code": IN_PROGRESS,
+                    "message": "The resource is being processed",
+                    "elapsed": int(elapsed * 1000),
+                    "progress": ((elapsed - self.queue_time) /
+                                 self.job_duration)}
+        if resource["faulty"]:
+            return {"code": FAULTY, "message": "Simulated failure",
+                    "error": -1, "elapsed": int(elapsed * 1000),
+                    "progress": 1.0}
+        return {"code": FINISHED, "message": "The resource is finished",
+                "elapsed": int(elapsed * 1000), "progress": 1.0}
+
+    def get_resource(self, resource_id):
+        """Resource object with its current status"""
+        resource = self.resources.get(resource_id)
+        if resource is None:
+            return None
+        contents = dict(resource["object"])
+        contents["status"] = self.status(resource)
+        return contents
+
+    def finished(self, resource_id):
+        """Checks whether the resource is finished"""
+        resource = self.get_resource(resource_id)
+        return resource is not None and resource["status"]["code"] == FINISHED
+
+
+class MockBigMLHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles the API requests"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """No logging to stderr"""
+        pass
+
+    def respond(self, code, body=None, content_type="application/json",
+                location=None):
+        """Sends the response. Dicts are sent as JSON"""
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        body = body or ""
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if location is not None:
+            self.send_header("Location", location)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, code, message):
+        """Error response in the API format"""
+        self.respond(code, {"code": code,
+                            "status": {"code": -1, "message": message}})
+
+    def route(self):
+        """Parses the path, checks the credentials and adds latency.
+           Returns the resource type, id, whether it's a download and the
+           query arguments, or None if an error response has been sent.
+
+        """
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path, _, query = self.path.partition("?")
+        match = PATH_RE.match(path)
+        if match is None:
+            self.error(HTTP_NOT_FOUND, "Unknown url %s" % path)
+            return None
+        arguments = parse_query(query)
+        if not arguments.get("username") or not arguments.get("api_key"):
+            self.error(HTTP_UNAUTHORIZED, "Missing credentials")
+            return None
+        resource_type, hex_id, download = match.groups()
+        resource_id = (None if hex_id is None else
+                       "%s/%s" % (resource_type, hex_id))
+        self.server.count(self.command, resource_type)
+        return resource_type, resource_id, download, arguments
+
+    def read_body(self):
+        """Reads the JSON body of the request"""
+        length = int(self.headers.getheader("content-length") or 0)
+        body = self.rfile.read(length) if length else ""
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return None
+
+    def read_upload(self):
+        """Reads the multipart body of a file upload. Returns the
+           arguments, including the name of the uploaded file, and the file
+           contents
+
+        """
+        form = cgi.FieldStorage(
+            fp=self.rfile, headers=self.headers,
+            environ={"REQUEST_METHOD": "POST",
+                     "CONTENT_TYPE": self.headers.getheader("content-type")})
+        arguments = {}
+        data = ""
+        for key in form.keys():
+            item = form[key]
+            # the file part is named after the uploaded file
+            if item.filename:
+                arguments["file_name"] = os.path.basename(item.filename)
+                data = item.value
+                if item.filename.endswith(".gz"):
+                    data = gzip.GzipFile(
+                        fileobj=StringIO.StringIO(data)).read()
+            else:
+                try:
+                    arguments[key] = json.loads(item.value)
+                except ValueError:
+                    arguments[key] = item.value
+        return arguments, data
+
+    def do_GET(self):
+        """Retrieves, lists or downloads resources"""
+        routed = self.route()
+        if routed is None:
+            return
+        resource_type, resource_id, download, arguments = routed
+        if resource_id is None:
+            return self.list_resources(resource_type, arguments)
+        resource = self.server.get_resource(resource_id)
+        if resource is None:
+            return self.error(HTTP_NOT_FOUND, "Resource not found")
+        if download:
+            if resource["status"]["code"] != FINISHED:
+                return self.respond(HTTP_OK, {"status": resource["status"]})
+            return self.respond(HTTP_OK, self.download(resource),
+                                content_type="text/csv")
+        self.respond(HTTP_OK, resource)
+
+    def do_POST(self):
+        """Creates a resource"""
+        routed = self.route()
+        if routed is None:
+            return
+        resource_type, resource_id, _, _ = routed
+        if resource_id is not None:
+            return self.error(HTTP_BAD_REQUEST, "Wrong creation url")
+        content_type = self.headers.getheader("content-type") or ""
+        data = None
+        if content_type.startswith("multipart/form-data"):
+            body, data = self.read_upload()
+        else:
+            body = self.read_body()
+        if self.server.throttled():
+            return self.error(HTTP_TOO_MANY_REQUESTS, "Too many requests")
+        if body is None:
+            return self.error(HTTP_BAD_REQUEST, "Malformed JSON")
+        if data is None and resource_type == "source":
+            data = body.pop("data", "")
+        creator = getattr(self, "create_%s" % resource_type,
+                          self.create_generic)
+        try:
+            if resource_type == "source":
+                resource = creator(body, data)
+            else:
+                resource = creator(resource_type, body)
+        except (KeyError, ValueError), exception:
+            return self.error(HTTP_BAD_REQUEST, "Wrong arguments: %s" %
+                              str(exception))
+        if resource is None:
+            return self.error(HTTP_BAD_REQUEST, "Wrong origin resources")
+        self.respond(HTTP_CREATED, resource, location="%s/%s" % (
+            self.path.partition("?")[0].rstrip("/"),
+            resource["resource"].split("/")[1]))
+
+    def do_PUT(self):
+        """Updates a resource"""
+        routed = self.route()
+        if routed is None:
+            return
+        _, resource_id, _, _ = routed
+        body = self.read_body()
+        stored = self.server.resources.get(resource_id)
+        if stored is None:
+            return self.error(HTTP_NOT_FOUND, "Resource not found")
+        if body is None:
+            return self.error(HTTP_BAD_REQUEST, "Malformed JSON")
+        merge(stored["object"], body)
+        stored["object"]["updated"] = iso_time(time.time())
+        self.respond(HTTP_ACCEPTED, self.server.get_resource(resource_id))
+
+    def do_DELETE(self):
+        """Deletes a resource"""
+        routed = self.route()
+        if routed is None:
+            return
+        _, resource_id, _, _ = routed
+        if self.server.resources.pop(resource_id, None) is None:
+            return self.error(HTTP_NOT_FOUND, "Resource not found")
+        self.server.data.pop(resource_id, None)
+        self.respond(HTTP_NO_CONTENT)
+
+    def list_resources(self, resource_type, arguments):
+        """Lists the resources of a type, filtered by the query arguments"""
+        limit = int(arguments.pop("limit", DEFAULT_LIMIT))
+        offset = int(arguments.pop("offset", 0))
+        for key in ["username", "api_key", "full", "order_by"]:
+            arguments.pop(key, None)
+        selected = []
+        for resource_id in sorted(self.server.resources.keys(),
+                                  reverse=True):
+            if not resource_id.startswith("%s/" % resource_type):
+                continue
+            resource = self.server.get_resource(resource_id)
+            if resource is None:
+                continue
+            matches = True
+            for key, value in arguments.items():
+                if key.endswith("__in"):
+                    matches = (str(resource.get(key[:-4])) in
+                               value.split(","))
+                else:
+                    matches = str(resource.get(key)) == value
+                if not matches:
+                    break
+            if matches:
+                selected.append(resource)
+        self.respond(HTTP_OK, {
+            "meta": {"limit": limit, "offset": offset,
+                     "total_count": len(selected),
+                     "next": None, "previous": None},
+            "objects": selected[offset: offset + limit]})
+
+    def create_generic(self, resource_type, body):
+        """Any other resource type keeps the creation arguments"""
+        return self.server.new_resource(
+            resource_type, body,
+            synchronous=resource_type in SYNC_TYPES)
+
+    def create_source(self, body, data):
+        """Source from the uploaded CSV data"""
+        rows = list(csv.reader(StringIO.StringIO(data)))
+        headers = rows.pop(0) if rows else []
+        field_ids = ["%06x" % column for column in range(len(headers))]
+        fields = {}
+        for column, name in enumerate(headers):
+            values = [row[column] if column < len(row) else ""
+                      for row in rows]
+            numeric = all(to_number(value) is not None for value in values
+                          if value not in MISSING_TOKENS)
+            fields[field_ids[column]] = {
+                "name": name, "column_number": column, "order": column,
+                "optype": "numeric" if numeric else "categorical",
+                "datatype": "double" if numeric else "string",
+                "preferred": True}
+        contents = {
+            "name": "mock source",
+            "locale": "en-US",
+            "fields": fields,
+            "fields_meta": {"count": len(fields), "limit": -1, "offset": 0,
+                            "total": len(fields)},
+            "source_parser": {"header": True, "separator": ",",
+                              "quote": "\"", "locale": "en-US",
+                              "missing_tokens": MISSING_TOKENS},
+            "size": len(data)}
+        contents.update(body)
+        resource = self.server.new_resource("source", contents)
+        self.server.data[resource["resource"]] = (field_ids, rows)
+        return resource
+
+    def create_dataset(self, resource_type, body):
+        """Dataset from a source, a dataset (sampled) or several datasets"""
+        if "source" in body:
+            origins = [body["source"]]
+        elif "origin_datasets" in body:
+            origins = body["origin_datasets"]
+        else:
+            origins = [body["origin_dataset"]]
+        if not all([origin in self.server.data for origin in origins]):
+            return None
+        field_ids = self.server.data[origins[0]][0]
+        rows = []
+        for origin in origins:
+            rows.extend(self.server.data[origin][1])
+        if "sample_rate" in body:
+            sampler = random.Random(body.get("seed"))
+            out_of_bag = body.get("out_of_bag", False)
+            rows = [row for row in rows if
+                    (sampler.random() < body["sample_rate"]) != out_of_bag]
+        origin_fields = self.server.resources[origins[0]]["object"]["fields"]
+        fields = {}
+        for column, field_id in enumerate(field_ids):
+            field = dict(origin_fields[field_id])
+            field["summary"] = field_summary(
+                [row[column] if column < len(row) else "" for row in rows],
+                field["optype"])
+            fields[field_id] = field
+        objective_id = field_ids[-1] if field_ids else None
+        contents = {
+            "name": "mock dataset",
+            "locale": "en-US",
+            "fields": fields,
+            "fields_meta": {"count": len(fields), "limit": -1, "offset": 0,
+                            "total": len(fields)},
+            "rows": len(rows),
+            "input_fields": field_ids,
+            "objective_field": dict(fields[objective_id],
+                                    id=objective_id) if objective_id else {},
+            "size": sum(len(",".join(row)) + 1 for row in rows)}
+        contents.update(body)
+        resource = self.server.new_resource("dataset", contents)
+        self.server.data[resource["resource"]] = (field_ids, rows)
+        return resource
+
+    def objective_id(self, dataset_id, objective):
+        """Objective field id given as id, name or column number"""
+        dataset = self.server.resources[dataset_id]["object"]
+        fields = dataset["fields"]
+        if objective is None:
+            return dataset["objective_field"]["id"]
+        if objective in fields:
+            return objective
+        for field_id, field in fields.items():
+            if field["name"] == objective or \
+                    field["column_number"] == objective:
+                return field_id
+        raise ValueError("Unknown objective field %s" % objective)
+
+    def tree(self, body):
+        """Single node tree that predicts the most common objective value
+           in the dataset
+
+        """
+        datasets = body.get("datasets", [body.get("dataset")])
+        if not all([dataset in self.server.data for dataset in datasets]):
+            return None
+        field_ids = self.server.data[datasets[0]][0]
+        fields = self.server.resources[datasets[0]]["object"]["fields"]
+        objective = body.get("objective_field")
+        if isinstance(objective, dict):
+            objective = objective.get("id")
+        objective_id = self.objective_id(datasets[0], objective)
+        column = field_ids.index(objective_id)
+        rows = []
+        for dataset in datasets:
+            rows.extend(self.server.data[dataset][1])
+        values = [row[column] if column < len(row) else "" for row in rows]
+        optype = fields[objective_id]["optype"]
+        summary = field_summary(values, optype)
+        total = len(values) - summary["missing_count"]
+        if optype == "numeric":
+            output = summary["mean"]
+            confidence = 0.0
+            objective_summary = {"counts": summary["counts"]}
+        else:
+            output, count = (summary["categories"][0] if
+                             summary["categories"] else (None, 0))
+            confidence = count / float(total) if total else 0.0
+            objective_summary = {"categories": summary["categories"]}
+        input_fields = body.get("input_fields") or [
+            field_id for field_id in field_ids
+            if field_id != objective_id and
+            field_id not in body.get("excluded_fields", [])]
+        model_fields = dict([(field_id, fields[field_id]) for field_id in
+                             input_fields + [objective_id]])
+        root = {"id": 0, "count": total, "output": output,
+                "confidence": confidence, "impurity": 0.0,
+                "objective_summary": objective_summary, "predicate": True,
+                "children": []}
+        return {
+            "name": "mock model",
+            "dataset": datasets[0],
+            "datasets": datasets,
+            "rows": len(rows),
+            "objective_field": objective_id,
+            "objective_fields": [objective_id],
+            "input_fields": input_fields,
+            "fields_meta": {"count": len(model_fields), "limit": -1,
+                            "offset": 0, "total": len(model_fields)},
+            "model": {
+                "root": root,
+                "fields": model_fields,
+                "model_fields": model_fields,
+                "distribution": {"training": objective_summary,
+                                 "predictions": objective_summary},
+                "importance": [[field_id, 0.0] for field_id in
+                               input_fields],
+                "depth_threshold": 512,
+                "kind": "mtree",
+                "missing_tokens": MISSING_TOKENS,
+                "split_criterion": "information_gain_mix",
+                "support_threshold": 0}}
+
+    def create_model(self, resource_type, body):
+        """Model from one or several datasets"""
+        contents = self.tree(body)
+        if contents is None:
+            return None
+        contents.update(body)
+        contents["objective_field"] = contents["objective_fields"][0]
+        return self.server.new_resource("model", contents)
+
+    def create_ensemble(self, resource_type, body):
+        """Ensemble and its component models"""
+        models = []
+        for _ in range(int(body.get("number_of_models", 10))):
+            model = self.create_model("model", dict(body))
+            if model is None:
+                return None
+            models.append(model)
+        contents = {
+            "name": "mock ensemble",
+            "models": [model["resource"] for model in models],
+            "number_of_models": len(models),
+            "distributions": [model["model"]["distribution"] for model in
+                              models],
+            "objective_field": models[0]["objective_field"]}
+        contents.update(body)
+        contents["models"] = [model["resource"] for model in models]
+        return self.server.new_resource("ensemble", contents)
+
+    def predictor(self, body):
+        """Model used to predict: the model or the first ensemble model"""
+        if "ensemble" in body:
+            ensemble = self.server.resources[body["ensemble"]]["object"]
+            return self.server.resources[ensemble["models"][0]]["object"]
+        return self.server.resources[body["model"]]["object"]
+
+    def create_prediction(self, resource_type, body):
+        """Prediction for the input data"""
+        model = self.predictor(body)
+        objective_id = model["objective_field"]
+        root = model["model"]["root"]
+        contents = {
+            "name": "mock prediction",
+            "prediction": {objective_id: root["output"]},
+            "output": root["output"],
+            "confidence": root["confidence"],
+            "objective_field": objective_id,
+            "objective_fields": [objective_id],
+            "fields": {objective_id:
+                       model["model"]["fields"][objective_id]},
+            "input_data": body.get("input_data", {})}
+        contents.update(body)
+        return self.server.new_resource("prediction", contents,
+                                        synchronous=True)
+
+    def create_batchprediction(self, resource_type, body):
+        """Batch prediction for the rows of a dataset"""
+        if body.get("dataset") not in self.server.data:
+            return None
+        self.predictor(body)
+        contents = {"name": "mock batch prediction"}
+        contents.update(body)
+        return self.server.new_resource("batchprediction", contents)
+
+    def create_evaluation(self, resource_type, body):
+        """Evaluation of the most common value predictions"""
+        if body.get("dataset") not in self.server.data:
+            return None
+        model = self.predictor(body)
+        objective_id = model["objective_field"]
+        field_ids, rows = self.server.data[body["dataset"]]
+        column = field_ids.index(objective_id)
+        actual = [row[column] if column < len(row) else "" for row in rows]
+        output = model["model"]["root"]["output"]
+        if model["model"]["fields"][objective_id]["optype"] == "numeric":
+            actual = [to_number(value) for value in actual]
+            result = regression_metrics(actual, [output] * len(actual))
+            random_result = regression_metrics(
+                actual, [self.server.random.choice(actual) for _ in actual])
+        else:
+            categories = [category for category, _ in
+                          model["model"]["distribution"]["training"][
+                              "categories"]]
+            result = classification_metrics(actual, [output] * len(actual),
+                                            categories)
+            random_result = classification_metrics(
+                actual, [categories[index % len(categories)] for index in
+                         range(len(actual))], categories)
+        contents = {"name": "mock evaluation",
+                    "result": {"model": result, "mode": result,
+                               "random": random_result}}
+        contents.update(body)
+        return self.server.new_resource("evaluation", contents)
+
+    def download(self, batch_prediction):
+        """CSV file of a batch prediction"""
+        model = self.predictor(batch_prediction)
+        objective_id = model["objective_field"]
+        root = model["model"]["root"]
+        field_ids, rows = self.server.data[batch_prediction["dataset"]]
+        output = StringIO.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        name = batch_prediction.get(
+            "prediction_name", model["model"]["fields"][objective_id]["name"])
+        all_fields = batch_prediction.get("all_fields", False)
+        confidence = batch_prediction.get("confidence", False)
+        if batch_prediction.get("header", True):
+            headers = ([self.server.resources[batch_prediction["dataset"]][
+                "object"]["fields"][field_id]["name"]
+                        for field_id in field_ids] if all_fields else [])
+            headers.append(name)
+            if confidence:
+                headers.append(batch_prediction.get("confidence_name",
+                                                    "confidence"))
+            writer.writerow(headers)
+        for row in rows:
+            output_row = list(row) if all_fields else []
+            output_row.append(root["output"])
+            if confidence:
+                output_row.append(root["confidence"])
+            writer.writerow(output_row)
+        return output.getvalue()
+
+
+class MockBigML(object):
+    """Runs the mock server in a background thread
+
+    """
+
+    def __init__(self, port=0, **settings):
+        self.server = MockBigMLServer(("localhost", port), **settings)
+        self.thread = None
+
+    @property
+    def domain(self):
+        """Domain to be used in BIGML_DOMAIN"""
+        return "localhost:%s" % self.server.server_address[1]
+
+    def environ(self, username="mock", api_key="mock"):
+        """Environment variables to run bigmler against the server"""
+        # certificate verification only changes the handler used in
+        # uploads: the streaming one that also handles http
+        return {"BIGML_DOMAIN": self.domain,
+                "BIGML_PROTOCOL": "http",
+                "BIGML_SSL_VERIFY": "1",
+                "BIGML_PREDICTION_DOMAIN": self.domain,
+                "BIGML_PREDICTION_PROTOCOL": "http",
+                "BIGML_PREDICTION_SSL_VERIFY": "1",
+                "BIGML_USERNAME": username,
+                "BIGML_API_KEY": api_key}
+
+    def start(self):
+        """Starts serving"""
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def main():
+    """Runs the server until interrupted"""
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the BigML API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--job-duration", type=float, default=0)
+    parser.add_argument("--queue-time", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--canned-model",
+                        help="JSON file merged into the created models")
+    args = parser.parse_args()
+    canned = {}
+    if args.canned_model:
+        with open(args.canned_model) as canned_file:
+            model = json.load(canned_file)
+        canned["model"] = model.get("object", model)
+    server = MockBigMLServer(
+        ("localhost", args.port), latency=args.latency,
+        job_duration=args.job_duration, queue_time=args.queue_time,
+        failure_rate=args.failure_rate, rate_limit=args.rate_limit,
+        seed=args.seed, canned=canned)
+    print "Serving the BigML API mock at localhost:%s" % args.port
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+""" Testing bigmler against the local stand-in for the BigML API
+
+"""
+from __future__ import absolute_import
+
+import os
+import csv
+import gzip
+import time
+import random
+import shutil
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from subprocess import call, CalledProcessError
+
+from bigmler.tests.mock_server import MockBigML
+from bigmler.utils import log_created_resources
+from bigmler.checkpoint import are_models_created
+from bigmler.journal import JOURNAL
+from bigmler.scheduler import CONCURRENCY_LOG
+from bigmler.writers import PROGRESS_SUFFIX
+from bigmler.compression import MIN_COMPRESS_SIZE
+
+
+MOCK = {"server": None}
+
+
+def setup_module():
+    """Starts the mock server
+
+    """
+    MOCK["server"] = MockBigML(job_duration=0.5, rate_limit=2).start()
+
+
+def teardown_module():
+    """Stops the mock server
+
+    """
+    MOCK["server"].stop()
+
+
+def run_bigmler(arguments, check=True, username="mock"):
+    """Runs bigmler against the mock server and returns its exit code.
+       Unless `check` is False, failing runs raise an error.
+
+    """
+    environ = dict(os.environ)
+    environ.update(MOCK["server"].environ(username=username))
+    command = "bigmler %s" % arguments
+    code = call(command, shell=True, env=environ)
+    if check and code:
+        raise CalledProcessError(code, command)
+    return code
+
+
+def read_ids(file_name):
+    """Resource ids in a checkpoint file
+
+    """
+    with open(file_name) as ids_file:
+        return [line.strip() for line in ids_file
+                if line.strip() and not line.startswith("#")]
+
+
+def stored_name(directory, resource_id):
+    """Name of the resource stored in the directory by --store
+
+    """
+    with open(os.path.join(directory,
+                           resource_id.replace("/", "_"))) as resource_file:
+        return json.load(resource_file)["object"]["name"]
+
+
+def count_lines(file_name):
+    """Number of lines in a file
+
+    """
+    with open(file_name) as lines_file:
+        return len(lines_file.readlines())
+
+
+class TestMockServer(object):
+
+    def setup(self):
+        """
+            Debug information
+        """
+        print "\n-------------------\nTests in: %s\n" % __name__
+        self.output_dir = None
+
+    def teardown(self):
+        """Removing the output directory
+
+        """
+        print "\nEnd of tests in: %s\n-------------------\n" % __name__
+        if self.output_dir is not None and os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+
+    def test_scenario1(self):
+        """
+            Scenario: Successfully building local predictions from a model in the mock server:
+                Given I create resources uploading train "<data>" file to test "<test>" in "<output_dir>"
+                Then the predictions file has as many lines as test rows
+                And one source, one dataset and one model have been created
+
+                Examples:
+                | data             | test                  | output_dir       |
+                | ../data/iris.csv | ../data/test_iris.csv | ./scenario_mk_1  |
+        """
+        print self.test_scenario1.__doc__
+        self.output_dir = "scenario_mk_1"
+        stats = MOCK["server"].server.stats
+        created = dict([(key, stats.get("POST %s" % key, 0))
+                        for key in ["source", "dataset", "model"]])
+        run_bigmler("--train data/iris.csv --test data/test_iris.csv"
+                    " --output-dir %s" % self.output_dir)
+        assert (count_lines(os.path.join(self.output_dir,
+                                         "predictions.csv")) ==
+                count_lines("data/test_iris.csv") - 1)
+        for resource_type, count in created.items():
+            assert stats["POST %s" % resource_type] == count + 1
+
+    def test_scenario2(self):
+        """
+            Scenario: Successfully cross-validating several models under the rate limit:
+                Given I create <evaluations> models from train "<data>" file and cross-validate them in "<output_dir>"
+                Then the cross-validation file is created
+                And the concurrency has been lowered when the rate limit was exceeded
+                And each evaluation has been created once
+
+                Examples:
+                | data             | evaluations | output_dir      |
+                | ../data/iris.csv | 6           | ./scenario_mk_2 |
+        """
+        print self.test_scenario2.__doc__
+        self.output_dir = "scenario_mk_2"
+        server = MOCK["server"].server
+        evaluations = len([resource_id for resource_id in server.resources
+                           if resource_id.startswith("evaluation/")])
+        run_bigmler("--train data/iris.csv --cross-validation-rate 0.1"
+                    " --number-of-evaluations 6 --adaptive-parallel"
+                    " --max-parallel-models 6 --max-parallel-evaluations 6"
+                    " --output-dir %s" % self.output_dir)
+        assert os.path.exists(os.path.join(self.output_dir,
+                                           "cross_validation.json"))
+        limits = {}
+        lowered = False
+        with open(os.path.join(self.output_dir, CONCURRENCY_LOG)) as \
+                concurrency_file:
+            for row in csv.DictReader(concurrency_file):
+                limit = int(row["limit"])
+                if limit < limits.get(row["resource_type"], limit):
+                    lowered = True
+                limits[row["resource_type"]] = limit
+        assert lowered
+        evaluation_ids = read_ids(os.path.join(self.output_dir,
+                                               "evaluations"))
+        assert len(set(evaluation_ids)) == len(evaluation_ids) == 6
+        assert len([resource_id for resource_id in server.resources
+                    if resource_id.startswith("evaluation/")]) == \
+            evaluations + 6
+
+    def test_scenario3(self):
+        """
+            Scenario: Successfully resuming a directory with checkpoint files written before the journal:
+                Given I create <models> models from train "<data>" file to test "<test>" in "<output_dir>"
+                And I remove the journal of the output directory
+                When I append a new model to the models checkpoint file
+                Then all the models in the checkpoint file are found
+                And resuming the command creates no new source or ensemble
+
+                Examples:
+                | data             | test                  | models | output_dir      |
+                | ../data/iris.csv | ../data/test_iris.csv | 2      | ./scenario_mk_3 |
+        """
+        print self.test_scenario3.__doc__
+        self.output_dir = "scenario_mk_3"
+        stats = MOCK["server"].server.stats
+        run_bigmler("--train data/iris.csv --test data/test_iris.csv"
+                    " --number-of-models 2 --output-dir %s" %
+                    self.output_dir)
+        os.remove(os.path.join(self.output_dir, JOURNAL))
+        with open(os.path.join(self.output_dir, "models")) as models_file:
+            model_ids = [line.strip() for line in models_file]
+        created = dict((resource_type, stats.get("POST %s" % resource_type))
+                       for resource_type in ["source", "ensemble"])
+        run_bigmler("--resume")
+        for resource_type, count in created.items():
+            assert stats.get("POST %s" % resource_type) == count
+        new_model_id = "model/%s" % ("f" * 24)
+        log_created_resources("models", self.output_dir, new_model_id,
+                              mode="a")
+        assert (are_models_created(self.output_dir, 3) ==
+                (True, model_ids + [new_model_id]))
+
+    def test_scenario4(self):
+        """
+            Scenario: Successfully uploading a big training file in chunks with the same field types:
+                Given I create a training file of <rows> rows whose second field is not numeric after row <numeric_rows>
+                And I create a dataset uploading it in chunks of <chunk_size> MB in "<output_dir>"
+                Then the training file has been uploaded in several sources with no copies of the file
+                And all the sources have the field types of the first one
+                And the multi-dataset has all the rows
+                And resuming the command creates no sources
+
+                Examples:
+                | rows   | numeric_rows | chunk_size | output_dir      |
+                | 120000 | 100000       | 1          | ./scenario_mk_4 |
+        """
+        print self.test_scenario4.__doc__
+        self.output_dir = "scenario_mk_4"
+        server = MOCK["server"].server
+        os.mkdir(self.output_dir)
+        training_file = os.path.join(self.output_dir, "training.csv")
+        with open(training_file, "w") as training:
+            training.write("a,b,c\n")
+            for row in range(120000):
+                training.write("%s,%s,%s\n" % (
+                    row * 0.5, row % 7 if row < 100000 else "x",
+                    "xyz"[row % 3]))
+        created_sources = server.stats.get("POST source", 0)
+        run_bigmler("--train %s --upload-chunk-size 1 --no-model"
+                    " --output-dir %s" % (training_file, self.output_dir))
+        assert os.listdir(self.output_dir).count("training.csv") == 1
+        assert not [file_name for file_name in os.listdir(self.output_dir)
+                    if file_name.startswith("chunk")
+                    and file_name != "chunks_manifest"]
+        source_ids = []
+        index = 0
+        while os.path.exists(os.path.join(self.output_dir,
+                                          "source_file%s" % index)):
+            with open(os.path.join(self.output_dir,
+                                   "source_file%s" % index)) as source_file:
+                source_ids.append(source_file.readline().strip())
+            index += 1
+        assert len(source_ids) > 1
+        assert server.stats["POST source"] == created_sources + len(source_ids)
+        types = [dict((field_id, field["optype"]) for field_id, field in
+                      server.resources[source_id]["object"]["fields"].items())
+                 for source_id in source_ids]
+        assert all(source_types == types[0] for source_types in types)
+        with open(os.path.join(self.output_dir, "dataset_multi")) as \
+                dataset_file:
+            dataset_id = dataset_file.readline().strip()
+        assert server.resources[dataset_id]["object"]["rows"] == 120000
+        run_bigmler("--resume")
+        assert server.stats["POST source"] == created_sources + len(source_ids)
+
+    def test_scenario5(self):
+        """
+            Scenario: Successfully reusing cached remote predictions and resources:
+                Given I create remote predictions from train "<data>" file to test "<test>" caching them in "<output_dir>"
+                When I create remote predictions with the same model and test file
+                Then no new predictions are created and the predictions are the same
+                And the cached predictions are not used by other accounts
+                And the model is served from the resource cache while unchanged
+                And the model is not served from the cache to other accounts
+                And the model is retrieved again once updated
+
+                Examples:
+                | data             | test                  | output_dir      |
+                | ../data/iris.csv | ../data/test_iris.csv | ./scenario_mk_5 |
+        """
+        print self.test_scenario5.__doc__
+        self.output_dir = "scenario_mk_5"
+        server = MOCK["server"].server
+        rate_limit, server.rate_limit = server.rate_limit, 0
+        try:
+            predictions_cache = os.path.join(self.output_dir, "predictions")
+            resources_cache = os.path.join(self.output_dir, "resources")
+            first, second = [os.path.join(self.output_dir, directory)
+                             for directory in ["first", "second"]]
+            run_bigmler("--train data/iris.csv --test data/test_iris.csv"
+                        " --remote --no-batch --prediction-cache %s"
+                        " --output-dir %s" % (predictions_cache, first))
+            model_id = read_ids(os.path.join(first, "models"))[0]
+            created = server.stats["POST prediction"]
+            run_bigmler("--model %s --test data/test_iris.csv --remote"
+                        " --no-batch --prediction-cache %s --output-dir %s" %
+                        (model_id, predictions_cache, second))
+            assert server.stats["POST prediction"] == created
+            with open(os.path.join(first, "predictions.csv")) as first_file:
+                with open(os.path.join(second, "predictions.csv")) as \
+                        second_file:
+                    assert first_file.read() == second_file.read()
+            run_bigmler("--model %s --test data/test_iris.csv --remote"
+                        " --no-batch --prediction-cache %s --output-dir %s" %
+                        (model_id, predictions_cache,
+                         os.path.join(self.output_dir, "other")),
+                        username="other")
+            assert server.stats["POST prediction"] == \
+                created + count_lines("data/test_iris.csv") - 1
+
+            model = server.resources[model_id]["object"]
+            names = []
+            for step, username in enumerate(["mock", "mock", "other",
+                                             "mock"]):
+                if step == 1:
+                    model["name"] = "renamed"
+                elif step == 3:
+                    model["updated"] = "2030-01-01T00:00:00.000000"
+                output_dir = os.path.join(self.output_dir, "step%s" % step)
+                run_bigmler("--model %s --test data/test_iris.csv"
+                            " --resource-cache %s --store --output-dir %s" %
+                            (model_id, resources_cache, output_dir),
+                            username=username)
+                names.append(stored_name(output_dir, model_id))
+            assert names[1] == names[0] != "renamed"
+            assert names[2] == names[3] == "renamed"
+        finally:
+            server.rate_limit = rate_limit
+
+    def test_scenario6(self):
+        """
+            Scenario: Successfully resuming from the journal when the checkpoint files are incomplete:
+                Given I create <models> models from train "<data>" file to test "<test>" in "<output_dir>"
+                And I remove all but the first model from the models checkpoint file
+                And I remove the ensembles checkpoint file
+                And I append a partially written event to the journal
+                When I resume the command
+                Then no new source or ensemble is created
+                And all the models are found
+
+                Examples:
+                | data             | test                  | models | output_dir      |
+                | ../data/iris.csv | ../data/test_iris.csv | 2      | ./scenario_mk_6 |
+        """
+        print self.test_scenario6.__doc__
+        self.output_dir = "scenario_mk_6"
+        stats = MOCK["server"].server.stats
+        run_bigmler("--train data/iris.csv --test data/test_iris.csv"
+                    " --number-of-models 2 --output-dir %s" %
+                    self.output_dir)
+        models_file = os.path.join(self.output_dir, "models")
+        model_ids = read_ids(models_file)
+        with open(models_file, "w") as models:
+            models.write("%s\n" % model_ids[0])
+        os.remove(os.path.join(self.output_dir, "ensembles"))
+        with open(os.path.join(self.output_dir, JOURNAL), "a") as journal:
+            journal.write('{"event": "crea')
+        created = dict((resource_type, stats.get("POST %s" % resource_type))
+                       for resource_type in ["source", "ensemble"])
+        run_bigmler("--resume")
+        for resource_type, count in created.items():
+            assert stats.get("POST %s" % resource_type) == count
+        assert are_models_created(self.output_dir, 2) == (True, model_ids)
+
+    def test_scenario7(self):
+        """
+            Scenario: Successfully resuming interrupted remote predictions from the last committed row:
+                Given I create a model from train "<data>" file in "<output_dir>"
+                And I create remote predictions for test "<test>" that are interrupted by the rate limit
+                Then the progress of the predictions files is committed
+                When I resume the command with no rate limit
+                Then only the predictions after the committed rows are created
+                And the predictions file has as many lines as test rows
+                And resuming the command again creates no predictions
+
+                Examples:
+                | data             | test                  | output_dir      |
+                | ../data/iris.csv | ../data/test_iris.csv | ./scenario_mk_7 |
+        """
+        print self.test_scenario7.__doc__
+        self.output_dir = "scenario_mk_7"
+        server = MOCK["server"].server
+        rate_limit = server.rate_limit
+        predictions_dir = os.path.join(self.output_dir, "predictions")
+        try:
+            run_bigmler("--train data/iris.csv --no-test --output-dir %s" %
+                        os.path.join(self.output_dir, "model"))
+            model_id = read_ids(os.path.join(self.output_dir, "model",
+                                             "models"))[0]
+            # the rate limit allows two predictions per second
+            server.rate_limit = 2
+            time.sleep(1.1)
+            assert run_bigmler("--model %s --test data/test_iris.csv"
+                               " --remote --no-batch --output-dir %s" %
+                               (model_id, predictions_dir), check=False)
+            progress_files = [file_name for file_name in
+                              os.listdir(predictions_dir)
+                              if file_name.endswith(PROGRESS_SUFFIX)]
+            assert progress_files
+            with open(os.path.join(predictions_dir,
+                                   progress_files[0])) as progress_file:
+                committed = json.load(progress_file)["rows"]
+            assert committed > 0
+            server.rate_limit = 0
+            created = server.stats["POST prediction"]
+            run_bigmler("--resume")
+            tests = count_lines("data/test_iris.csv") - 1
+            assert server.stats["POST prediction"] == \
+                created + tests - committed
+            assert count_lines(os.path.join(predictions_dir,
+                                            "predictions.csv")) == tests
+            created = server.stats["POST prediction"]
+            run_bigmler("--resume")
+            assert server.stats["POST prediction"] == created
+            assert count_lines(os.path.join(predictions_dir,
+                                            "predictions.csv")) == tests
+        finally:
+            server.rate_limit = rate_limit
+
+    def test_scenario8(self):
+        """
+            Scenario: Successfully deleting the resources of a directory whose checkpoint files are incomplete:
+                Given I create a model from train "<data>" file in "<output_dir>"
+                And I create <models> models from train "<data>" file in "<output_dir>"
+                And I replace its models checkpoint file by one with the first model id only
+                When I delete the resources in the <models> models directory
+                Then the models in the sessions store are deleted
+                And the models in the checkpoint files are deleted
+
+                Examples:
+                | data             | models | output_dir      |
+                | ../data/iris.csv | 2      | ./scenario_mk_8 |
+        """
+        print self.test_scenario8.__doc__
+        self.output_dir = "scenario_mk_8"
+        server = MOCK["server"].server
+        first, second = [os.path.join(self.output_dir, directory)
+                         for directory in ["first", "second"]]
+        run_bigmler("--train data/iris.csv --no-test --output-dir %s" % first)
+        run_bigmler("--train data/iris.csv --number-of-models 2 --no-test"
+                    " --output-dir %s" % second)
+        # models logged only in the store or only in the checkpoint files
+        model_ids = read_ids(os.path.join(second, "models"))
+        first_model_id = read_ids(os.path.join(first, "models"))[0]
+        with open(os.path.join(second, "models"), "w") as models_file:
+            models_file.write("%s\n" % first_model_id)
+        run_bigmler("delete --from-dir %s --output-dir %s" %
+                    (second, os.path.join(self.output_dir, "delete")))
+        for model_id in model_ids + [first_model_id]:
+            assert model_id not in server.resources
+
+    def test_scenario9(self):
+        """
+            Scenario: Successfully resuming the last command in the text logs when the sessions store misses it:
+                Given I create a dataset from train "<data>" file in "<output_dir>"
+                And I log a command to create a dataset in another directory only in the text logs
+                When I resume the last command
+                Then the dataset is created in the other directory
+
+                Examples:
+                | data             | output_dir      |
+                | ../data/iris.csv | ./scenario_mk_9 |
+        """
+        print self.test_scenario9.__doc__
+        self.output_dir = "scenario_mk_9"
+        stats = MOCK["server"].server.stats
+        first, second = [os.path.join(self.output_dir, directory)
+                         for directory in ["first", "second"]]
+        run_bigmler("--train data/iris.csv --no-model --output-dir %s" %
+                    first)
+        # lines written by versions with no sessions store
+        with open(".bigmler", "a") as command_log:
+            command_log.write("bigmler main --train data/iris.csv"
+                              " --no-model --output-dir %s\n" % second)
+        with open(".bigmler_dir_stack", "a") as dirs_log:
+            dirs_log.write("%s\n" % os.path.abspath(second))
+        created = stats["POST dataset"]
+        run_bigmler("--resume")
+        assert stats["POST dataset"] == created + 1
+        assert read_ids(os.path.join(second, "dataset"))
+
+    def test_scenario10(self):
+        """
+            Scenario: Successfully uploading pruned and compressed training files:
+                Given I create a training file bigger than the min size of compressed uploads from "<data>"
+                When I create a model from the training file uploading only the "<model_fields>" and a sample of rate <rate> and seed "<seed>"
+                Then the uploaded file has the model fields and the objective field
+                And the uploaded rows are the sampled rows
+                And the same sample is uploaded when creating the model again
+                And resuming the command uploads the pruned file again
+                And the training file is uploaded compressed when using --compress-uploads
+
+                Examples:
+                | data             | model_fields                | rate | seed | output_dir       |
+                | ../data/iris.csv | petal length,petal width    | 0.3  | mock | ./scenario_mk_10 |
+        """
+        print self.test_scenario10.__doc__
+        self.output_dir = "scenario_mk_10"
+        server = MOCK["server"].server
+        first, second, third = [os.path.join(self.output_dir, directory)
+                                for directory in ["first", "second",
+                                                  "third"]]
+        os.makedirs(self.output_dir)
+        training_file = os.path.join(self.output_dir, "big.csv")
+        with open("data/iris.csv") as iris_file:
+            headers = iris_file.readline()
+            rows = iris_file.read()
+        with open(training_file, "w") as big_file:
+            big_file.write(headers)
+            while big_file.tell() < MIN_COMPRESS_SIZE:
+                big_file.write(rows)
+        with open(training_file) as big_file:
+            training_rows = list(csv.reader(big_file))[1:]
+        sampler = random.Random("mock")
+        sample = [[row[2], row[3], row[4]] for row in training_rows
+                  if sampler.random() < 0.3]
+        command = ("--train %s --prune-upload --model-fields"
+                   " \"petal length,petal width\" --sample-rate 0.3"
+                   " --seed mock --output-dir %%s" % training_file)
+        uploaded = []
+        for output_dir in [first, second]:
+            run_bigmler(command % output_dir)
+            source_id = read_ids(os.path.join(output_dir, "source"))[0]
+            source = server.resources[source_id]["object"]
+            assert source["file_name"] == "pruned_big.csv.gz"
+            assert sorted([(field["column_number"], field["name"]) for
+                           field in source["fields"].values()]) == \
+                [(0, "petal length"), (1, "petal width"), (2, "species")]
+            uploaded.append(server.data[source_id][1])
+        assert uploaded[0] == uploaded[1] == sample
+
+        # an interrupted run left the pruned file but created no resources
+        pruned_file = os.path.join(second, "pruned_big.csv.gz")
+        with gzip.open(pruned_file, "wb") as pruned:
+            pruned.write("petal length,petal width,species\n")
+            pruned.write("".join(["%s\n" % ",".join(row)
+                                  for row in sample[0: 3]]))
+        for file_name in ["source", "dataset", "models", JOURNAL]:
+            os.remove(os.path.join(second, file_name))
+        run_bigmler("--resume")
+        source_id = read_ids(os.path.join(second, "source"))[0]
+        assert server.data[source_id][1] == sample[0: 3]
+
+        run_bigmler("--train %s --compress-uploads --no-model"
+                    " --output-dir %s" % (training_file, third))
+        source_id = read_ids(os.path.join(third, "source"))[0]
+        file_name = server.resources[source_id]["object"]["file_name"]
+        assert file_name.startswith("big.csv_") and \
+            file_name.endswith(".gz")
+        assert server.data[source_id][1] == training_rows
+        assert not [name for name in os.listdir(third)
+                    if name.endswith(".gz")]
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+""" Testing the test data reader
+
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.skip import SkipTest
+
+from bigml.fields import Fields
+
+from bigmler.tst_reader import TstReader, NUMPY, MISSING_CODE
+from bigmler.line_index import INDEX_MIN_SIZE, INDEX_SUFFIX, line_offset
+
+
+FIELDS = {
+    "000000": {"name": "a", "optype": "numeric", "column_number": 0},
+    "000001": {"name": "b", "optype": "categorical", "column_number": 1,
+               "summary": {"categories": [["x", 3], ["y", 2]]}},
+    "000002": {"name": "c", "optype": "text", "column_number": 2},
+    "000003": {"name": "d", "optype": "categorical", "column_number": 3,
+               "summary": {"categories": [["yes", 3], ["no", 2]]}}}
+OBJECTIVE_ID = "000003"
+
+
+def create_reader(file_name, rows, headers="a,b,c,d"):
+    """Writes the headers and rows to the test file and returns its reader
+
+    """
+    with open(file_name, "w") as test_file:
+        if headers is not None:
+            test_file.write("%s\n" % headers)
+        for row in rows:
+            test_file.write("%s\n" % row)
+    return TstReader(file_name, headers is not None, Fields(FIELDS),
+                     OBJECTIVE_ID)
+
+
+def paired_input_data(reader, row):
+    """Input data built as the reader did before compiling the conversion:
+       removing the excluded columns and pairing the row with the fields
+
+    """
+    new_row = row[:]
+    for index in reader.exclude:
+        del new_row[index]
+    return Fields(FIELDS).pair(new_row, reader.headers,
+                               reader.objective_field)
+
+
+def zipped_input_data(reader, row):
+    """Input data for the local models as built before compiling the
+       conversion: zipping the raw headers and the row. Missing values,
+       unknown fields and the objective field are removed and numeric
+       values are cast, as the models do.
+
+    """
+    fields = Fields(FIELDS)
+    input_data = {}
+    for key, value in zip(reader.raw_headers, row):
+        field_id = (fields.fields_by_name.get(key) if reader.has_headers()
+                    else key)
+        if (value in fields.missing_tokens or field_id not in FIELDS or
+                field_id == OBJECTIVE_ID):
+            continue
+        if FIELDS[field_id]["optype"] == "numeric":
+            value = float(value)
+        input_data[key] = value
+    return input_data
+
+
+class TestTstReader(object):
+
+    def setup(self):
+        """
+            Debug information
+        """
+        print "\n-------------------\nTests in: %s\n" % __name__
+        self.output_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.output_dir, "test.csv")
+
+    def teardown(self):
+        """Removing the test data
+
+        """
+        print "\nEnd of tests in: %s\n-------------------\n" % __name__
+        shutil.rmtree(self.output_dir)
+
+    def test_scenario1(self):
+        """
+            Scenario: Successfully reading test data with missing values in column chunks:
+                Given I create a test file with missing values in every field
+                When I read the test file in chunks of <chunk_size> rows
+                Then the missing numeric values are NaN
+                And the missing categories have the missing code
+                And the missing text values are None
+
+                Examples:
+                | chunk_size |
+                | 2          |
+        """
+        print self.test_scenario1.__doc__
+        if not NUMPY:
+            raise SkipTest("numpy is not installed")
+        reader = create_reader(self.test_file,
+                               ["1.5,x,foo,yes", ",y,,no", "NA,,bar,"])
+        chunks = list(reader.chunks(2))
+        reader.close()
+        assert [len(rows) for rows, _ in chunks] == [2, 1]
+        numeric = [value for _, chunk in chunks for value in chunk["a"]]
+        assert numeric[0] == 1.5
+        assert numeric[1] != numeric[1] and numeric[2] != numeric[2]
+        assert [code for _, chunk in chunks for code in chunk["b"]] == \
+            [0, 1, MISSING_CODE]
+        assert [value for _, chunk in chunks for value in chunk["c"]] == \
+            ["foo", None, "bar"]
+
+    def test_scenario2(self):
+        """
+            Scenario: Successfully coding the categories not in the field summary:
+                Given I create a test file with categories not in the field summary
+                When I read the test file in chunks of <chunk_size> rows
+                Then the new categories get the codes after the summary ones
+                And the codes are kept in the following chunks
+
+                Examples:
+                | chunk_size |
+                | 2          |
+        """
+        print self.test_scenario2.__doc__
+        if not NUMPY:
+            raise SkipTest("numpy is not installed")
+        reader = create_reader(self.test_file,
+                               ["1,z,,", "2,x,,", "3,w,,", "4,z,,"])
+        codes = [list(chunk["b"]) for _, chunk in reader.chunks(2)]
+        reader.close()
+        assert codes == [[2, 0], [3, 2]]
+        assert reader.chunker.categories["b"] == \
+            {"x": 0, "y": 1, "z": 2, "w": 3}
+
+    def test_scenario3(self):
+        """
+            Scenario: Successfully reporting numeric values that cannot be cast in column chunks:
+                Given I create a test file with a non numeric value "<value>" in a numeric field
+                When I read the test file in chunks
+                Then a mismatch error is raised for the field
+
+                Examples:
+                | value |
+                | abc   |
+        """
+        print self.test_scenario3.__doc__
+        if not NUMPY:
+            raise SkipTest("numpy is not installed")
+        reader = create_reader(self.test_file, ["1,x,,", "abc,y,,"])
+        try:
+            list(reader.chunks(10))
+            assert False, "Mismatch not detected"
+        except ValueError, exc:
+            assert "Mismatch input data type in field \"a\"" in str(exc)
+        finally:
+            reader.close()
+
+    def test_scenario4(self):
+        """
+            Scenario: Successfully converting test rows as pairing them with the fields:
+                Given I create a test file with headers "<headers>" and rows "<rows>"
+                When I read the test file
+                Then the input data is the one built by pairing the rows with the fields
+                And the input data for local models is the one built by zipping the rows with the headers
+
+                Examples:
+                | headers   | rows                                  |
+                | a,b,c,d   | 1.5,x,foo,yes / NA,y,,no / 2,z,bar,   |
+                | a,e,b,c   | 1.5,0,x,foo / 3,1,,bar                |
+                | b,a       | x,1.5 / ,3                            |
+                | None      | 1.5,x,foo,yes / NA,y,,no              |
+                | None      | 1.5,x,foo / 3,,bar                    |
+        """
+        print self.test_scenario4.__doc__
+        examples = [
+            ["a,b,c,d", ["1.5,x,foo,yes", "NA,y,,no", "2,z,bar,"]],
+            ["a,e,b,c", ["1.5,0,x,foo", "3,1,,bar"]],
+            ["b,a", ["x,1.5", ",3"]],
+            [None, ["1.5,x,foo,yes", "NA,y,,no"]],
+            [None, ["1.5,x,foo", "3,,bar"]]]
+        for headers, rows in examples:
+            print "Headers: %s, rows: %s" % (headers, rows)
+            reader = create_reader(self.test_file, rows, headers=headers)
+            for row in reader:
+                assert reader.dict(row) == paired_input_data(reader, row)
+                assert (reader.model_input_data(row) ==
+                        zipped_input_data(reader, row))
+            reader.close()
+
+    def test_scenario5(self):
+        """
+            Scenario: Successfully reporting test rows shorter than the headers:
+                Given I create a test file with headers "<headers>" and rows "<rows>"
+                When I read the test file
+                Then the short row raises an error as pairing it with the fields does
+                And the input data for local models is the one built by zipping the rows with the headers
+
+                Examples:
+                | headers | rows                    |
+                | a,b,c,d | 1.5,x,foo,yes / 2,y,bar |
+                | a,b,c,e | 1.5,x,foo,0 / 2,y       |
+                | None    | 1.5,x,foo / 2,y         |
+        """
+        print self.test_scenario5.__doc__
+        examples = [
+            ["a,b,c,d", ["1.5,x,foo,yes", "2,y,bar"]],
+            ["a,b,c,e", ["1.5,x,foo,0", "2,y"]],
+            [None, ["1.5,x,foo", "2,y"]]]
+        for headers, rows in examples:
+            print "Headers: %s, rows: %s" % (headers, rows)
+            reader = create_reader(self.test_file, rows, headers=headers)
+            reader.dict(reader.next())
+            short_row = reader.next()
+            try:
+                paired_input_data(reader, short_row)
+                assert False, "Short row not detected by pairing"
+            except IndexError:
+                pass
+            try:
+                reader.dict(short_row)
+                assert False, "Short row not detected"
+            except IndexError:
+                pass
+            assert (reader.model_input_data(short_row) ==
+                    zipped_input_data(reader, short_row))
+            reader.close()
+
+    def test_scenario6(self):
+        """
+            Scenario: Successfully counting the rows of a big test file:
+                Given I create a test file bigger than the minimum size of the line indexes
+                When I count the test rows
+                Then the number of test rows is right
+                And the line index of the file is stored
+                And lines can be reached from their indexed offsets
+                And the test rows are counted again when the file changes
+
+                Examples:
+                | row           |
+                | 1.5,x,foo,yes |
+        """
+        print self.test_scenario6.__doc__
+        row = "1.5,x,foo,yes\n"
+        rows = INDEX_MIN_SIZE / len(row) + 1
+        with open(self.test_file, "w") as test_file:
+            test_file.write("a,b,c,d\n")
+            test_file.write(row * rows)
+        reader = TstReader(self.test_file, True, Fields(FIELDS),
+                           OBJECTIVE_ID)
+        assert reader.number_of_tests() == rows
+        assert os.path.exists("%s%s" % (self.test_file, INDEX_SUFFIX))
+        line, offset = line_offset(self.test_file, rows)
+        with open(self.test_file) as test_file:
+            test_file.seek(offset)
+            lines = test_file.readlines()
+        assert line > 0 and len(lines) == rows + 1 - line
+        with open(self.test_file, "a") as test_file:
+            test_file.write(row)
+        assert reader.number_of_tests() == rows + 1
+        reader.close()
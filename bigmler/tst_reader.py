@@ -18,12 +18,25 @@
    Manages the test input data, its headers and checks them against the
    model fields data to build the dict input_data.
 
+   The positions, keys and types of the columns used in the input data are
+   resolved only once in a RowConverter, that is applied to every row.
+   The test data can also be read in chunks of column arrays (this needs
+   numpy), to be used by vectorized evaluators.
+
 """
 from __future__ import absolute_import
 
 import sys
 
-from bigml.util import get_csv_delimiter
+from itertools import islice
+
+try:
+    import numpy
+    NUMPY = True
+except ImportError:
+    NUMPY = False
+
+from bigml.util import get_csv_delimiter, map_type, strip_affixes
 from bigml.io import UnicodeReader
 
 from bigmler.utils import PYTHON3, FILE_ENCODING, SYSTEM_ENCODING
@@ -32,6 +45,190 @@ from bigmler.checkpoint import file_number_of_lines
 from bigmler.utf8recoder import UTF8Recoder
 
 
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+CHUNK_SIZE = 1000
+MISSING_CODE = -1
+
+
+def numeric_parser(field):
+    """Returns the function that casts the values of a numeric field as the
+       local models do. Values that cannot be cast are kept, so that the
+       model reports the mismatch.
+
+    """
+    cast_type = map_type(NUMERIC)
+
+    def parse(value):
+        """Strips the field affixes and casts the value"""
+        try:
+            return cast_type(strip_affixes(value, field))
+        except ValueError:
+            return value
+    return parse
+
+
+class RowConverter(object):
+    """Converts rows to input data dicts using a fixed list of columns
+
+    """
+    def __init__(self, columns, missing_tokens, keep_missing=True,
+                 row_length=None):
+        """Compiles the conversion
+
+           `columns`: list of (position in the row, key, field) tuples. Values
+                      of numeric fields are cast if their field is given.
+           `missing_tokens`: values to be considered missing
+           `keep_missing`: True to keep missing values as None in the input
+                           data, False to leave them out
+           `row_length`: minimum number of values in a row. Shorter rows
+                         raise an IndexError. By default, rows must have
+                         all the columns. Using 0, only the columns present
+                         in the row are converted, as zip would do.
+        """
+        self.missing_tokens = set(missing_tokens)
+        self.keep_missing = keep_missing
+        self.columns = sorted([
+            (position, key,
+             numeric_parser(field) if field is not None and
+             field.get('optype') == NUMERIC else None)
+            for position, key, field in columns])
+        if row_length is None:
+            row_length = self.columns[-1][0] + 1 if self.columns else 0
+        self.row_length = row_length
+
+    def check_length(self, row):
+        """Raises an IndexError if the row is shorter than expected and
+           returns its length
+
+        """
+        length = len(row)
+        if length < self.row_length:
+            raise IndexError(u"The row has %s values and at least %s were"
+                             u" expected." % (length, self.row_length))
+        return length
+
+    def values(self, row):
+        """Returns the list of typed values in the order of the columns.
+           Missing values are None.
+
+        """
+        values = []
+        length = self.check_length(row)
+        for position, _, parser in self.columns:
+            if position >= length:
+                break
+            value = row[position]
+            if value in self.missing_tokens:
+                value = None
+            elif parser is not None:
+                value = parser(value)
+            values.append(value)
+        return values
+
+    def convert(self, row):
+        """Returns the input data dict for the row
+
+        """
+        input_data = {}
+        length = self.check_length(row)
+        for position, key, parser in self.columns:
+            if position >= length:
+                break
+            value = row[position]
+            if value in self.missing_tokens:
+                if self.keep_missing:
+                    input_data[key] = None
+            elif parser is not None:
+                input_data[key] = parser(value)
+            else:
+                input_data[key] = value
+        return input_data
+
+
+class ColumnChunker(object):
+    """Converts chunks of rows to arrays of values per column
+
+    """
+    def __init__(self, columns, missing_tokens):
+        """Compiles the conversion
+
+           `columns`: list of (position in the row, key, field) tuples.
+           `missing_tokens`: values to be considered missing
+
+           Numeric columns are stored as float arrays, with NaN for missing
+           values. Categorical columns are stored as integer codes: the
+           position of the category in the field summary, or in order of
+           appearance for categories not in the summary, and MISSING_CODE
+           for missing values. Other columns are stored as object arrays,
+           with None for missing values.
+        """
+        self.missing_tokens = set(missing_tokens)
+        self.columns = []
+        # codes of the categories of each categorical column
+        self.categories = {}
+        for position, key, field in sorted(columns):
+            optype = None if field is None else field.get('optype')
+            if optype == CATEGORICAL:
+                categories = [category for category, _ in
+                              field.get('summary', {}).get('categories', [])]
+                self.categories[key] = dict(
+                    [(category, code) for code, category in
+                     enumerate(categories)])
+            parser = numeric_parser(field) if optype == NUMERIC else None
+            self.columns.append((position, key, optype, parser))
+
+    def numeric_column(self, values, key, parser):
+        """Float array for the values of a numeric column
+
+        """
+        column = []
+        for value in values:
+            if value is None:
+                column.append(numpy.nan)
+            else:
+                number = parser(value)
+                if not isinstance(number, float):
+                    raise ValueError(u"Mismatch input data type in field"
+                                     u" \"%s\" for value %s." % (key, value))
+                column.append(number)
+        return numpy.array(column, dtype=float)
+
+    def categorical_column(self, values, key):
+        """Integer codes array for the values of a categorical column
+
+        """
+        codes = self.categories[key]
+        column = []
+        for value in values:
+            if value is None:
+                column.append(MISSING_CODE)
+            else:
+                code = codes.get(value)
+                if code is None:
+                    code = len(codes)
+                    codes[value] = code
+                column.append(code)
+        return numpy.array(column, dtype=int)
+
+    def chunk(self, rows):
+        """Returns the dict of column arrays for the rows
+
+        """
+        chunk = {}
+        for position, key, optype, parser in self.columns:
+            values = [None if position >= len(row) or
+                      row[position] in self.missing_tokens
+                      else row[position] for row in rows]
+            if optype == NUMERIC:
+                chunk[key] = self.numeric_column(values, key, parser)
+            elif optype == CATEGORICAL:
+                chunk[key] = self.categorical_column(values, key)
+            else:
+                chunk[key] = numpy.array(values, dtype=object)
+        return chunk
+
+
 class TstReader(object):
     """Retrieves csv info and builds a input data dict
 
@@ -78,6 +275,10 @@ class TstReader(object):
         self.headers = None
         self.raw_headers = None
         self.exclude = []
+        # compiled converters for the dict method, by row length
+        self.converters = {}
+        self.model_converter = None
+        self.chunker = None
         if test_set_header:
             self.headers = self.test_reader.next()
             # validate headers against model fields excluding objective_field,
@@ -139,17 +340,94 @@ class TstReader(object):
         """Returns the row in a dict format according to the given headers
 
         """
-        new_row = row[:]
         if not filtering:
             if self.test_set_header:
                 headers = self.raw_headers
             else:
                 headers = [self.fields.fields_by_column_number[column] for
                            column in self.fields.columns]
-            return dict(zip(headers, new_row))
+            return dict(zip(headers, row))
+        # when the file has no headers, the presence of the objective field
+        # is guessed from the row length
+        key = None if self.test_set_header else len(row)
+        converter = self.converters.get(key)
+        if converter is None:
+            converter = self.compile_converter(row)
+            self.converters[key] = converter
+        return converter.convert(row)
+
+    def compile_converter(self, row):
+        """Builds the converter that pairs the values in the row with the
+           fields as `Fields.pair` does
+
+        """
+        new_row = row[:]
         for index in self.exclude:
             del new_row[index]
-        return self.fields.pair(new_row, self.headers, self.objective_field)
+        # pairing one row resolves the headers and the objective field
+        self.fields.pair(new_row, self.headers, self.objective_field)
+        excluded = set(self.exclude)
+        positions = [position for position in range(len(row))
+                     if position not in excluded]
+        columns = [(positions[index], self.fields.headers[index], None)
+                   for index in self.fields.filtered_indexes
+                   if index < len(positions)]
+        # rows missing any of the paired or excluded columns are errors
+        row_length = max([0] + [position + 1 for position, _, _ in columns] +
+                         [index + 1 for index in self.exclude])
+        return RowConverter(columns, self.fields.missing_tokens,
+                            row_length=row_length)
+
+    def model_input_data(self, row):
+        """Returns the input data dict expected by local models, keyed by
+           the raw headers. Numeric values are cast and missing values are
+           left out, as the models would do. Short rows are converted as zip
+           would do.
+
+        """
+        if self.model_converter is None:
+            self.model_converter = RowConverter(
+                self.model_columns(), self.fields.missing_tokens,
+                keep_missing=False, row_length=0)
+        return self.model_converter.convert(row)
+
+    def model_columns(self):
+        """Returns the (position, key, field) tuples of the columns used as
+           input data for the local models, keyed by the raw headers
+
+        """
+        excluded = set(self.exclude)
+        columns = []
+        for position, key in enumerate(self.raw_headers):
+            if position in excluded:
+                continue
+            try:
+                field = self.fields.fields[self.fields.field_id(key)
+                                           if self.test_set_header
+                                           else key]
+            except (KeyError, ValueError):
+                field = None
+            columns.append((position, key, field))
+        return columns
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Yields the remaining rows in chunks of `chunk_size` rows, together
+           with the dict of their column arrays, keyed by the raw headers.
+           The codes used for categorical columns are kept in
+           `self.chunker.categories`.
+
+        """
+        if not NUMPY:
+            sys.exit("Failed to find the numpy library needed to read the"
+                     " test data in column chunks. Please, install it"
+                     " manually")
+        if self.chunker is None:
+            self.chunker = ColumnChunker(self.model_columns(),
+                                         self.fields.missing_tokens)
+        rows = list(islice(self, chunk_size))
+        while rows:
+            yield rows, self.chunker.chunk(rows)
+            rows = list(islice(self, chunk_size))
 
     def number_of_tests(self):
         """Returns the number of tests in the test file
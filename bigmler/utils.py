@@ -36,6 +36,10 @@ from bigml.util import console_log, empty_resource
 from bigml.fields import get_fields_structure, Fields
 from bigml.io import UnicodeReader
 
+from bigmler.journal import get_journal, CREATED
+from bigmler.sessions_db import safe_call
+from bigmler.log_writer import write_log
+
 PYTHON3 = sys.version_info[0] == 3
 PAGE_LENGTH = 200
 ATTRIBUTE_NAMES = ['name', 'label', 'description']
@@ -410,20 +414,23 @@ def log_message(message, log_file=None, console=False):
     if log_file is not None:
         if PYTHON3:
             message = message.encode(FILE_ENCODING)
-        with open(log_file, 'ab', 0) as log_file:
-            log_file.write(message)
+        write_log(log_file, message)
 
 
 def sys_log_message(message, log_file=None):
     """Logs a message in a file using the system encoding
 
-       If log_file is set, logs the message in the file.
+       If log_file is set, logs the message in the file and in the sessions
+       store.
     """
+    if log_file is not None:
+        safe_call("log_lines", log_file,
+                  message if isinstance(message, unicode) else
+                  message.decode(SYSTEM_ENCODING))
     if isinstance(message, unicode):
         message = message.encode(SYSTEM_ENCODING)
     if log_file is not None:
-        with open(log_file, 'ab', 0) as log_file:
-            log_file.write(message)
+        write_log(log_file, message)
 
 
 def plural(text, num):
@@ -449,22 +456,29 @@ def check_resource_error(resource, message):
 
 def log_created_resources(file_name, path, resource_id, mode='w',
                           comment=None):
-    """Logs the created resources ids in the given file
+    """Logs the created resources ids in the given file, in the
+       journal of the directory and in the sessions store
 
     """
     if path is not None:
-        file_name = "%s%s%s" % (path, os.sep, file_name)
+        journal = get_journal(path)
         try:
-            with open(file_name, "%sb" % mode, 0) as resource_file:
-                if resource_id is not None:
-                    message = "%s\n" % resource_id
-                    if PYTHON3 or isinstance(message, unicode):
-                        message = message.encode(SYSTEM_ENCODING)
-                    resource_file.write(message)
-                if comment is not None:
-                    if PYTHON3 or isinstance(comment, unicode):
-                        comment = comment.encode(SYSTEM_ENCODING)
-                    resource_file.write(comment)
+            if journal is not None:
+                journal.record(CREATED, resource_id, file_name=file_name,
+                               mode=mode)
+            safe_call("log_resource", path, file_name, resource_id,
+                      mode=mode)
+            file_name = "%s%s%s" % (path, os.sep, file_name)
+            message = ""
+            if resource_id is not None:
+                message = "%s\n" % resource_id
+                if PYTHON3 or isinstance(message, unicode):
+                    message = message.encode(SYSTEM_ENCODING)
+            if comment is not None:
+                if PYTHON3 or isinstance(comment, unicode):
+                    comment = comment.encode(SYSTEM_ENCODING)
+                message += comment
+            write_log(file_name, message, mode=mode)
         except IOError, exc:
             print "Failed to write %s: %s" % (file_name, str(exc))
 
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""CSV writer for output files that can be resumed row by row
+
+   Every `commit_rows` rows and when the file is closed, the file is
+   flushed (and optionally synced) to disk and the number of rows and the
+   size of the file are stored in a `.progress` sidecar file. When
+   resuming, the file is truncated to the last committed size and the
+   writer goes on from the next row, so the caller only needs to skip the
+   first `committed` rows of its input. Completely written files keep
+   their progress, so that resuming them writes no rows. Runs that don't
+   resume start a new file and remove any previous progress.
+
+"""
+from __future__ import absolute_import
+
+import os
+import csv
+import sys
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from bigmler.line_index import count_lines
+
+
+PY3 = sys.version_info[0] == 3
+COMMIT_ROWS = 100
+PROGRESS_SUFFIX = ".progress"
+
+
+class ResumableWriter(object):
+    """Adapter with the UnicodeWriter interface that commits its progress
+       periodically
+
+    """
+
+    def __init__(self, filename, resume=False, commit_rows=COMMIT_ROWS,
+                 sync=True, expected_rows=None, dialect=csv.excel,
+                 encoding="utf-8", **kwargs):
+        """Constructor method for the writer
+
+           `sync`: False to skip syncing the file to disk in commits
+           `expected_rows`: number of rows of the complete file. When
+                            resuming a file with no progress, it is
+                            considered complete if it has these rows.
+        """
+        self.filename = filename
+        self.progress_file = "%s%s" % (filename, PROGRESS_SUFFIX)
+        self.resume = resume
+        self.commit_rows = commit_rows
+        self.sync = sync
+        self.expected_rows = expected_rows
+        self.dialect = dialect
+        self.encoding = encoding
+        self.kwargs = kwargs
+        self.file_handler = None
+        self.writer = None
+        # rows written and rows known to be stored on disk
+        self.rows = 0
+        self.committed = 0
+
+    def last_commit(self):
+        """Returns the number of rows and size of the file in the last
+           commit, if the file still holds them
+
+        """
+        try:
+            with open(self.progress_file) as progress_file:
+                progress = json.load(progress_file)
+            if progress["offset"] <= os.path.getsize(self.filename):
+                return progress["rows"], progress["offset"]
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        # files completely written before their progress was recorded
+        if self.expected_rows:
+            try:
+                if count_lines(self.filename) == self.expected_rows:
+                    return (self.expected_rows,
+                            os.path.getsize(self.filename))
+            except (IOError, OSError):
+                pass
+        return 0, 0
+
+    def remove_progress(self):
+        """Removing the progress file
+
+        """
+        try:
+            os.remove(self.progress_file)
+        except OSError:
+            pass
+
+    def open_writer(self):
+        """Opening the file, truncated to the last commit when resuming
+
+        """
+        if self.resume:
+            rows, offset = self.last_commit()
+        else:
+            rows, offset = 0, 0
+            self.remove_progress()
+        if PY3:
+            mode = {"encoding": self.encoding, "newline": ""}
+            self.file_handler = open(self.filename, "r+t" if rows else "wt",
+                                     **mode)
+        else:
+            self.file_handler = open(self.filename, "r+b" if rows else "wb")
+        if rows:
+            self.file_handler.seek(offset)
+            self.file_handler.truncate()
+        self.rows = self.committed = rows
+        self.writer = csv.writer(self.file_handler, dialect=self.dialect,
+                                 **self.kwargs)
+        return self
+
+    def commit(self):
+        """Stores the written rows on disk and records the progress
+
+        """
+        self.file_handler.flush()
+        if self.sync:
+            os.fsync(self.file_handler.fileno())
+        progress = {"rows": self.rows, "offset": self.file_handler.tell()}
+        with open("%s.tmp" % self.progress_file, "w") as progress_file:
+            json.dump(progress, progress_file)
+        if os.path.exists(self.progress_file):
+            os.remove(self.progress_file)
+        os.rename("%s.tmp" % self.progress_file, self.progress_file)
+        self.committed = self.rows
+
+    def close_writer(self):
+        """Closing the file after committing the last rows
+
+        """
+        self.commit()
+        self.file_handler.close()
+
+    def __enter__(self):
+        """Opening the file
+
+        """
+        return self.open_writer()
+
+    def __exit__(self, ftype, value, traceback):
+        """Closing on exit
+
+        """
+        self.close_writer()
+
+    def writerow(self, row):
+        """Writer emulating CSV writerow
+
+        """
+        if not PY3:
+            row = [(s if not isinstance(s, basestring) else
+                    s.encode(self.encoding)) for s in row]
+        self.writer.writerow(row)
+        self.rows += 1
+        if self.rows - self.committed >= self.commit_rows:
+            self.commit()
+
+    def writerows(self, rows):
+        """Writer emulating CSV writerows
+
+        """
+        for row in rows:
+            self.writerow(row)
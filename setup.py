@@ -53,6 +53,7 @@ setuptools.setup(
                 'bigmler.options', 'bigmler.delete', 'bigmler.sample',
                 'bigmler.tests', 'bigmler.reify'],
     install_requires = ['bigml>=4.1.7, <4.2.0'],
+    extras_require = {'chunks': ['numpy']},
     package_data={'bigmler':['static/*.json', 'static/*.html']},
     classifiers=[
         'Development Status :: 4 - Beta',